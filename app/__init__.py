@@ -145,6 +145,7 @@ if app.config.get('LOAD_MODELS', True):
     from app.readers import read_vocab, read_cosines
     from app.multilinguality import read_language_codes, read_stopwords
     from sklearn.feature_extraction.text import CountVectorizer
+    from app.api.models import get_tokenizer
 
     LANGUAGE_CODES = read_language_codes()
     for LANG in app.config['LANGS']:
@@ -159,6 +160,7 @@ if app.config.get('LOAD_MODELS', True):
         models[LANG]['logprobs'] = logprobs
         models[LANG]['vectorizer'] = vectorizer
         models[LANG]['nns'] = ftcos
+        get_tokenizer(LANG) # Load the SentencePiece model once, at startup
         if LANG in LANGUAGE_CODES:
             models[LANG]['stopwords'] = read_stopwords(LANGUAGE_CODES[LANG].lower())
         else:
@@ -226,17 +228,13 @@ def reroute_for_maintenance(path):
 dir_path = dirname(realpath(__file__))
 pod_dir = getenv("PODS_DIR", join(dir_path, 'pods'))
 
-if app.config.get('LOAD_MODELS', True) and not app.config.get('LIVE_MATRIX', False):
-    from app.search.score_pages import mk_vec_matrix
-    for LANG in app.config['LANGS']:
-        npzs = glob(join(pod_dir,'*',LANG,'*.u.*npz'))
-        if len(npzs) == 0:
-            continue
-        m, bins, podnames, urls = mk_vec_matrix(LANG)
-        models[LANG]['m'] = m
-        models[LANG]['mbins'] = bins
-        models[LANG]['podnames'] = podnames
-        models[LANG]['urls'] = urls
+if app.config.get('LOAD_MODELS', True):
+    # Map the shared search index snapshot (built by the
+    # first process that needs it) and replay its journal.
+    from app.search.live_index import get_index
+    with app.app_context():
+        for LANG in app.config['LANGS']:
+            get_index(LANG)
 
 
 #######################
@@ -244,27 +242,25 @@ if app.config.get('LOAD_MODELS', True) and not app.config.get('LIVE_MATRIX', Fal
 #######################
 
 import threading
-import numpy as np
 
 # Initialize with empty values so the app can serve requests immediately.
-# A background thread will populate these once the remote instances respond.
-instances = []
-M = np.array([])
+# A background thread fills them from the local instance cache, then
+# refreshes them periodically from the remote instances.
+# Both are {lang: ...} dictionaries: the instances indexing each
+# language of this instance, and the matrix of their signatures.
+instances = {}
+M = {}
 
 if not app.config.get('TESTING'):
-    from app.search.cross_instance_search import filter_instances_by_language
+    from app.search.cross_instance_search import run_instance_discovery
 
-    def _load_remote_instances():
+    def _publish_remote_instances(new_instances, new_M):
         global instances, M
+        instances, M = new_instances, new_M
+
+    def _load_remote_instances():
         with app.app_context():
-            try:
-                instances, M, skipped = filter_instances_by_language()
-                if skipped:
-                    for s in skipped:
-                        logger.warning("Skipped remote instance %s: %s", s['instance'], s['reason'])
-                logger.info("Loaded %d remote instance(s) in background.", len(instances))
-            except Exception as e:
-                logger.error("Failed to load remote instances: %s", e)
+            run_instance_discovery(_publish_remote_instances)
 
     _instance_loader = threading.Thread(target=_load_remote_instances, daemon=True)
     _instance_loader.start()
@@ -279,6 +275,14 @@ if not app.config.get('TESTING'):
                 logger.error("`host_url` and `SITENAME` do not match -- this can cause errors, correct this unless you know what you are doing!")
             _sitename_check_completed = True
 
+    # Indexing jobs are run by worker threads, started with the first
+    # request so that each web worker process gets its own.
+    from app.indexer import job_queue
+
+    @app.before_request
+    def start_index_workers():
+        job_queue.start_workers(app)
+
 
 #######
 # Admin
@@ -288,6 +292,8 @@ from flask_admin.contrib.sqla import ModelView
 from app.api.models import Pods, Urls, User, Personalization, Suggestions, RejectedSuggestions
 from app.utils_db import delete_url_representations, delete_pod_representations, \
         rm_from_npz, add_to_npz, create_pod_in_db, create_pod_npz_pos, rm_doc_from_pos, update_db_idvs_after_npz_delete
+from app.search import live_index
+from app.indexer.job_queue import pod_lock
 
 from flask_admin import expose
 from flask_admin.contrib.sqla.view import ModelView
@@ -388,17 +394,19 @@ class UrlsModelView(ModelView):
                 logger.info("Pod name has changed from %s to %s", old_pod, new_pod)
                 logger.info("Move vector in npz file")
                 try:
-                    pod_path = create_pod_npz_pos(contributor, new_theme, lang)
-                    create_pod_in_db(contributor, new_theme, lang)
-                    idv, v = rm_from_npz(model.vector, old_pod)
-                    update_db_idvs_after_npz_delete(idv, old_pod)
-                    add_to_npz(v, pod_path+'.npz')
-                    #Removing from pos but not re-adding since current version does not make use of positional index. To fix.
-                    rm_doc_from_pos(model.id, old_pod)
-                    self.session.commit()
-                    #If pod empty, delete
-                    if len(db.session.query(Urls).filter_by(pod=old_pod).all()) == 0:
-                        delete_pod_representations(old_pod)
+                    with pod_lock(old_pod, new_pod):
+                        pod_path = create_pod_npz_pos(contributor, new_theme, lang)
+                        create_pod_in_db(contributor, new_theme, lang)
+                        idv, v = rm_from_npz(model.vector, old_pod)
+                        update_db_idvs_after_npz_delete(idv, old_pod)
+                        model.vector = add_to_npz(v, pod_path+'.npz')
+                        #Removing from pos but not re-adding since current version does not make use of positional index. To fix.
+                        rm_doc_from_pos(model.id, old_pod)
+                        self.session.commit()
+                        live_index.index_document(lang, model.url, new_pod, v)
+                        #If pod empty, delete
+                        if len(db.session.query(Urls).filter_by(pod=old_pod).all()) == 0:
+                            delete_pod_representations(old_pod)
 
                 except Exception as ex:
                     if not self.handle_view_exception(ex):
@@ -429,7 +437,8 @@ class PodsModelView(ModelView):
             self.on_model_delete(model)
             logger.info("Deleting %s", model.name)
             # Add your custom logic here and don't forget to commit any changes e.g.
-            delete_pod_representations(model.name)
+            with pod_lock(model.name):
+                delete_pod_representations(model.name)
             self.session.commit()
         except Exception as ex:
             if not self.handle_view_exception(ex):
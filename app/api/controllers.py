@@ -2,10 +2,8 @@
 #
 # SPDX-License-Identifier: AGPL-3.0-only
 
-import json
 from os import getenv
 from os.path import dirname, join, realpath
-import numpy as np
 from flask import current_app
 from flask import Blueprint, jsonify, request, render_template, url_for, abort
 from scipy.sparse import save_npz
@@ -13,9 +11,11 @@ from app.forms import SearchForm
 from app.api.models import Urls
 from app.auth.decorators import check_permissions
 from app.extensions import db
-from app.indexer.vectorizer import scale
-from app.search.controllers import get_local_search_results, prepare_gui_results
-from app.search.score_pages import mk_podsum_matrix
+from app.search.controllers import get_local_search_results, get_local_batch_search_results, prepare_gui_results
+from app.search import result_cache, peer_health
+from app import http_client
+from app.indexer import fetcher
+from app.search.signature import signature_payload, SIGNATURE_MIMETYPE, SIGNATURE_DTYPES
 from app.utils import beautify_pears_content
 
 # Define the blueprint:
@@ -23,6 +23,7 @@ api = Blueprint('api', __name__, url_prefix='/api')
 
 dir_path = dirname(dirname(realpath(__file__)))
 pod_dir = getenv("PODS_DIR", join(dir_path, 'pods'))
+search_batch_size = int(getenv("SEARCH_BATCH_SIZE", "32"))
 
 @api.route('/languages/', methods=["GET", "POST"])
 def return_instance_languages():
@@ -42,11 +43,22 @@ def return_identity_info():
 def return_instance_signature(lang):
     """Returns the signature of this instance for a language.
     For use by other PeARS instances."""
-    _, podsum = mk_podsum_matrix(lang)
-    podsum = np.array(podsum)
-    podsum = scale(podsum) #L2 normalization
-    signature = np.sum(podsum, axis=0)
-    return json.dumps(signature.tolist())
+    if lang not in current_app.config['LANGS']:
+        abort(404)
+    # Peers that do not ask for the compact format get the JSON list
+    mimetype = request.accept_mimetypes.best_match(['application/json', SIGNATURE_MIMETYPE])
+    if mimetype == SIGNATURE_MIMETYPE:
+        fmt = request.args.get('dtype', 'float32')
+        if fmt not in SIGNATURE_DTYPES:
+            abort(400)
+    else:
+        mimetype, fmt = 'application/json', 'json'
+    body, etag = signature_payload(lang, fmt)
+    response = current_app.response_class(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.vary.add('Accept')
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @api.route('/search', methods=["GET"])
 def return_query_results():
@@ -56,6 +68,40 @@ def return_query_results():
     _, results = get_local_search_results(query)
     return jsonify(json_list=results)
 
+@api.route('/search', methods=["POST"])
+def return_batch_query_results():
+    """Returns the results for several queries, sent as
+    {"queries": [...]}, in a json format (one result list per
+    query, in order). At most SEARCH_BATCH_SIZE queries are accepted.
+    For use by other PeARS instances and by tools prewarming the cache."""
+    data = request.get_json(silent=True)
+    queries = data.get('queries') if isinstance(data, dict) else None
+    if not isinstance(queries, list) or not all(isinstance(q, str) and q.strip() for q in queries):
+        abort(400)
+    if len(queries) > search_batch_size:
+        abort(413)
+    answers = get_local_batch_search_results(queries)
+    return jsonify(json_list=[results for _, results in answers])
+
+@api.route('/cache_stats')
+@check_permissions(login=True, confirmed=True, admin=True)
+def return_cache_stats():
+    """Returns the hit/miss counters of the search result cache."""
+    return jsonify(result_cache.stats())
+
+@api.route('/http_stats')
+@check_permissions(login=True, confirmed=True, admin=True)
+def return_http_stats():
+    """Returns the outbound request and connection reuse counters of this worker,
+    and the time spent in each stage of page indexing."""
+    return jsonify(http_client.stats() | {'stages': fetcher.stage_stats()})
+
+@api.route('/peer_stats')
+@check_permissions(login=True, confirmed=True, admin=True)
+def return_peer_stats():
+    """Returns the circuit breaker state and average latency of remote instances."""
+    return jsonify(peer_health.stats())
+
 @api.route('/urls/')
 @check_permissions(login=True, confirmed=True)
 def return_urls():
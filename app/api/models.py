@@ -5,12 +5,34 @@
 from os.path import join, dirname, realpath
 from glob import glob
 import logging
+import threading
 import sentencepiece as spm
 from flask_login import UserMixin
 from app.extensions import db
 
 logger = logging.getLogger(__name__)
-sp = spm.SentencePieceProcessor()
+
+# One SentencePiece processor per language, loaded once
+# and shared by all threads (encoding is thread-safe).
+tokenizers = {}
+_tokenizers_lock = threading.Lock()
+
+def get_tokenizer(lang):
+    '''
+    Return the SentencePiece processor for a language,
+    loading the model from disk the first time it is
+    requested.
+    '''
+    sp = tokenizers.get(lang)
+    if sp is not None:
+        return sp
+    with _tokenizers_lock:
+        if lang not in tokenizers:
+            dir_path = dirname(dirname(realpath(__file__)))
+            model_path = join(dir_path, 'api', 'models', lang, f'{lang}wiki.16k.model')
+            logger.info("Loading SentencePiece model %s", model_path)
+            tokenizers[lang] = spm.SentencePieceProcessor(model_file=model_path)
+        return tokenizers[lang]
 
 def get_installed_languages():
     '''
@@ -0,0 +1,58 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>,
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+''' Benchmark of the winner-take-all step of document encoding,
+for flask pears benchmarkwta.
+
+Pages are simulated by sampling wordpieces from the unigram
+distribution of the language model, with realistic lengths. The
+sparse WTA of the vectorizer is compared with the former dense
+implementation (wta_dense), for equality of the output and speed.
+'''
+
+from time import time
+import numpy as np
+import app as app_module
+from app.indexer.vectorizer import powered_logprobs, wta_dense, wta_sparse
+
+
+def sample_pages(lang, n_docs, min_length=300, max_length=3000, seed=0):
+    ''' Tokenized pages drawn from the unigram distribution of a language. '''
+    rng = np.random.default_rng(seed)
+    model = app_module.models[lang]
+    probs = np.exp(-np.asarray(model['logprobs'], dtype=np.float64))
+    probs /= probs.sum()
+    wordpieces = np.array([model['inverted_vocab'][i] for i in range(len(probs))])
+    return [' '.join(wordpieces[rng.choice(len(probs), rng.integers(min_length, max_length), p=probs)])
+            for _ in range(n_docs)]
+
+
+def _best_time(f, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time()
+        result = f()
+        elapsed = time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def benchmark_wta(lang, n_docs=1000, top_words=(None, 100, 10), repeat=3):
+    ''' Time dense and sparse WTA on sampled pages, for several k
+    (None for VEC_SIZE, as used for documents).
+    Returns: one (k, dense seconds, sparse seconds, equal) tuple per k.
+    '''
+    X = app_module.models[lang]['vectorizer'].transform(sample_pages(lang, n_docs)).astype(np.float64)
+    X.data *= powered_logprobs(lang, 5)[X.indices]
+    print(f"{n_docs} pages, {X.nnz / n_docs:.0f} non-zero values per page out of {X.shape[1]}")
+    results = []
+    for k in top_words:
+        k = k or app_module.VEC_SIZE
+        dense_time, dense = _best_time(lambda k=k: wta_dense(X.toarray(), k, False), repeat)
+        sparse_time, sparse = _best_time(lambda k=k: wta_sparse(X, k), repeat)
+        equal = np.array_equal(dense, sparse.toarray())
+        print(f"k={k}: dense {dense_time:.3f}s, sparse {sparse_time:.3f}s "
+                f"({dense_time / sparse_time:.0f}x), same output: {equal}")
+        results.append((k, dense_time, sparse_time, equal))
+    return results
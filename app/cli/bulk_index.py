@@ -0,0 +1,233 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>,
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+''' Bulk indexing of a url file, for flask pears index --bulk.
+
+The file is processed in batches of lines. The pages of a batch are
+fetched and parsed by concurrent workers (with per-host limits, and
+the Crawl-delay of robots.txt), then
+vectorized together, one matrix per language. Each pod gets its new
+rows in a single append, and the database entries of the whole batch
+are committed in one transaction. After each batch, the number of
+lines done is saved to a checkpoint file next to the url file, so
+that an interrupted run resumes where it stopped. Urls that could
+not be indexed are written to a .failed file, in the url file format.
+
+crawl_index indexes the pages found by the crawler (see
+indexer.spider) in the same way, in batches.
+'''
+
+import json
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from os import remove, replace
+from os.path import isfile, join
+from time import time
+from flask import current_app
+import app as app_module
+from app.extensions import db
+from app.api.models import Urls
+from app.indexer.controllers import fetch_url_page
+from app.indexer.job_queue import pod_lock
+from app.indexer.pod_store import append_rows_to_pod
+from app.indexer.politeness import HostLimiter, interleave_hosts
+from app.indexer import robots
+from app.indexer.spider import crawl
+from app.indexer.vectorizer import vectorize_scale_docs
+from app.search import live_index
+from app.utils_db import create_pod_npz_pos, create_pod_in_db, create_or_replace_url_in_db
+
+logger = logging.getLogger(__name__)
+
+LINE_FORMAT = re.compile(r"^(.+?);(.+?);;(.+?)$")
+
+
+def read_url_file(filepath):
+    ''' Returns: the (url, pod, contributor) triples of a url file. '''
+    entries = []
+    with open(filepath, encoding="utf-8") as f:
+        for line in f:
+            m = LINE_FORMAT.match(line)
+            assert m, "URL file is not formatted correctly!"
+            entries.append((m.group(1), m.group(2), m.group(3)))
+    return entries
+
+
+def load_checkpoint(path):
+    if not isfile(path):
+        return {'done': 0, 'indexed': 0, 'skipped': 0, 'failed': 0}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    replace(path + '.tmp', path)
+
+
+def fetch_batch(entries, executor, limiter):
+    ''' Fetch and parse the pages of a batch concurrently.
+    Returns: {entry: (page, messages)}.
+    '''
+    app = current_app._get_current_object()
+
+    def fetch(entry):
+        url, _, contributor = entry
+        with app.app_context(), limiter.slot(url, robots.crawl_delay(url)):
+            try:
+                return fetch_url_page(url, contributor, vectorize=False)
+            except Exception as e:
+                logger.exception("bulk index: failed to fetch %s", url)
+                return None, [f"Unexpected error: {e}"]
+
+    ordered = interleave_hosts(entries, url=lambda entry: entry[0])
+    return dict(zip(ordered, executor.map(fetch, ordered)))
+
+
+def vectorize_pages(pages):
+    ''' Compute the vectors of parsed pages, one pass per language. '''
+    by_lang = {}
+    for page in pages:
+        by_lang.setdefault(page['lang'], []).append(page)
+    for lang, lang_pages in by_lang.items():
+        m = vectorize_scale_docs(lang, [page['text'] for page in lang_pages], 5, app_module.VEC_SIZE)
+        for i, page in enumerate(lang_pages):
+            page['vector'] = m[i]
+
+
+def store_batch(pages, host_url):
+    ''' Write the pages of a batch: one append per pod,
+    and one database transaction for the whole batch. '''
+    by_pod = {}
+    for page in pages:
+        by_pod.setdefault((page['theme'], page['contributor'], page['lang']), []).append(page)
+    # The pods are locked until their new row ids are committed
+    with pod_lock(*[theme+'.u.'+contributor for theme, contributor, _ in by_pod]):
+        try:
+            for (theme, contributor, lang), pod_pages in by_pod.items():
+                pod_path = create_pod_npz_pos(contributor, theme, lang)
+                first_idv = append_rows_to_pod(pod_path+'.npz', [page['vector'] for page in pod_pages])
+                create_pod_in_db(contributor, theme, lang, commit=False)
+                for idv, page in enumerate(pod_pages, first_idv):
+                    share_url = join(host_url, 'api', 'get?url='+page['url'])
+                    create_or_replace_url_in_db(page['url'], page['title'], page['snippet'], 'url', idv, theme, None, \
+                            None, None, share_url, contributor, commit=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    for page in pages:
+        live_index.index_document(page['lang'], page['url'], page['theme']+'.u.'+page['contributor'], page['vector'])
+
+
+def index_batch(entries, host_url, executor, limiter):
+    ''' Index a batch of url file entries.
+    Returns: the number of indexed urls, the number of urls
+    skipped as already indexed, and the failed entries with their
+    messages.
+    '''
+    failed = []
+    known = {u.url for u in Urls.query.filter(Urls.url.in_([url for url, _, _ in entries])).all()}
+    todo = []
+    for entry in entries:
+        if entry[0] in known:
+            logger.info("bulk index: %s is already indexed", entry[0])
+        else:
+            known.add(entry[0])
+            todo.append(entry)
+    pages = []
+    for entry, (page, messages) in fetch_batch(todo, executor, limiter).items():
+        if page is None:
+            failed.append((entry, messages))
+            continue
+        page['theme'], page['contributor'] = entry[1], entry[2]
+        pages.append(page)
+    vectorize_pages(pages)
+    for page in pages:
+        if page['vector'].nnz == 0:
+            failed.append(((page['url'], page['theme'], page['contributor']), ["compute_vectors: error during parsing"]))
+    pages = [page for page in pages if page['vector'].nnz > 0]
+    store_batch(pages, host_url)
+    return len(pages), len(entries) - len(todo), failed
+
+
+def bulk_index(filepath, host_url, workers=8, batch_size=100, per_host=1, delay=1.0):
+    ''' Index all urls of a url file (see the module docstring). '''
+    entries = read_url_file(filepath)
+    checkpoint_path = filepath + '.checkpoint'
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint['done']:
+        print(f"Resuming after line {checkpoint['done']} ({checkpoint['indexed']} indexed, "
+                f"{checkpoint['skipped']} skipped, {checkpoint['failed']} failed)")
+    limiter = HostLimiter(per_host, delay)
+    started = time()
+    done_at_start = checkpoint['done']
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(checkpoint['done'], len(entries), batch_size):
+            batch = entries[start:start + batch_size]
+            indexed, skipped, failed = index_batch(batch, host_url, executor, limiter)
+            if failed:
+                with open(filepath + '.failed', 'a', encoding='utf-8') as f:
+                    for (url, pod, contributor), messages in failed:
+                        logger.info("bulk index: %s not indexed: %s", url, ' '.join(messages))
+                        f.write(f"{url};{pod};;{contributor}\n")
+            checkpoint['done'] = start + len(batch)
+            checkpoint['indexed'] += indexed
+            checkpoint['skipped'] += skipped
+            checkpoint['failed'] += len(failed)
+            save_checkpoint(checkpoint_path, checkpoint)
+            elapsed = time() - started
+            rate = (checkpoint['done'] - done_at_start) / elapsed if elapsed else 0
+            eta = (len(entries) - checkpoint['done']) / rate if rate else 0
+            print(f"[{checkpoint['done']}/{len(entries)}] {checkpoint['indexed']} indexed, "
+                    f"{checkpoint['skipped']} skipped, {checkpoint['failed']} failed, {rate:.1f} urls/s, {eta/60:.0f} min left")
+    if isfile(checkpoint_path):
+        remove(checkpoint_path)
+    return checkpoint
+
+
+def crawl_index(start_url, theme, contributor, host_url, max_pages=100, max_depth=3, workers=4, \
+        batch_size=100, per_host=1, delay=1.0):
+    ''' Crawl a site from start_url and index the pages found.
+    Returns: the number of indexed pages, of pages skipped as already
+    indexed, and of pages that could not be indexed.
+    '''
+    indexed, skipped, failed = 0, 0, 0
+
+    def parse(page):
+        return fetch_url_page(page.url, contributor, vectorize=False, fetched=page)
+
+    def flush(pages):
+        nonlocal indexed, skipped, failed
+        known = {u.url for u in Urls.query.filter(Urls.url.in_([page['url'] for page in pages])).all()}
+        pages = [page for page in pages if page['url'] not in known]
+        skipped += len(known)
+        vectorize_pages(pages)
+        for page in pages:
+            if page['vector'].nnz == 0:
+                logger.info("crawl index: %s not indexed: compute_vectors: error during parsing", page['url'])
+                failed += 1
+        pages = [page for page in pages if page['vector'].nnz > 0]
+        store_batch(pages, host_url)
+        indexed += len(pages)
+        print(f"{indexed} indexed, {skipped} skipped, {failed} failed")
+
+    batch = []
+    limiter = HostLimiter(per_host, delay)
+    for url, _, (page, messages) in crawl(start_url, max_pages=max_pages, max_depth=max_depth, \
+            workers=workers, limiter=limiter, process=parse):
+        if page is None:
+            logger.info("crawl index: %s not indexed: %s", url, ' '.join(messages))
+            failed += 1
+            continue
+        page['theme'], page['contributor'] = theme, contributor
+        batch.append(page)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return indexed, skipped, failed
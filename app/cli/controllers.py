@@ -19,11 +19,13 @@ import joblib
 from flask import Blueprint
 import click
 from werkzeug.security import generate_password_hash
-from scipy.sparse import load_npz, csr_matrix, vstack
 from app.indexer.controllers import run_indexer_url, index_doc_from_cli
 from app.indexer.access import request_url
-from app.indexer.posix import load_posix
+from app.indexer import job_queue
+from app.indexer.posix import load_posix, convert_posix_file
+from app.indexer.pod_store import load_pod_matrix, compact_pod
 from app.indexer.htmlparser import extract_links
+from app.search import live_index
 from app.orchard.mk_urls_file import get_reindexable_pod_for_admin
 from app.extensions import db
 from app.api.models import User, Urls, Pods
@@ -192,6 +194,46 @@ def backup(backupdir):
     copytree(pod_dir, join(dirpath,'pods'))
 
 
+@pears.cli.command('compactpods')
+def compact_pods():
+    '''
+    Fold the append logs (.npz.log) of all pods into their .npz files.
+    Pods created before append logs existed are read as they are and
+    need no conversion; after compaction, every .npz file holds its
+    full matrix and can be read with scipy's load_npz alone.
+    '''
+    npzs = glob(join(pod_dir, '*', '*', '*.u.*npz'))
+    for npz in npzs:
+        m = compact_pod(npz)
+        print(npz, m.shape[0], "rows")
+
+
+@pears.cli.command('convertpos')
+def convert_pos():
+    '''
+    Convert legacy positional indices (joblib lists of dictionaries)
+    to the compact .pos format. Legacy files are also readable as they
+    are, but are converted in memory every time they are loaded.
+    '''
+    pos_files = glob(join(pod_dir, '*', '*', '*.u.*pos'))
+    for pos_file in pos_files:
+        if convert_posix_file(pos_file):
+            print("Converted", pos_file)
+
+
+@pears.cli.command('benchmarkwta')
+@click.argument('lang')
+@click.option('--docs', default=1000, show_default=True, help="Number of simulated pages.")
+def benchmark_wta_cli(lang, docs):
+    '''
+    Compare the sparse winner-take-all of document encoding
+    with the former dense implementation, on simulated pages.
+    Use from CLI with flask pears benchmarkwta <lang>
+    '''
+    from app.cli.benchmark import benchmark_wta
+    benchmark_wta(lang, n_docs=docs)
+
+
 #########################
 # ADMIN INDEXING TOOLS
 #########################
@@ -199,7 +241,13 @@ def backup(backupdir):
 @pears.cli.command('index')
 @click.argument('host_url')
 @click.argument('filepath')
-def index(host_url, filepath):
+@click.option('--queue', is_flag=True, help="Add the urls to the indexing queue of the running instance.")
+@click.option('--bulk', is_flag=True, help="Fetch urls concurrently and write them in batches, resuming from a checkpoint.")
+@click.option('--workers', default=8, show_default=True, help="Concurrent fetches in bulk mode.")
+@click.option('--batch-size', default=100, show_default=True, help="Urls per batch in bulk mode.")
+@click.option('--per-host', default=1, show_default=True, help="Concurrent fetches per host in bulk mode.")
+@click.option('--delay', default=1.0, show_default=True, help="Seconds between fetches on the same host in bulk mode.")
+def index(host_url, filepath, queue, bulk, workers, batch_size, per_host, delay):
     '''
     Index from a manual created URL file.
     The file should have the following information,
@@ -207,6 +255,10 @@ def index(host_url, filepath):
     url; theme; lang; note; contributor
     with one url per line.
     Use from CLI with flask pears index <your site's domain> <path>
+    With --queue, the urls are indexed in the background by the
+    workers of the running instance (see /indexer/jobs).
+    With --bulk, large url files are indexed concurrently, in
+    batches; an interrupted run resumes where it stopped.
     '''
     # make sure the host_url starts with https:// so that it can be parsed correctly by urllib.parse.urlparse 
     if not host_url.startswith("https://"):
@@ -215,6 +267,10 @@ def index(host_url, filepath):
     users = User.query.all()
     for user in users:
         Path(join(pod_dir,user.username)).mkdir(parents=True, exist_ok=True)
+    if bulk:
+        from app.cli.bulk_index import bulk_index
+        bulk_index(filepath, host_url, workers=workers, batch_size=batch_size, per_host=per_host, delay=delay)
+        return
     with open(filepath, encoding="utf-8") as f:
         for line in f:
             m = re.match(r"^(.+?);(.+?);;(.+?)$", line)
@@ -222,7 +278,38 @@ def index(host_url, filepath):
             url = m.group(1)
             pod = m.group(2)
             user = m.group(3)
-            run_indexer_url(url, pod, None, user, host_url)
+            if queue:
+                job_queue.enqueue(url, pod, None, user, host_url)
+            else:
+                run_indexer_url(url, pod, None, user, host_url)
+
+
+@pears.cli.command('crawl')
+@click.argument('host_url')
+@click.argument('url')
+@click.argument('theme')
+@click.argument('username')
+@click.option('--max-pages', default=100, show_default=True, help="Maximum number of pages to fetch.")
+@click.option('--max-depth', default=3, show_default=True, help="Maximum number of links followed from the start url.")
+@click.option('--workers', default=4, show_default=True, help="Concurrent fetches.")
+@click.option('--per-host', default=1, show_default=True, help="Concurrent fetches per host.")
+@click.option('--delay', default=1.0, show_default=True, help="Seconds between fetches on the same host.")
+def crawl_site(host_url, url, theme, username, max_pages, max_depth, workers, per_host, delay):
+    '''
+    Crawl a site from a url and index the pages under that url,
+    in the given theme, for the given user.
+    Use from CLI with flask pears crawl <your site's domain> <url> <theme> <username>
+    '''
+    if not host_url.startswith("https://"):
+        host_url = "https://" + host_url
+    Path(join(pod_dir,username)).mkdir(parents=True, exist_ok=True)
+    from app.cli.bulk_index import crawl_index
+    try:
+        indexed, skipped, failed = crawl_index(url, theme, username, host_url, max_pages=max_pages, \
+                max_depth=max_depth, workers=workers, per_host=per_host, delay=delay)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='URL')
+    print(f"Crawl done: {indexed} indexed, {skipped} skipped, {failed} failed")
 
 
 @pears.cli.command('randomcrawl')
@@ -243,9 +330,9 @@ def random_crawl(n, username):
         parse = urlparse(url)
         domain = parse.scheme+'://'+parse.netloc
         print(url, pod)
-        access, _, _ = request_url(url)
+        access, page, _ = request_url(url)
         if access:
-            links = extract_links(url)
+            links = extract_links(url, page)
         for link in links:
             if domain in link:
                 print(link+';'+pod+';;'+username)
@@ -255,9 +342,9 @@ def random_crawl(n, username):
 @click.argument('url')
 def get_links(url):
     '''Get links from a particular URL'''
-    access, req, request_errors = request_url(url)
+    access, page, request_errors = request_url(url)
     if access:
-        links = extract_links(url)
+        links = extract_links(url, page)
         for link in links:
             print(link)
     else:
@@ -329,6 +416,7 @@ def deletedbonly():
     for p in pods:
         db.session.delete(p)
         db.session.commit()
+    live_index.invalidate()
 
 
 #####################
@@ -440,7 +528,7 @@ def check_npz_to_idx_vs_idx_to_url(pod, username, language):
 def check_npz_vs_npz_to_idx(pod, username, language):
     print("\t>> CHECKING NPZ_TO_IDX VS IDX_TO_URL")
     pod_path = join(pod_dir, username, language, pod+'.npz')
-    pod_m = load_npz(pod_path)
+    pod_m = load_pod_matrix(pod_path)
     pod_path = join(pod_dir, username, language, pod+'.npz.idx')
     npz_to_idx = joblib.load(pod_path)
     if pod_m.shape[0] != len(npz_to_idx[0]):
@@ -452,11 +540,7 @@ def check_pos_vs_npz_to_idx(pod, username, language):
     pod_path = join(pod_dir, username, language, pod+'.npz.idx')
     npz_to_idx = joblib.load(pod_path)
     posindex = load_posix(username, language, pod.split(".")[0])
-    idx = []
-    for token_id in posindex:
-        for doc_id, _ in token_id.items():
-            idx.append(doc_id)
-    idx1 = list(set(idx))
+    idx1 = list(posindex.doc_ids())
     idx2 = npz_to_idx[1][1:] #Ignore first value, which is -1
     if set(idx2) != set(idx1):
         print("\t\t> ERROR: idx in npz_to_idx do not match doc list in positional index")
@@ -479,6 +563,7 @@ def rebuild_from_db(basedir):
     '''
     from app.cli.rebuild import rebuild_pods_and_urls, rebuild_users, rebuild_personalization
     rebuild_pods_and_urls(pod_dir, basedir)
+    live_index.invalidate()
     rebuild_users(basedir)
     rebuild_personalization(basedir)
 
@@ -2,14 +2,14 @@
 from os.path import join
 import joblib
 from pathlib import Path
-import numpy as np
 import pandas as pd
-from scipy.sparse import vstack, load_npz, save_npz, csr_matrix
+from scipy.sparse import vstack, csr_matrix
 from sqlalchemy import create_engine
 from app.extensions import db
 from app import VEC_SIZE
 from app.api.models import User, Personalization
 from app.utils_db import create_or_replace_url_in_db, create_pod_in_db, create_pod_npz_pos
+from app.indexer.pod_store import load_pod_matrix, save_pod_matrix
 
 def rebuild_personalization(basedir):
     source_db = 'sqlite:///' + join(basedir, 'app.db')
@@ -61,7 +61,7 @@ def rebuild_pods_and_urls(pod_dir, basedir):
         lang = p['language']
         try:
             npz_path = join(source_pod_dir, username, lang, p['name']+'.npz')
-            npz = load_npz(npz_path).toarray()
+            npz = load_pod_matrix(npz_path)
             print(">> Shape npz:", npz.shape)
         except:
             continue
@@ -70,19 +70,17 @@ def rebuild_pods_and_urls(pod_dir, basedir):
         Path(user_dir).mkdir(parents=True, exist_ok=True)
         create_pod_in_db(username, theme, lang)
         new_npz_path = join(pod_dir, username, lang, p['name']+'.npz')
-        m = np.zeros((1,VEC_SIZE))
-        m = csr_matrix(m)
+        rows = [csr_matrix((1,VEC_SIZE))]
         for _, url in urls.iterrows():
             notes = url['notes'] if 'notes' in url else None
             content = url['content'] if 'content' in url else None
 
             #try:
             row = url['vector']
-            v = npz[row]
-            m = vstack((m,v))
-            vector = m.shape[0]-1
+            rows.append(npz[row])
+            vector = len(rows)-1
             create_or_replace_url_in_db(url['url'], url['title'], url['snippet'], url['doctype'], vector, theme, notes, content, url['img'], url['share'], url['contributor'])
             #except:
             #    print(">> CLI:REBUILD DB: Problem with url",url['url'])
-        save_npz(new_npz_path, m)
+        save_pod_matrix(new_npz_path, vstack(rows, format='csr'))
 
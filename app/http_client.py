@@ -0,0 +1,193 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>,
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+''' Shared HTTP client for all outbound requests
+(page fetching, robots.txt, federation with other instances).
+
+One requests session per process keeps a pool of keep-alive
+connections per host (HTTP_POOL_HOSTS hosts, HTTP_POOL_SIZE
+connections each). Idempotent requests are retried HTTP_RETRIES
+times with exponential backoff on connection errors and on 429/5xx
+answers. Bodies are read in chunks and abandoned beyond
+HTTP_MAX_RESPONSE_MB; stream=True returns the response unread (to be
+read with read_body), and download() writes a body to disk without
+holding it in memory.
+Cookies are never kept between requests.
+'''
+
+import logging
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from os import getenv, getpid, remove
+from os.path import isfile
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+HTTP_TIMEOUT = float(getenv("HTTP_TIMEOUT", "30"))
+HTTP_POOL_HOSTS = int(getenv("HTTP_POOL_HOSTS", "32"))
+HTTP_POOL_SIZE = int(getenv("HTTP_POOL_SIZE", "8"))
+HTTP_RETRIES = int(getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(getenv("HTTP_BACKOFF", "0.5"))
+HTTP_MAX_RESPONSE_BYTES = int(float(getenv("HTTP_MAX_RESPONSE_MB", "20")) * 1024 * 1024)
+
+CHUNK_SIZE = 64 * 1024
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+_counters = {'requests': 0, 'connections': 0, 'retries': 0, 'errors': 0, 'too_large': 0}
+
+
+class ResponseTooLarge(requests.RequestException):
+    pass
+
+
+def _count(name, n=1):
+    with _lock:
+        _counters[name] += n
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _count('connections')
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _count('connections')
+        return super()._new_conn()
+
+
+class _CountingRetry(Retry):
+    def increment(self, *args, **kwargs):
+        _count('retries')
+        return super().increment(*args, **kwargs)
+
+
+class _PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool}
+
+
+def _new_session():
+    retry = _CountingRetry(total=HTTP_RETRIES, backoff_factor=HTTP_BACKOFF,
+            status_forcelist=(429, 500, 502, 503, 504), allowed_methods=('HEAD', 'GET'),
+            respect_retry_after_header=True, raise_on_status=False)
+    adapter = _PooledAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+def get_session():
+    ''' The session of the current process (connections
+    must not be shared across a fork). '''
+    global _session, _session_pid
+    with _lock:
+        if _session is None or _session_pid != getpid():
+            _session = _new_session()
+            _session_pid = getpid()
+        return _session
+
+
+def _headers(headers):
+    headers = dict(headers or {})
+    if 'User-Agent' not in headers and has_app_context():
+        headers['User-Agent'] = current_app.config['USER-AGENT']
+    return headers
+
+
+def read_body(resp, max_bytes=HTTP_MAX_RESPONSE_BYTES, chunks=None):
+    ''' Read the body of a streamed response (up to max_bytes),
+    from chunks if the caller already started iterating over it.
+    '''
+    length = resp.headers.get('Content-Length', '')
+    try:
+        if max_bytes and length.isdigit() and int(length) > max_bytes:
+            raise ResponseTooLarge(f"{resp.url}: body of {length} bytes exceeds the limit of {max_bytes} bytes")
+        body = []
+        size = 0
+        for chunk in chunks if chunks is not None else resp.iter_content(CHUNK_SIZE):
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                raise ResponseTooLarge(f"{resp.url}: body exceeds the limit of {max_bytes} bytes")
+            body.append(chunk)
+    except ResponseTooLarge:
+        _count('too_large')
+        raise
+    resp._content = b''.join(body)
+
+
+def request(method, url, headers=None, stream=False, max_bytes=HTTP_MAX_RESPONSE_BYTES, **kwargs):
+    ''' Send a request through the shared session.
+    Unless stream is True, the body is read (up to max_bytes)
+    and the connection returned to the pool.
+    '''
+    kwargs.setdefault('timeout', HTTP_TIMEOUT)
+    if method.upper() == 'HEAD':
+        kwargs.setdefault('allow_redirects', False)
+    _count('requests')
+    try:
+        resp = get_session().request(method, url, headers=_headers(headers), stream=True, **kwargs)
+    except requests.RequestException:
+        _count('errors')
+        raise
+    if stream:
+        return resp
+    try:
+        read_body(resp, max_bytes)
+    finally:
+        resp.close()
+    return resp
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def head(url, **kwargs):
+    return request('HEAD', url, **kwargs)
+
+
+def download(url, path, max_bytes=HTTP_MAX_RESPONSE_BYTES, **kwargs):
+    ''' Stream the body of url to a file.
+    Returns: the response (without its body).
+    '''
+    resp = get(url, stream=True, **kwargs)
+    size = 0
+    try:
+        with open(path, 'wb') as f:
+            for chunk in resp.iter_content(CHUNK_SIZE):
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    _count('too_large')
+                    raise ResponseTooLarge(f"{url}: body exceeds the limit of {max_bytes} bytes")
+                f.write(chunk)
+    except Exception:
+        if isfile(path):
+            remove(path)
+        raise
+    finally:
+        resp.close()
+    return resp
+
+
+def stats():
+    ''' Request counters of this process. Requests that did not
+    open a new connection reused a pooled one. '''
+    with _lock:
+        counters = dict(_counters)
+    counters['reused_connections'] = max(0, counters['requests'] + counters['retries'] - counters['connections'])
+    return counters
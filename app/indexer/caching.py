@@ -5,7 +5,7 @@
 import logging
 logger = logging.getLogger(__name__)
 import os
-import requests
+from app import http_client
 import codecs
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse, urljoin
@@ -58,16 +58,14 @@ def cache_pdf(url):
             os.makedirs(cached_dir)
         cached_page = cached_dir + page
         if not os.path.exists(cached_page):
-            response = requests.get(url)
-            with open(cached_page, 'wb') as f:
-                f.write(response.content)
+            http_client.download(url, cached_page)
     except Exception:
         logger.error("Error caching the pdf...")
 
 
 def get_images(url):
     """Downloads all the images at 'url' to cache"""
-    req = requests.get(url, allow_redirects=True, timeout=20)
+    req = http_client.get(url, timeout=20)
     soup = BeautifulSoup(req.text, "lxml")
     # url_parsed = list(urlparse(url))
     for image in soup.findAll("img"):
@@ -80,7 +78,7 @@ def get_images(url):
 
 def get_css(url):
     """Downloads all the css to local cache"""
-    req = requests.get(url, allow_redirects=True, timeout=20)
+    req = http_client.get(url, timeout=20)
     soup = BeautifulSoup(req.text, "lxml")
     # url_parsed = list(urlparse(url))
     for link in soup.findAll("link"):
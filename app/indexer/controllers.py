@@ -12,6 +12,7 @@ from flask import current_app
 from flask import session, Blueprint, request, render_template, url_for, flash, redirect, jsonify
 from flask_login import current_user
 from flask_babel import gettext
+from sqlalchemy import update, func
 from langdetect import detect
 from markupsafe import Markup, escape
 from app.auth.captcha import mk_captcha, check_captcha
@@ -21,6 +22,8 @@ from app.api.models import Urls, Pods, Suggestions, RejectedSuggestions, Persona
 from app.indexer import mk_page_vector
 from app.utils_db import create_pod_in_db, create_pod_npz_pos, create_or_replace_url_in_db, delete_url_representations, create_suggestion_in_db, check_url_exists
 from app.indexer.access import request_url
+from app.indexer import job_queue
+from app.search import live_index
 from app.utils import make_slug
 from app.forms import IndexerForm, WebSourceForm, NewContentForm, SuggestionForm
 
@@ -115,6 +118,10 @@ def index_from_url():
         if note is None:
             note = ''
         logger.debug("Indexing url=%s theme=%s note=%s contributor=%s", url, theme, note, contributor)
+        if job_queue.INDEX_WORKERS > 0:
+            job_queue.enqueue(url, theme, note, contributor, request.host_url)
+            flash(gettext("Your page was added to the indexing queue."), "success")
+            return redirect(url_for('indexer.jobs'))
         success, messages, share_url = run_indexer_url(url, theme, note, contributor, request.host_url)
         if success:
             return render_template('indexer/success.html', messages=messages, share_url=share_url, url=url, theme=theme, note=note)
@@ -294,13 +301,19 @@ def index_url_ajax():
             "messages": [f"could not find suggestion with original url {orig_url}"]
         })
 
-    s_success, s_messages, _ = run_indexer_url(url, theme, notes, current_user.username, request.host_url)
+    if job_queue.INDEX_WORKERS > 0:
+        # the job notes in the suggestion whether the url was indexed
+        job_id = job_queue.enqueue(url, theme, notes, current_user.username, request.host_url, suggestion.id)
+        s_success, s_messages = True, [f"Queued for indexing as job {job_id}"]
+        note = f"Queued as: {url} (job {job_id})"
+    else:
+        s_success, s_messages, _ = run_indexer_url(url, theme, notes, current_user.username, request.host_url)
+        note = f"Indexed as: {url}"
 
     # we keep the suggestion in the DB but change the url so it matches with what we indexed  
     suggestion.url = url
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    suggestion.notes += f"\n\n-----\nTimestamp: {timestamp}\nIndexed as: {url}\nOriginal url: {orig_url}"
     db.session.add(suggestion)
+    _add_suggestion_note(suggestion.id, f"{note}\nOriginal url: {orig_url}")
     db.session.commit()
 
     return jsonify({
@@ -309,6 +322,44 @@ def index_url_ajax():
     })
 
 
+def _add_suggestion_note(suggestion_id, note):
+    """ Append a timestamped note to a suggestion, in a single
+    statement, as its indexing job may be adding one concurrently.
+    """
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    db.session.execute(update(Suggestions).where(Suggestions.id == suggestion_id).values(
+            notes=func.coalesce(Suggestions.notes, '') + f"\n\n-----\nTimestamp: {timestamp}\n{note}"))
+
+
+def note_suggestion_job(job, success, messages):
+    """ Record the outcome of the indexing job of a suggestion
+    (see index_url_ajax) in its notes.
+    """
+    if success:
+        note = f"Indexed as: {job['url']} (job {job['id']})"
+    else:
+        note = '\n'.join([f"Indexing failed: {job['url']} (job {job['id']})"] + messages)
+    _add_suggestion_note(job['suggestion'], note)
+    db.session.commit()
+
+
+@indexer.route("/jobs", methods=["GET"])
+@check_permissions(login=True, confirmed=True, admin=True)
+def jobs():
+    """Displays the status of the last indexing jobs."""
+    return render_template("indexer/jobs.html", jobs=job_queue.recent_jobs(), counts=job_queue.counts())
+
+
+@indexer.route("/jobs/<int:job_id>", methods=["GET"])
+@check_permissions(login=True, confirmed=True, admin=True)
+def job_status(job_id):
+    """Returns the status of an indexing job in a json format."""
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return jsonify({"success": False, "messages": [f"job {job_id} does not exist"]}), 404
+    return jsonify(job)
+
+
 @indexer.route("/reject_suggestion_ajax", methods=["POST"])
 @check_permissions(login=True, confirmed=True, admin=True)
 def reject_suggestion_ajax():
@@ -416,32 +467,65 @@ def run_indexer_url(url, theme, notes, contributor, host_url):
     added to the database.
     """
     logger.info("run_indexer_url: Running indexer over suggested URL.")
+    page, messages = fetch_url_page(url, contributor)
+    if page is None:
+        return False, messages, ''
+    share_url = store_url_page(page, theme, notes, contributor, host_url)
+    return True, messages, share_url
+
+
+def fetch_url_page(url, contributor, vectorize=True, fetched=None):
+    """ First step of run_indexer_url, which can run concurrently
+    for many urls: check that the url can be accessed, retrieve
+    and parse the page and compute its vector (unless vectorize is
+    False, for callers that vectorize many pages at once).
+    fetched is the FetchedPage of url, if it was already retrieved
+    (e.g. by the crawler).
+
+    Returns: the page (None on failure) and error messages.
+    """
     messages = []
-    indexed = False
+    if fetched is None:
+        access, fetched, request_errors = request_url(url)
+        if not access:
+            messages.extend(request_errors)
+            return None, messages
+    if not fetched.content_type:
+        messages.append(gettext('ERROR: Content type could not be retrieved from header.'))
+        return None, messages
+    if not vectorize:
+        success, tokenized_text, lang, title, snippet, mgs = mk_page_vector.parse_page(fetched, contributor)
+        v = None
+    else:
+        success, tokenized_text, lang, title, snippet, v, mgs = mk_page_vector.compute_page(fetched, contributor)
+    logger.info("fetch_url_page: %s %s", url, ' '.join(f"{stage}={t:.3f}s" for stage, t in fetched.timings.items()))
+    if not success:
+        messages.extend(mgs)
+        return None, messages
+    return {'url': url, 'lang': lang, 'title': title, 'snippet': snippet, 'text': tokenized_text, 'vector': v}, messages
+
+
+def store_url_page(page, theme, notes, contributor, host_url):
+    """ Second step of run_indexer_url: write a page returned by
+    fetch_url_page to its pod, the database and the search index,
+    holding the lock of the pod (see job_queue.pod_lock).
+
+    Returns: the share url of the page.
+    """
     doctype = 'url'
-    share_url = ''
     content = None
     img = None
-    access, req, request_errors = request_url(url)
-    if access:
-        try:
-            url_type = req.headers['Content-Type']
-        except:
-            messages.append(gettext('ERROR: Content type could not be retrieved from header.'))
-            return indexed, messages, share_url
-        success, _, lang, title, snippet, idv, mgs = \
-                mk_page_vector.compute_vector(url, theme, contributor, url_type)
-        if success:
-            create_pod_in_db(contributor, theme, lang)
-            #posix_doc(text, idx, contributor, lang, theme)
-            share_url = join(host_url,'api', 'get?url='+url)
-            create_or_replace_url_in_db(url, title, snippet, doctype, idv, theme, notes, content, img, share_url, contributor)
-            indexed = True
-        else:
-            messages.extend(mgs)
-    else:
-        messages.extend(request_errors)
-    return indexed, messages, share_url
+    url, lang = page['url'], page['lang']
+    share_url = join(host_url,'api', 'get?url='+url)
+    with job_queue.pod_lock(theme+'.u.'+contributor):
+        pod_path = create_pod_npz_pos(contributor, theme, lang)
+        idv = mk_page_vector.append_new_vec(page['vector'], pod_path+'.npz')
+        create_pod_in_db(contributor, theme, lang)
+        #posix_doc(text, idx, contributor, lang, theme)
+        create_or_replace_url_in_db(url, page['title'], page['snippet'], doctype, idv, theme, notes, content, img, share_url, contributor)
+    live_index.index_document(lang, url, theme+'.u.'+contributor, page['vector'])
+    return share_url
+
 
 def run_indexer_manual(url, title, theme, lang, share_url, usercontent, contributor, chosen_license, host_url):
     """ Run the indexer over manually contributed information.
@@ -459,16 +543,19 @@ def run_indexer_manual(url, title, theme, lang, share_url, usercontent, contribu
     img = None
     indexed = False
 
-    create_pod_npz_pos(contributor, theme, lang)
-    success, _, snippet, idv = mk_page_vector.compute_vector_local_docs(\
-            title, usercontent, theme, lang, contributor)
+    with job_queue.pod_lock(theme+'.u.'+contributor):
+        create_pod_npz_pos(contributor, theme, lang)
+        success, _, snippet, idv, v = mk_page_vector.compute_vector_local_docs(\
+                title, usercontent, theme, lang, contributor)
+        if success:
+            create_pod_in_db(contributor, theme, lang)
+            #posix_doc(text, idx, contributor, lang, theme)
+            snippet = snippet.replace('\r\n', ' ')
+            usercontent = usercontent.replace('\r\n', Markup('<br>'))
+            create_or_replace_url_in_db(url, title, snippet, doctype, idv, theme, notes,\
+                    usercontent, img, share_url, contributor, url_license=chosen_license)
     if success:
-        create_pod_in_db(contributor, theme, lang)
-        #posix_doc(text, idx, contributor, lang, theme)
-        snippet = snippet.replace('\r\n', ' ')
-        usercontent = usercontent.replace('\r\n', Markup('<br>'))
-        create_or_replace_url_in_db(url, title, snippet, doctype, idv, theme, notes,\
-                usercontent, img, share_url, contributor, url_license=chosen_license)
+        live_index.index_document(lang, url, theme+'.u.'+contributor, v)
         indexed = True
     else:
         messages.append(gettext("There was a problem indexing your entry. Please check the submitted data."))
@@ -485,13 +572,16 @@ def index_doc_from_cli(title, doc, theme, lang, contributor, url, notes, host_ur
     u = db.session.query(Urls).filter_by(url=url).first()
     if u:
         return False #URL exists already
-    create_pod_npz_pos(contributor, theme, lang)
-    success, text, snippet, idv = \
-            mk_page_vector.compute_vector_local_docs(title, doc, theme, lang, contributor)
+    with job_queue.pod_lock(theme+'.u.'+contributor):
+        create_pod_npz_pos(contributor, theme, lang)
+        success, text, snippet, idv, v = \
+                mk_page_vector.compute_vector_local_docs(title, doc, theme, lang, contributor)
+        if success:
+            create_pod_in_db(contributor, theme, lang)
+            share_url = join(host_url,'api', 'get?url='+url)
+            create_or_replace_url_in_db(url, title, snippet, doctype, idv, theme, notes, content, img, share_url, contributor)
     if success:
-        create_pod_in_db(contributor, theme, lang)
-        share_url = join(host_url,'api', 'get?url='+url)
-        create_or_replace_url_in_db(url, title, snippet, doctype, idv, theme, notes, content, img, share_url, contributor)
+        live_index.index_document(lang, url, theme+'.u.'+contributor, v)
         return True
     else:
         return False
@@ -0,0 +1,129 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>,
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+''' Retrieval of the pages to index, with a single request per page.
+
+fetch_page sends one GET, decides the content type from the headers
+and the first bytes of the body, and only reads the rest of the body
+for the types we can index. The FetchedPage it returns is then shared
+by the parsing stages (BeautifulSoup, boilerplate removal, link
+extraction, pdf extraction), each of which records its duration, per
+page and in totals for the process (see stage_stats).
+'''
+
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import chain
+from time import time
+from bs4 import BeautifulSoup
+from app import http_client
+
+logger = logging.getLogger(__name__)
+
+INDEXABLE_TYPES = ('text/html', 'application/pdf')
+GENERIC_TYPES = ('', 'application/octet-stream', 'binary/octet-stream', 'text/plain')
+
+_lock = threading.Lock()
+_stages = defaultdict(lambda: [0, 0.0])
+
+
+def sniff_content_type(header, head):
+    ''' The content type of a response, from its Content-Type header,
+    or from the first bytes of its body if the header is missing
+    or generic. '''
+    if header.split(';')[0].strip().lower() not in GENERIC_TYPES:
+        return header
+    start = head.lstrip()[:1024].lower()
+    if start.startswith(b'%pdf-'):
+        return 'application/pdf'
+    if start.startswith(b'<!doctype html') or b'<html' in start:
+        return 'text/html'
+    return header
+
+
+def _record(stage, elapsed, page=None):
+    with _lock:
+        _stages[stage][0] += 1
+        _stages[stage][1] += elapsed
+    if page is not None:
+        page.timings[stage] = page.timings.get(stage, 0) + elapsed
+
+
+@contextmanager
+def timed(stage, page=None):
+    ''' Record the duration of a processing stage (of a page). '''
+    started = time()
+    try:
+        yield
+    finally:
+        _record(stage, time() - started, page)
+
+
+def stage_stats():
+    ''' Number of runs and total duration of each stage in this process. '''
+    with _lock:
+        return {stage: {'count': count, 'seconds': round(seconds, 3), 'mean': round(seconds / count, 4)}
+                for stage, (count, seconds) in _stages.items()}
+
+
+class FetchedPage:
+    ''' A page retrieved by fetch_page: the response (with its body
+    read if the content type is indexable) and the time spent on each
+    stage of its processing. '''
+
+    def __init__(self, url, response, content_type):
+        self.url = url
+        self.response = response
+        self.content_type = content_type
+        self.timings = {}
+        self._soup = None
+
+    @property
+    def status_code(self):
+        return self.response.status_code
+
+    @property
+    def headers(self):
+        return self.response.headers
+
+    @property
+    def content(self):
+        return self.response.content
+
+    def timed(self, stage):
+        return timed(stage, self)
+
+    def soup(self):
+        ''' The page parsed by BeautifulSoup (once). '''
+        if self._soup is None:
+            self.response.encoding = 'utf-8'
+            with self.timed('parse'):
+                self._soup = BeautifulSoup(self.response.text, "lxml")
+        return self._soup
+
+
+def fetch_page(url, types=INDEXABLE_TYPES):
+    ''' Retrieve a page with a single GET.
+    The body is only read for successful responses whose content
+    type is one of types; other responses are closed after their
+    first chunk.
+    '''
+    started = time()
+    resp = http_client.get(url, stream=True)
+    try:
+        chunks = resp.iter_content(http_client.CHUNK_SIZE)
+        head = next(chunks, b'')
+        content_type = sniff_content_type(resp.headers.get('Content-Type', ''), head)
+        if resp.status_code < 300 and any(t in content_type for t in types):
+            http_client.read_body(resp, chunks=chain([head], chunks))
+        else:
+            resp._content = b''
+    finally:
+        resp.close()
+    page = FetchedPage(url, resp, content_type)
+    _record('fetch', time() - started, page)
+    logger.debug("fetch_page: %s %s %s (%d bytes)", url, resp.status_code, content_type, len(resp.content))
+    return page
@@ -5,12 +5,11 @@
 import re
 import logging
 from urllib.parse import urljoin
-import requests
-from bs4 import BeautifulSoup
 import justext
 from langdetect import detect
 from flask import current_app
 from app import LANGUAGE_CODES
+from app.indexer.fetcher import fetch_page
 from app.utils import remove_emails
 
 logger = logging.getLogger(__name__)
@@ -31,43 +30,30 @@ def remove_boilerplates(response, lang):
             text += paragraph.text + " "
     return text
 
-def BS_parse(url):
+def BS_parse(url, page=None):
+    """ Parse an HTML page with BeautifulSoup, fetching it
+    unless the FetchedPage is given.
+    """
     bs_obj = None
-    req = None
-    headers = {'User-Agent': current_app.config['USER-AGENT']}
-    try:
-        req = requests.head(url, timeout=30, headers=headers)
-    except Exception:
-        logger.error("BS_parse: request.head failed trying to access %s", url)
-        return bs_obj, req
-    if "text/html" not in req.headers.get("content-type", ""):
+    if page is None:
+        try:
+            page = fetch_page(url)
+        except Exception:
+            logger.error("BS_parse: request failed trying to access %s", url)
+            return bs_obj, page
+    if page.status_code >= 400:
+        logger.error("BS_parse: status code is %s", page.status_code)
+        return bs_obj, page
+    if "text/html" not in page.content_type:
         logger.error("BS_parse: Not a HTML document...")
-        return bs_obj, req
-    try:
-        req = requests.get(url, allow_redirects=True, timeout=30, headers=headers)
-        req.encoding = 'utf-8'
-    except Exception:
-        logger.error("BS_parse: request failed trying to access %s", url)
-        return bs_obj, req
-    bs_obj = BeautifulSoup(req.text, "lxml")
-    return bs_obj, req
+        return bs_obj, page
+    bs_obj = page.soup()
+    return bs_obj, page
 
 
-def extract_links(url):
+def extract_links(url, page=None):
     links = []
-    headers = {'User-Agent': current_app.config['USER-AGENT']}
-    try:
-        req = requests.head(url, timeout=30, headers=headers)
-        if req.status_code >= 400:
-            logger.error("extract_links: status code is %s", req.status_code)
-            return links
-        if "text/html" not in req.headers["content-type"]:
-            logger.error("Not a HTML document...")
-            return links
-    except Exception:
-        logger.error("extract_links: request.head failed trying to access %s", url)
-        return links
-    bs_obj, req = BS_parse(url)
+    bs_obj, page = BS_parse(url, page)
     if not bs_obj:
         return links
     hrefs = bs_obj.findAll('a', href=True)
@@ -112,12 +98,14 @@ def process_body_string(req, bs_obj, title):
     logger.info("OG desc: %s", og_description)
     tmp_body_str = naive_text_extract(bs_obj)
     try:
-        language = detect(title + " " + tmp_body_str)
+        with req.timed('langdetect'):
+            language = detect(title + " " + tmp_body_str)
     except:
         language = current_app.config['LANGS'][0]
     try:
         if language in current_app.config['LANGS']:
-            body_str = remove_boilerplates(req, language)
+            with req.timed('boilerplate'):
+                body_str = remove_boilerplates(req, language)
         else:
             if og_description:
                 body_str = ' '.join(og_description['content'].split()[:100])+' '
@@ -131,9 +119,9 @@ def process_body_string(req, bs_obj, title):
     return body_str, og_description
 
 
-def extract_html(url):
+def extract_html(url, page=None):
     '''From history info, extract url, title and body of page,
-    cleaned with BeautifulSoup'''
+    cleaned with BeautifulSoup (from the FetchedPage if given)'''
     title = ""
     body_str = ""
     snippet = ""
@@ -141,7 +129,7 @@ def extract_html(url):
     error = None
     language = current_app.config['LANGS'][0]
     snippet_length = current_app.config['SNIPPET_LENGTH']
-    bs_obj, req = BS_parse(url)
+    bs_obj, req = BS_parse(url, page)
     if not bs_obj:
         error = "extract_html: Failed to get BeautifulSoup object."
         return title, body_str, language, snippet, cc, error
@@ -150,7 +138,8 @@ def extract_html(url):
             title = process_page_title(bs_obj, snippet_length)
             body_str, og_description = process_body_string(req, bs_obj, title)
             try:
-                language = detect(title + " " + body_str)
+                with req.timed('langdetect'):
+                    language = detect(title + " " + body_str)
                 logger.info("Language for %s: %s", url, language)
             except Exception:
                 title = ""
@@ -0,0 +1,221 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>,
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+''' Queue of url indexing jobs, run in the background.
+
+Jobs are stored in a small SQLite database in the pods directory, so
+that they are shared by all workers of an instance and survive
+restarts. Each process runs INDEX_WORKERS threads that claim queued
+jobs: retrieving, parsing and vectorizing pages runs concurrently,
+only the write to a pod is serialized (see pod_lock). A job that was
+claimed more than INDEX_JOB_LEASE seconds ago without finishing
+(e.g. because its process was stopped) is claimed again, at most
+INDEX_JOB_ATTEMPTS times. Jobs queued for a suggestion record
+their outcome in its notes.
+'''
+
+import logging
+import fcntl
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager, ExitStack
+from hashlib import sha1
+from os import getenv, getpid
+from os.path import dirname, join, realpath
+from pathlib import Path
+from time import sleep, time
+
+logger = logging.getLogger(__name__)
+
+dir_path = dirname(dirname(realpath(__file__)))
+pod_dir = getenv("PODS_DIR", join(dir_path, 'pods'))
+queue_path = join(pod_dir, '.index_queue.db')
+lock_dir = join(pod_dir, '.pod_locks')
+
+INDEX_WORKERS = int(getenv("INDEX_WORKERS", "2"))
+INDEX_JOB_LEASE = float(getenv("INDEX_JOB_LEASE", "600"))
+INDEX_JOB_ATTEMPTS = int(getenv("INDEX_JOB_ATTEMPTS", "3"))
+INDEX_JOBS_KEPT = 1000
+POLL_INTERVAL = 5
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+_local = threading.local()
+_wakeup = threading.Event()
+_workers_lock = threading.Lock()
+_workers_pid = None
+
+
+def _connection():
+    ''' One connection per thread (and per process, as
+    connections must not be shared across a fork). '''
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == getpid():
+        return conn
+    Path(pod_dir).mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(queue_path, timeout=10, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'url TEXT, theme TEXT, notes TEXT, contributor TEXT, host_url TEXT, status TEXT, '
+            'attempts INTEGER, messages TEXT, share_url TEXT, created REAL, started REAL, finished REAL, '
+            'suggestion INTEGER)')
+    conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)')
+    _local.conn = conn
+    _local.pid = getpid()
+    return conn
+
+
+def _as_dict(row):
+    job = dict(row)
+    job['messages'] = json.loads(job['messages'])
+    return job
+
+
+def enqueue(url, theme, notes, contributor, host_url, suggestion=None):
+    ''' Add a url to the queue (suggestion is the id of the
+    suggestion it indexes, if any). Returns: the id of the job. '''
+    cur = _connection().execute('INSERT INTO jobs (url, theme, notes, contributor, host_url, status, '
+            'attempts, messages, created, suggestion) VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?)',
+            (url, theme, notes, contributor, host_url, QUEUED, '[]', time(), suggestion))
+    _wakeup.set()
+    return cur.lastrowid
+
+
+def get_job(job_id):
+    row = _connection().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return None if row is None else _as_dict(row)
+
+
+def recent_jobs(limit=100):
+    ''' The last jobs, most recent first. '''
+    rows = _connection().execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+    return [_as_dict(row) for row in rows]
+
+
+def counts():
+    ''' Number of jobs in each status. '''
+    rows = _connection().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+    return {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)} | dict(rows)
+
+
+def claim(gave_up=None):
+    ''' Take the oldest queued job (or one whose lease expired).
+    gave_up is called with each job given up on along the way, as it
+    was claimed INDEX_JOB_ATTEMPTS times already.
+    Returns: the job, or None if there is nothing to do.
+    '''
+    conn = _connection()
+    now = time()
+    job = None
+    dropped = []
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        while True:
+            row = conn.execute('SELECT * FROM jobs WHERE status = ? OR (status = ? AND started < ?) '
+                    'ORDER BY id LIMIT 1', (QUEUED, RUNNING, now - INDEX_JOB_LEASE)).fetchone()
+            if row is None:
+                break
+            if row['attempts'] >= INDEX_JOB_ATTEMPTS:
+                logger.warning("Giving up on indexing job %d (%s)", row['id'], row['url'])
+                messages = ["Indexing was interrupted too many times."]
+                conn.execute('UPDATE jobs SET status = ?, finished = ?, messages = ? WHERE id = ?',
+                        (FAILED, now, json.dumps(messages), row['id']))
+                dropped.append(_as_dict(row) | {'status': FAILED, 'messages': messages})
+                continue
+            conn.execute('UPDATE jobs SET status = ?, started = ?, attempts = attempts + 1 WHERE id = ?',
+                    (RUNNING, now, row['id']))
+            job = _as_dict(row)
+            break
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    if gave_up is not None:
+        for dropped_job in dropped:
+            gave_up(dropped_job)
+    return job
+
+
+def finish(job_id, success, messages, share_url=''):
+    conn = _connection()
+    conn.execute('UPDATE jobs SET status = ?, finished = ?, messages = ?, share_url = ? WHERE id = ?',
+            (DONE if success else FAILED, time(), json.dumps(messages), share_url, job_id))
+    conn.execute('DELETE FROM jobs WHERE status IN (?, ?) AND id IN (SELECT id FROM jobs '
+            'ORDER BY id DESC LIMIT -1 OFFSET ?)', (DONE, FAILED, INDEX_JOBS_KEPT))
+
+
+@contextmanager
+def pod_lock(*pod_names):
+    ''' Hold the write lock of some pods (across threads and processes).
+    Anything changing the rows of a pod, or the row numbers of its urls
+    in the database, must hold it until the database is committed.
+    Locks are taken in name order, so that writers touching several
+    pods cannot deadlock.
+    '''
+    Path(lock_dir).mkdir(parents=True, exist_ok=True)
+    with ExitStack() as stack:
+        for pod_name in sorted(set(pod_names)):
+            f = stack.enter_context(open(join(lock_dir, sha1(pod_name.encode('utf-8')).hexdigest()), 'a'))
+            fcntl.flock(f, fcntl.LOCK_EX)
+            stack.callback(fcntl.flock, f, fcntl.LOCK_UN)
+        yield
+
+
+def _note_suggestion(job, success, messages):
+    ''' Record the outcome of a job in its suggestion, if it has one
+    (in an app context). '''
+    if job.get('suggestion') is None:
+        return
+    from app.indexer.controllers import note_suggestion_job
+    note_suggestion_job(job, success, messages)
+
+
+def run_job(job):
+    ''' Index the url of a job (in an app context). '''
+    from app.indexer.controllers import fetch_url_page, store_url_page
+    logger.info("Indexing job %d: %s", job['id'], job['url'])
+    share_url = ''
+    try:
+        page, messages = fetch_url_page(job['url'], job['contributor'])
+        if page is not None:
+            share_url = store_url_page(page, job['theme'], job['notes'], job['contributor'], job['host_url'])
+    except Exception as e:
+        logger.exception("Indexing job %d failed", job['id'])
+        page, messages = None, [f"Unexpected error: {e}"]
+    finish(job['id'], page is not None, messages, share_url)
+    _note_suggestion(job, page is not None, messages)
+
+
+def _work(app):
+    def gave_up(job):
+        with app.app_context():
+            _note_suggestion(job, False, job['messages'])
+
+    while True:
+        try:
+            job = claim(gave_up)
+            if job is None:
+                _wakeup.wait(POLL_INTERVAL)
+                _wakeup.clear()
+                continue
+            with app.app_context():
+                run_job(job)
+        except Exception:
+            # A job left running is claimed again when its lease expires
+            logger.exception("Indexing worker error")
+            sleep(POLL_INTERVAL)
+
+
+def start_workers(app):
+    ''' Start the worker threads of this process (once). '''
+    global _workers_pid
+    with _workers_lock:
+        if _workers_pid == getpid() or INDEX_WORKERS <= 0:
+            return
+        _workers_pid = getpid()
+    for i in range(INDEX_WORKERS):
+        threading.Thread(target=_work, args=(app,), name=f'index-worker-{i}', daemon=True).start()
+    logger.info("Started %d indexing workers", INDEX_WORKERS)
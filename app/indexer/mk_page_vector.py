@@ -6,55 +6,75 @@ import logging
 from os.path import dirname, join, realpath
 from os import getenv
 import numpy as np
-from scipy.sparse import csr_matrix, vstack, save_npz, load_npz
 from flask import current_app
 import app as app_module
-from app.api.models import sp
+from app.api.models import get_tokenizer
 from app.indexer.htmlparser import extract_html
 from app.indexer.pdfparser import extract_txt
+from app.indexer.pod_store import append_to_pod
 from app.indexer.vectorizer import vectorize_scale
 from app.utils import timer
-from app.utils_db import create_pod_npz_pos
 
 dir_path = dirname(dirname(realpath(__file__)))
 pod_dir = getenv("PODS_DIR", join(dir_path, 'pods'))
 logger = logging.getLogger(__name__)
 
 def tokenize_text(text, lang, stringify = True):
-    """ Load the SentencePiece model included in the install
-    and tokenize the given text.
+    """ Tokenize the given text with the SentencePiece
+    model of the language.
 
     Arguments: the text to be tokenized.
     """
-    sp.load(join(app_module.DEFAULT_PATH, f'api/models/{lang}/{lang}wiki.16k.model'))
-    tokens = [wp for wp in sp.encode_as_pieces(text.lower())]
+    tokens = get_tokenizer(lang).encode(text.lower(), out_type=str)
     if stringify:
-        text = ' '.join([wp for wp in sp.encode_as_pieces(text.lower())])
-        #print("TOKENIZED",text)
-        #print([(t, logprobs[vocab[t]]) for t in text.split()])
-        return text
+        return ' '.join(tokens)
     return tokens
 
 
-def compute_and_stack_new_vec(lang, tokenized_text, pod_m):
-    """ Given the tokenized text, compute a new vector
-    and stack it onto the existing matrix for that pod.
+def tokenize_words(words, lang):
+    """ Tokenize a list of words in a single call
+    to the SentencePiece model of the language.
+
+    Returns: one list of wordpieces per word.
+    """
+    return get_tokenizer(lang).encode([w.lower() for w in words], out_type=str)
+
+
+def compute_new_vec(lang, tokenized_text):
+    """ Given the tokenized text, compute its document vector. """
+    return vectorize_scale(lang, tokenized_text, 5, app_module.VEC_SIZE) #log prob power 5
+
+
+def append_new_vec(v, npz_path):
+    """ Append a document vector to the matrix of a pod.
+
+    Returns: the row number of the new vector (None
+    if the vector is empty).
     """
-    v = vectorize_scale(lang, tokenized_text, 5, app_module.VEC_SIZE) #log prob power 5
     if np.sum(v) != 0:
-        logger.debug("compute_and_stack_new_vec before: %s", pod_m.shape[0])
-        pod_m = vstack((pod_m,csr_matrix(v)))
-        logger.debug("compute_and_stack_new_vec after: %s", pod_m.shape[0])
-        return pod_m, True
-    return pod_m, False
+        idv = append_to_pod(npz_path, v)
+        logger.debug("append_new_vec: new row %s", idv)
+        return idv
+    return None
+
 
+def compute_and_append_new_vec(lang, tokenized_text, npz_path):
+    """ Given the tokenized text, compute a new vector
+    and append it to the matrix for that pod.
 
-def compute_vector(url, theme, contributor, url_type):
-    """ Compute vector for target URL. This includes retrieving the
-    page, extracting the title and text from it, and adding the 
-    document vector to the matrix for the user's chosen theme.
+    Returns: the row number of the new vector (None
+    if the text produced an empty vector) and the vector.
     """
-    logger.info("Computing vector for %s (%s)", url, theme)
+    v = compute_new_vec(lang, tokenized_text)
+    return append_new_vec(v, npz_path), v
+
+
+def parse_page(page, contributor):
+    """ Extract the title and text of a FetchedPage,
+    tokenized in the language of the page.
+    """
+    url, url_type = page.url, page.content_type
+    logger.info("Parsing page %s", url)
     messages = []
     logger.debug("Content type: %s", url_type)
     lang = current_app.config['LANGS'][0]
@@ -62,25 +82,32 @@ def compute_vector(url, theme, contributor, url_type):
     body_str = ''
     snippet = ''
     if 'text/html' in url_type:
-        title, body_str, lang, snippet, cc, error = extract_html(url)
+        title, body_str, lang, snippet, cc, error = extract_html(url, page)
     elif 'application/pdf' in url_type:
-        title, body_str, lang, snippet, cc, error = extract_txt(url, contributor)
+        title, body_str, lang, snippet, cc, error = extract_txt(url, contributor, page)
     else:
         error = "compute_vectors: No supported content type."
     if error is None:
         logger.info("title=%s snippet=%s error=%s", title, snippet, error)
-        create_pod_npz_pos(contributor, theme, lang)
-        user_dir = join(pod_dir, contributor, lang)
-        npz_path = join(user_dir,theme+'.u.'+contributor+'.npz')
-        pod_m = load_npz(npz_path)
         text = title + " " + body_str
-        tokenized_text = tokenize_text(text, lang)
-        pod_m, success = compute_and_stack_new_vec(lang, tokenized_text, pod_m)
-        if success:
-            save_npz(npz_path,pod_m)
-            idv = pod_m.shape[0]-1
-            return True, tokenized_text, lang, title, snippet, idv, messages
+        with page.timed('tokenize'):
+            tokenized_text = tokenize_text(text, lang)
+        return True, tokenized_text, lang, title, snippet, messages
     messages.append("compute_vectors: error during parsing")
+    return False, None, None, None, None, messages
+
+
+def compute_page(page, contributor):
+    """ Extract the title and text of a FetchedPage and compute
+    its document vector, without writing anything to the pods.
+    """
+    success, tokenized_text, lang, title, snippet, messages = parse_page(page, contributor)
+    if success:
+        with page.timed('vectorize'):
+            v = compute_new_vec(lang, tokenized_text)
+        if np.sum(v) != 0:
+            return True, tokenized_text, lang, title, snippet, v, messages
+        messages.append("compute_vectors: error during parsing")
     return False, None, None, None, None, None, messages
 
 
@@ -91,20 +118,17 @@ def compute_vector_local_docs(title, doc, theme, lang, contributor):
     logger.debug("Computing vector for local doc: %s", title)
     user_dir = join(pod_dir, contributor, lang)
     npz_path = join(user_dir,theme+'.u.'+contributor+'.npz')
-    pod_m = load_npz(npz_path)
     #print("Computing vectors for", target_url, "(",theme,")",lang)
     text = title + ". " + theme + ". " + doc
     text = tokenize_text(text, lang)
-    pod_m, success = compute_and_stack_new_vec(lang, text, pod_m)
+    vid, v = compute_and_append_new_vec(lang, text, npz_path)
     if doc != "":
         snippet = doc
     else:
         snippet = title
-    if success:
-        save_npz(npz_path,pod_m)
-        vid = pod_m.shape[0]-1
-        return True, text, snippet, vid
-    return False, text, snippet, None
+    if vid is not None:
+        return True, text, snippet, vid, v
+    return False, text, snippet, None, None
 
 def compute_query_vectors(query, lang, expansion_length=None):
     """ Make query vectors: the vector for the original
@@ -119,9 +143,7 @@ def compute_query_vectors(query, lang, expansion_length=None):
     logger.debug("Query split: %s", words)
 
     # Individual words tokenized
-    words_tokenized = []
-    for w in words:
-        words_tokenized.append(tokenize_text(w, lang, stringify=False))
+    words_tokenized = tokenize_words(words, lang)
     logger.debug("Words tokenized: %s", words_tokenized)
 
     # Add similar tokens
@@ -8,7 +8,8 @@ from shutil import which
 from os import remove
 from os.path import join, dirname, realpath
 from urllib.parse import urljoin
-import requests
+from app import http_client
+from app.indexer.fetcher import timed
 from pdfminer.high_level import extract_pages
 from pdfminer import pdfparser, pdfdocument
 from langdetect import detect
@@ -50,9 +51,9 @@ def pdf_mine(pdf_path, max_pages = 12):
 
 
 
-def extract_txt(url, contributor):
+def extract_txt(url, contributor, page=None):
     '''From history info, extract url, title and body of page,
-    cleaned with pdfminer'''
+    cleaned with pdfminer (from the FetchedPage if given)'''
     title = ""
     body_str = ""
     snippet = ""
@@ -62,15 +63,17 @@ def extract_txt(url, contributor):
     snippet_length = current_app.config['SNIPPET_LENGTH']
     local_pdf_path = join(app_dir_path, 'userdata', contributor+'.'+url.split('/')[-1])
     try:
-        req = requests.get(url, allow_redirects=True, timeout=30)
-        req.encoding = 'utf-8'
-        with open(local_pdf_path,'wb') as f_out:
-            f_out.write(req.content)
+        if page is not None:
+            with open(local_pdf_path, 'wb') as f:
+                f.write(page.content)
+        else:
+            http_client.download(url, local_pdf_path)
     except Exception:
         logger.error("Accessing resource %s ...", url)
         return title, body_str, language, snippet, cc, error
     try:
-        body_str, title = pdf_mine(local_pdf_path)
+        with timed('pdf', page):
+            body_str, title = pdf_mine(local_pdf_path)
         body_str = remove_emails(body_str)
     except Exception:
         logger.error("Extracting body text from pdf...")
@@ -0,0 +1,275 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>,
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+''' Append-friendly storage for pod matrices.
+
+A pod is stored as a compressed CSR base file (<pod>.npz, readable
+with scipy's load_npz) plus an append log (<pod>.npz.log) holding the
+rows added since the last compaction. Appending a row writes a single
+record at the end of the log; once the log holds POD_COMPACT_ROWS
+rows, it is folded into the base file.
+
+The base file records the id of the log it has absorbed, so that a
+crash between rewriting the base and resetting the log never
+duplicates rows. Existing .npz pods are valid base files and need no
+conversion.
+'''
+
+import logging
+import fcntl
+from os import getenv, remove, rename, replace
+from os.path import isfile
+from contextlib import contextmanager
+from uuid import uuid4
+import numpy as np
+from scipy.sparse import csr_matrix, load_npz, vstack
+
+logger = logging.getLogger(__name__)
+
+COMPACT_ROWS = int(getenv("POD_COMPACT_ROWS", "256"))
+LOG_MAGIC = b'PEARSLOG'
+LOG_HEADER_SIZE = len(LOG_MAGIC) + 16
+
+
+def pod_log_path(npz_path):
+    return npz_path + '.log'
+
+
+@contextmanager
+def _locked_log(npz_path, exclusive=True):
+    ''' Open the append log of a pod and hold a lock on it for the
+    duration of the block. Writers (exclusive) create the log of an
+    existing pod if needed; readers open it read-only, and get None
+    if the pod has no log (see _read_log).
+    '''
+    if exclusive and not isfile(npz_path):
+        raise FileNotFoundError(f"No pod at {npz_path}")
+    try:
+        f = open(pod_log_path(npz_path), 'a+b' if exclusive else 'rb')
+    except FileNotFoundError:
+        if exclusive:
+            raise
+        f = None
+    if f is None:
+        # Nothing was ever appended to the base file
+        yield None
+        return
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield f
+    finally:
+        fcntl.flock(f, fcntl.LOCK_UN)
+        f.close()
+
+
+def _decode_log_id(a):
+    ''' The log id stored in a base file: bytes are stored as a
+    uint8 array, because numpy bytes arrays drop trailing NULs. '''
+    if a.dtype == np.uint8:
+        return a.tobytes()
+    # Base files written as a numpy bytes scalar
+    return a.item()
+
+
+def _read_base(npz_path, header_only=False):
+    ''' Read the base file of a pod.
+    Returns: the CSR matrix (None if header_only), its shape
+    and the id of the append log already folded into it.
+    '''
+    with np.load(npz_path) as loaded:
+        shape = tuple(int(i) for i in loaded['shape'])
+        log_id = _decode_log_id(loaded['log_id']) if 'log_id' in loaded.files else None
+        if header_only:
+            return None, shape, log_id
+        sparse_format = loaded['format'].item()
+        if sparse_format in (b'csr', 'csr'):
+            m = csr_matrix((loaded['data'], loaded['indices'], loaded['indptr']), shape=shape)
+            return m, shape, log_id
+    # Older pods may have been saved in another sparse format
+    return load_npz(npz_path).tocsr(), shape, log_id
+
+
+def _write_base(npz_path, m, log_id=None):
+    ''' Atomically replace the base file of a pod. '''
+    m = csr_matrix(m)
+    tmp_path = npz_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, indices=m.indices, indptr=m.indptr,
+                format=b'csr', shape=m.shape, data=m.data,
+                log_id=np.frombuffer(log_id or b'', dtype=np.uint8))
+    replace(tmp_path, npz_path)
+
+
+def _read_log(f):
+    ''' Parse the append log.
+    Returns: the log id (None for an empty or missing log) and
+    the list of (indices, data) rows it contains.
+    '''
+    if f is None:
+        return None, []
+    f.seek(0)
+    buf = f.read()
+    if len(buf) < LOG_HEADER_SIZE or buf[:len(LOG_MAGIC)] != LOG_MAGIC:
+        return None, []
+    log_id = buf[len(LOG_MAGIC):LOG_HEADER_SIZE]
+    rows = []
+    pos = LOG_HEADER_SIZE
+    while pos + 4 <= len(buf):
+        nnz = int(np.frombuffer(buf, dtype='<i4', count=1, offset=pos)[0])
+        end = pos + 4 + 12 * nnz
+        if end > len(buf):
+            logger.warning("pod_store: ignoring truncated record at the end of %s", f.name)
+            break
+        indices = np.frombuffer(buf, dtype='<i4', count=nnz, offset=pos + 4)
+        data = np.frombuffer(buf, dtype='<f8', count=nnz, offset=pos + 4 + 4 * nnz)
+        rows.append((indices, data))
+        pos = end
+    return log_id, rows
+
+
+def _reset_log(f):
+    f.truncate(0)
+    f.write(LOG_MAGIC + uuid4().bytes)
+    f.flush()
+
+
+def _rows_to_csr(rows, num_cols):
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(indices) for indices, _ in rows])
+    indices = np.concatenate([r[0] for r in rows]).astype(np.int32)
+    data = np.concatenate([r[1] for r in rows])
+    return csr_matrix((data, indices, indptr), shape=(len(rows), num_cols))
+
+
+def _load_locked(npz_path, f):
+    m, shape, base_log_id = _read_base(npz_path)
+    log_id, rows = _read_log(f)
+    if log_id is None or log_id == base_log_id or len(rows) == 0:
+        return m, log_id
+    return vstack([m, _rows_to_csr(rows, shape[1])], format='csr'), log_id
+
+
+def _create_pod(npz_path, m):
+    _write_base(npz_path, m)
+    log_path = pod_log_path(npz_path)
+    if isfile(log_path):
+        remove(log_path)
+
+
+def create_pod_matrix(npz_path, num_cols):
+    ''' Initialise a pod with a single zero row
+    (document ids in the database start at 1).
+    '''
+    _create_pod(npz_path, csr_matrix((1, num_cols)))
+
+
+def load_pod_matrix(npz_path):
+    ''' Return the full CSR matrix of a pod
+    (base file plus appended rows).
+    '''
+    with _locked_log(npz_path, exclusive=False) as f:
+        m, _ = _load_locked(npz_path, f)
+    return m
+
+
+def pod_num_rows(npz_path):
+    ''' Number of rows in a pod, without loading its data. '''
+    with _locked_log(npz_path, exclusive=False) as f:
+        _, shape, base_log_id = _read_base(npz_path, header_only=True)
+        log_id, rows = _read_log(f)
+    if log_id is None or log_id == base_log_id:
+        return shape[0]
+    return shape[0] + len(rows)
+
+
+def _log_record(v):
+    row = csr_matrix(v)
+    indices = row.indices.astype('<i4')
+    data = row.data.astype('<f8')
+    return np.array([len(indices)], dtype='<i4').tobytes() + indices.tobytes() + data.tobytes()
+
+
+def append_to_pod(npz_path, v):
+    ''' Append a vector to a pod.
+    Arguments:
+    npz_path: the path to the pod's .npz file
+    v: the vector to append (dense 1 x n array or sparse row)
+
+    Returns: the row number of the new vector.
+    '''
+    return append_rows_to_pod(npz_path, [v])
+
+
+def append_rows_to_pod(npz_path, vs):
+    ''' Append several vectors to a pod, with a single write.
+    Returns: the row number of the first new vector (the others
+    follow it).
+    '''
+    records = b''.join(_log_record(v) for v in vs)
+    with _locked_log(npz_path) as f:
+        _, shape, base_log_id = _read_base(npz_path, header_only=True)
+        log_id, rows = _read_log(f)
+        if log_id is None or log_id == base_log_id:
+            _reset_log(f)
+            rows = []
+        f.write(records)
+        f.flush()
+        idv = shape[0] + len(rows)
+        if len(rows) + len(vs) >= COMPACT_ROWS:
+            _compact_locked(npz_path, f)
+    return idv
+
+
+def _compact_locked(npz_path, f):
+    m, log_id = _load_locked(npz_path, f)
+    _write_base(npz_path, m, log_id)
+    _reset_log(f)
+    return m
+
+
+def compact_pod(npz_path):
+    ''' Fold the append log of a pod into its base file. '''
+    with _locked_log(npz_path) as f:
+        m = _compact_locked(npz_path, f)
+    logger.debug("pod_store: compacted %s (%s rows)", npz_path, m.shape[0])
+    return m
+
+
+def save_pod_matrix(npz_path, m):
+    ''' Replace the whole content of a pod with matrix m
+    (creating the pod if needed). '''
+    if not isfile(npz_path):
+        _create_pod(npz_path, m)
+        return
+    with _locked_log(npz_path) as f:
+        log_id, _ = _read_log(f)
+        _write_base(npz_path, m, log_id)
+        _reset_log(f)
+
+
+def remove_from_pod(npz_path, vid):
+    ''' Remove row vid from a pod, shifting the following rows up.
+    Returns: the deleted vector.
+    '''
+    with _locked_log(npz_path) as f:
+        m, log_id = _load_locked(npz_path, f)
+        logger.debug("remove_from_pod: shape of npz matrix before rm: %s", m.shape)
+        v = m[vid]
+        m = vstack((m[:vid], m[vid+1:]), format='csr')
+        logger.debug("remove_from_pod: shape of npz matrix after rm: %s", m.shape)
+        _write_base(npz_path, m, log_id)
+        _reset_log(f)
+    return v
+
+
+def delete_pod_files(npz_path):
+    for path in [npz_path, pod_log_path(npz_path)]:
+        if isfile(path):
+            remove(path)
+
+
+def rename_pod_files(src_path, target_path):
+    rename(src_path, target_path)
+    if isfile(pod_log_path(src_path)):
+        rename(pod_log_path(src_path), pod_log_path(target_path))
@@ -0,0 +1,66 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>,
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+''' Politeness towards the hosts we fetch pages from, when
+many pages are fetched concurrently.
+'''
+
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from time import time
+from urllib.parse import urlparse
+
+
+def host_of(url):
+    return urlparse(url).netloc.lower()
+
+
+class HostLimiter:
+    ''' Lets at most max_concurrent requests run at a time
+    on each host, started at least delay seconds apart. '''
+
+    def __init__(self, max_concurrent=1, delay=1.0):
+        self.max_concurrent = max_concurrent
+        self.delay = delay
+        self._cond = threading.Condition()
+        self._active = defaultdict(int)
+        self._next_start = {}
+
+    @contextmanager
+    def slot(self, url, delay=None):
+        ''' Wait for a slot on the host of url. delay, if longer,
+        replaces the default delay (e.g. for a Crawl-delay). '''
+        host = host_of(url)
+        with self._cond:
+            while True:
+                wait = self._next_start.get(host, 0) - time()
+                if self._active[host] < self.max_concurrent and wait <= 0:
+                    break
+                self._cond.wait(wait if wait > 0 else None)
+            self._active[host] += 1
+            self._next_start[host] = time() + max(self.delay, delay or 0)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active[host] -= 1
+                self._cond.notify_all()
+
+
+def interleave_hosts(items, url=lambda item: item):
+    ''' Reorder items so that consecutive ones are on different
+    hosts where possible (round robin over hosts), so that workers
+    do not all wait on the same host. '''
+    by_host = defaultdict(deque)
+    for item in items:
+        by_host[host_of(url(item))].append(item)
+    queues = deque(by_host.values())
+    ordered = []
+    while queues:
+        q = queues.popleft()
+        ordered.append(q.popleft())
+        if q:
+            queues.append(q)
+    return ordered
@@ -2,23 +2,241 @@ import logging
 logger = logging.getLogger(__name__)
 import joblib
 from glob import glob
-from os import getenv
+from os import getenv, replace
 from os.path import join, dirname, realpath
+import numpy as np
 import app as app_module
-    
+
 dir_path = dirname(dirname(realpath(__file__)))
 pod_dir = getenv("PODS_DIR", join(dir_path, 'pods'))
 
+# Binary layout of a .pos file:
+#   magic (8 bytes) | version (uint32) | number of tokens V (uint32)
+#   number of tokens with postings E (uint32)
+#   token ids (uint32 x E, increasing) | offsets (int64 x E+1) | postings
+# The postings of the i-th listed token are the bytes offsets[i]:offsets[i+1],
+# a sequence of varints: number of docs, then for each doc (by increasing
+# id) the doc id delta, the number of positions and the position deltas.
+POSIX_MAGIC = b'PEARSPOS'
+POSIX_VERSION = 1
+_HEADER = np.dtype([('magic', 'S8'), ('version', '<u4'), ('num_tokens', '<u4'), ('num_entries', '<u4')])
+
+
+def _encode_varints(values, out):
+    for v in values:
+        while v >= 0x80:
+            out.append((v & 0x7f) | 0x80)
+            v >>= 7
+        out.append(v)
+
+
+def _decode_varints(buf):
+    values = []
+    v = 0
+    shift = 0
+    for b in buf:
+        v |= (b & 0x7f) << shift
+        if b & 0x80:
+            shift += 7
+        else:
+            values.append(v)
+            v = 0
+            shift = 0
+    return values
+
+
+def _encode_postings(postings):
+    ''' Encode a {doc_id: [positions]} dictionary. '''
+    out = bytearray()
+    if not postings:
+        return out
+    values = [len(postings)]
+    prev_doc = 0
+    for doc_id in sorted(postings):
+        positions = sorted(postings[doc_id])
+        values.append(doc_id - prev_doc)
+        values.append(len(positions))
+        prev_pos = 0
+        for p in positions:
+            values.append(p - prev_pos)
+            prev_pos = p
+        prev_doc = doc_id
+    _encode_varints(values, out)
+    return out
+
+
+def _decode_postings(buf):
+    postings = {}
+    if len(buf) == 0:
+        return postings
+    values = _decode_varints(bytes(buf))
+    i = 1
+    doc_id = 0
+    for _ in range(values[0]):
+        doc_id += values[i]
+        num_pos = values[i+1]
+        positions = np.cumsum(values[i+2:i+2+num_pos]).tolist()
+        postings[doc_id] = positions
+        i += 2 + num_pos
+    return postings
+
+
+class PosIndex:
+    ''' Positional index of a pod: for each vocabulary entry,
+    the documents containing it and the positions at which it occurs.
+
+    Postings are kept encoded (and memory-mapped when read from disk);
+    a token is only decoded when it is looked up or modified.
+    posindex[token_id] returns {doc_id: 'pos|pos|...'}, the format
+    of the former list-of-dicts index.
+    '''
+
+    def __init__(self, num_tokens, token_ids=None, offsets=None, blob=None):
+        self.num_tokens = num_tokens
+        if token_ids is None:
+            token_ids = np.zeros(0, dtype=np.uint32)
+            offsets = np.zeros(1, dtype=np.int64)
+            blob = np.zeros(0, dtype=np.uint8)
+        self.token_ids = token_ids
+        self.offsets = offsets
+        self.blob = blob
+        self.modified = {}  # token_id -> decoded postings, overriding the blob
+
+    @classmethod
+    def from_file(cls, path):
+        mm = np.memmap(path, dtype=np.uint8, mode='r')
+        header = np.frombuffer(mm, dtype=_HEADER, count=1)[0]
+        if header['magic'] != POSIX_MAGIC or header['version'] != POSIX_VERSION:
+            raise ValueError(f"{path} is not a positional index in the current format")
+        num_entries = int(header['num_entries'])
+        pos = _HEADER.itemsize
+        token_ids = np.frombuffer(mm, dtype='<u4', count=num_entries, offset=pos)
+        pos += token_ids.nbytes
+        offsets = np.frombuffer(mm, dtype='<i8', count=num_entries + 1, offset=pos)
+        pos += offsets.nbytes
+        return cls(int(header['num_tokens']), token_ids, offsets, mm[pos:])
+
+    @classmethod
+    def from_legacy(cls, legacy):
+        ''' Convert the former list of {doc_id: 'pos|pos'} dictionaries. '''
+        posindex = cls(len(legacy))
+        for token_id, docs in enumerate(legacy):
+            if docs:
+                posindex.modified[token_id] = {doc_id: [int(p) for p in str(positions).split('|')] \
+                        for doc_id, positions in docs.items()}
+        return posindex
+
+    def postings(self, token_id):
+        ''' Return {doc_id: [positions]} for a token. '''
+        if token_id in self.modified:
+            return self.modified[token_id]
+        return _decode_postings(self._encoded(token_id))
+
+    def _encoded(self, token_id):
+        i = np.searchsorted(self.token_ids, token_id)
+        if i == len(self.token_ids) or self.token_ids[i] != token_id:
+            return b''
+        return self.blob[self.offsets[i]:self.offsets[i + 1]]
+
+    def _listed_tokens(self):
+        return set(self.token_ids.tolist()) | set(self.modified)
+
+    def __getitem__(self, token_id):
+        return {doc_id: '|'.join(str(p) for p in positions) \
+                for doc_id, positions in self.postings(token_id).items()}
+
+    def __len__(self):
+        return self.num_tokens
+
+    def __iter__(self):
+        for token_id in range(self.num_tokens):
+            yield self[token_id]
+
+    def add_position(self, token_id, doc_id, pos):
+        if token_id not in self.modified:
+            self.modified[token_id] = self.postings(token_id)
+        self.modified[token_id].setdefault(doc_id, []).append(pos)
+
+    def delete_doc(self, doc_id):
+        ''' Remove a document from the index, only decoding
+        the tokens that have postings.
+        Returns: {token_id: [positions]} for the deleted document.
+        '''
+        deleted = {}
+        for token_id in self._listed_tokens():
+            postings = self.postings(token_id)
+            if doc_id in postings:
+                postings = dict(postings)
+                deleted[token_id] = postings.pop(doc_id)
+                self.modified[token_id] = postings
+        return deleted
+
+    def doc_ids(self):
+        docs = set()
+        for token_id in self._listed_tokens():
+            docs.update(self.postings(token_id).keys())
+        return docs
+
+    def save(self, path):
+        ''' Write the index to path (atomically). '''
+        token_ids = []
+        offsets = [0]
+        chunks = []
+        for token_id in sorted(self._listed_tokens()):
+            if token_id in self.modified:
+                chunk = bytes(_encode_postings(self.modified[token_id]))
+            else:
+                chunk = bytes(self._encoded(token_id))
+            if not chunk:
+                continue
+            token_ids.append(token_id)
+            chunks.append(chunk)
+            offsets.append(offsets[-1] + len(chunk))
+        header = np.array([(POSIX_MAGIC, POSIX_VERSION, self.num_tokens, len(token_ids))], dtype=_HEADER)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(header.tobytes())
+            f.write(np.array(token_ids, dtype='<u4').tobytes())
+            f.write(np.array(offsets, dtype='<i8').tobytes())
+            f.write(b''.join(chunks))
+        replace(tmp_path, path)
+
+
+def is_legacy_posix(path):
+    with open(path, 'rb') as f:
+        return f.read(len(POSIX_MAGIC)) != POSIX_MAGIC
+
+
+def read_posix_file(path):
+    ''' Load a positional index, converting legacy
+    (joblib list of dicts) files in memory. '''
+    if is_legacy_posix(path):
+        return PosIndex.from_legacy(joblib.load(path))
+    return PosIndex.from_file(path)
+
+
+def convert_posix_file(path):
+    ''' Rewrite a legacy .pos file in the compact format.
+    Returns: True if the file was converted.
+    '''
+    if not is_legacy_posix(path):
+        return False
+    PosIndex.from_legacy(joblib.load(path)).save(path)
+    return True
+
+
 def load_posix(contributor, lang, theme):
     posix_path = join(pod_dir, contributor, lang)
     pod_name = theme+'.u.'+contributor
-    posix = joblib.load(join(posix_path,pod_name+'.pos'))
+    posix = read_posix_file(join(posix_path,pod_name+'.pos'))
     return posix
 
 def dump_posix(posindex, contributor, lang, theme):
     posix_path = join(pod_dir, contributor, lang)
     pod_name = theme+'.u.'+contributor
-    joblib.dump(posindex, join(posix_path,pod_name+'.pos'))
+    if not isinstance(posindex, PosIndex):
+        posindex = PosIndex.from_legacy(posindex)
+    posindex.save(join(posix_path,pod_name+'.pos'))
 
 def posix_doc(text, doc_id, contributor, lang, theme):
     pod_name = theme+'.u.'+contributor
@@ -29,10 +247,7 @@ def posix_doc(text, doc_id, contributor, lang, theme):
             # tqdm.write(f"WARNING: token \"{token}\" not found in vocab")
             continue
         token_id = vocab[token]
-        if doc_id in posindex[token_id]:
-            posindex[token_id][doc_id] += f"|{pos}"
-        else:
-            posindex[token_id][doc_id] = f"{pos}"
+        posindex.add_position(token_id, doc_id, pos)
     dump_posix(posindex, contributor, lang, theme)
 
 def get_pod_sizes(pod_paths, lang):
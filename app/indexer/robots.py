@@ -0,0 +1,217 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>,
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+''' robots.txt rules of the sites we index, fetched once per site.
+
+Rules are parsed as in RFC 9309: the group of our User-Agent (or the
+'*' group) applies, '*' and '$' are supported in paths, and the
+longest matching rule wins, Allow winning ties. Crawl-delay is read
+too. A robots.txt answering 4xx allows everything; one answering 5xx
+disallows everything for ROBOTS_ERROR_TTL seconds.
+
+robots.txt files are kept for ROBOTS_CACHE_TTL seconds in a small
+SQLite database in the pods directory, shared by all workers and
+kept across restarts, and each process keeps the parsed rules of the
+ROBOTS_MEMORY_SIZE most recently used sites.
+'''
+
+import logging
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from os import getenv, getpid
+from os.path import dirname, join, realpath
+from pathlib import Path
+from time import time
+from urllib.parse import urlparse
+from flask import current_app, has_app_context
+from app import http_client
+from app.indexer.fetcher import timed
+
+logger = logging.getLogger(__name__)
+
+dir_path = dirname(dirname(realpath(__file__)))
+pod_dir = getenv("PODS_DIR", join(dir_path, 'pods'))
+cache_path = join(pod_dir, '.robots_cache.db')
+
+ROBOTS_CACHE_TTL = float(getenv("ROBOTS_CACHE_TTL", "86400"))
+ROBOTS_ERROR_TTL = float(getenv("ROBOTS_ERROR_TTL", "600"))
+ROBOTS_MEMORY_SIZE = 1000
+MAX_CRAWL_DELAY = 60
+
+_local = threading.local()
+_lock = threading.Lock()
+_rules = OrderedDict()
+
+
+class RobotRules:
+    ''' The rules of one robots.txt for one user agent. '''
+
+    def __init__(self, rules=(), crawl_delay=None, allow_all=False, disallow_all=False):
+        # (pattern length, allowed, compiled pattern), longest first
+        self.rules = sorted(rules, key=lambda rule: (-rule[0], not rule[1]))
+        self.crawl_delay = crawl_delay
+        self.allow_all = allow_all
+        self.disallow_all = disallow_all
+
+    def allowed(self, path):
+        if self.disallow_all:
+            return False
+        if self.allow_all or path == '/robots.txt':
+            return True
+        for _, allowed, pattern in self.rules:
+            if pattern.match(path):
+                return allowed
+        return True
+
+
+def _compile(path):
+    ''' Compile a robots.txt path pattern to a regex. '''
+    anchored = path.endswith('$')
+    if anchored:
+        path = path[:-1]
+    regex = '.*'.join(re.escape(part) for part in path.split('*'))
+    return re.compile(regex + ('$' if anchored else ''))
+
+
+def parse_robots(text, user_agent):
+    ''' Parse a robots.txt for a user agent (its product token,
+    e.g. 'pearsbot', matched exactly but case-insensitively). '''
+    agent = user_agent.lower()
+    groups = []
+    current = None
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if ':' not in line:
+            continue
+        key, value = (part.strip() for part in line.split(':', 1))
+        key = key.lower()
+        if key == 'user-agent':
+            if current is None or current['closed']:
+                current = {'agents': [], 'rules': [], 'crawl_delay': None, 'closed': False}
+                groups.append(current)
+            current['agents'].append(value.lower())
+            continue
+        if current is None:
+            continue
+        current['closed'] = True
+        if key in ('allow', 'disallow') and value:
+            current['rules'].append((len(value), key == 'allow', _compile(value)))
+        elif key == 'crawl-delay':
+            try:
+                current['crawl_delay'] = float(value)
+            except ValueError:
+                pass
+
+    # The groups naming our product token apply, or else the '*' groups
+    for wanted in (lambda a: a == agent, lambda a: a == '*'):
+        matching = [g for g in groups if any(wanted(a) for a in g['agents'])]
+        if matching:
+            delays = [g['crawl_delay'] for g in matching if g['crawl_delay'] is not None]
+            return RobotRules([rule for g in matching for rule in g['rules']], min(delays) if delays else None)
+    return RobotRules(allow_all=True)
+
+
+def _connection():
+    ''' One connection per thread (and per process, as
+    connections must not be shared across a fork). '''
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == getpid():
+        return conn
+    Path(pod_dir).mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(cache_path, timeout=5, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS robots (origin TEXT PRIMARY KEY, status INTEGER, '
+            'body TEXT, fetched REAL)')
+    _local.conn = conn
+    _local.pid = getpid()
+    return conn
+
+
+def _ttl(status):
+    return ROBOTS_ERROR_TTL if status >= 500 else ROBOTS_CACHE_TTL
+
+
+def _user_agent():
+    if has_app_context():
+        return current_app.config['USER-AGENT'].split('/')[0].strip()
+    return '*'
+
+
+def _to_rules(status, body):
+    if status >= 500:
+        return RobotRules(disallow_all=True)
+    if status >= 400:
+        return RobotRules(allow_all=True)
+    return parse_robots(body, _user_agent())
+
+
+def _load(origin):
+    try:
+        row = _connection().execute('SELECT status, body, fetched FROM robots WHERE origin = ?', (origin,)).fetchone()
+    except sqlite3.Error as e:
+        logger.warning("robots.txt cache unavailable: %s", e)
+        return None
+    if row is None or time() - row[2] >= _ttl(row[0]):
+        return None
+    return row
+
+
+def _fetch(origin):
+    ''' Fetch the robots.txt of a site (network errors are raised). '''
+    with timed('robots'):
+        resp = http_client.get(origin + '/robots.txt')
+    status, body = resp.status_code, resp.text if resp.status_code < 300 else ''
+    if status >= 300:
+        # Redirects that were not followed count as unavailable
+        status = max(status, 400)
+    fetched = time()
+    try:
+        _connection().execute('INSERT OR REPLACE INTO robots VALUES (?, ?, ?, ?)', (origin, status, body, fetched))
+        _connection().execute('DELETE FROM robots WHERE fetched < ?', (fetched - ROBOTS_CACHE_TTL,))
+    except sqlite3.Error as e:
+        logger.warning("robots.txt cache unavailable: %s", e)
+    return status, body, fetched
+
+
+def origin_of(url):
+    parsed = urlparse(url)
+    return parsed.scheme + '://' + parsed.netloc.lower()
+
+
+def get_rules(url):
+    ''' The robots.txt rules for url (fetched if not cached). '''
+    origin = origin_of(url)
+    now = time()
+    with _lock:
+        cached = _rules.get(origin)
+        if cached is not None and now < cached[0]:
+            _rules.move_to_end(origin)
+            return cached[1]
+    row = _load(origin) or _fetch(origin)
+    status, body, fetched = row
+    rules = _to_rules(status, body)
+    with _lock:
+        _rules[origin] = (fetched + _ttl(status), rules)
+        _rules.move_to_end(origin)
+        while len(_rules) > ROBOTS_MEMORY_SIZE:
+            _rules.popitem(last=False)
+    return rules
+
+
+def can_fetch(url):
+    parsed = urlparse(url)
+    path = (parsed.path or '/') + ('?' + parsed.query if parsed.query else '')
+    return get_rules(url).allowed(path)
+
+
+def crawl_delay(url):
+    ''' The Crawl-delay of the site of url, in seconds (0 if none,
+    or if its robots.txt cannot be fetched). '''
+    try:
+        delay = get_rules(url).crawl_delay
+    except Exception:
+        return 0
+    return min(delay, MAX_CRAWL_DELAY) if delay else 0
@@ -1,60 +1,131 @@
-# SPDX-FileCopyrightText: 2022 PeARS Project, <community@pearsproject.org>, 
+# SPDX-FileCopyrightText: 2022 PeARS Project, <community@pearsproject.org>,
 #
 # SPDX-License-Identifier: AGPL-3.0-only
 
-'''Spider code, heavily influenced by http://www.netinstructions.com/how-to-make-a-web-crawler-in-under-50-lines-of-python-code/.'''
+''' Crawler following the links of a site, to find pages to index.
+
+Pages are fetched by a bounded number of concurrent workers, with
+the per-host limits of politeness.HostLimiter and the rules (and
+Crawl-delay) of robots.txt. The frontier is a queue of (url, depth)
+pairs, and every url is normalized before it is queued, so that a
+page is fetched at most once. Crawling stops after max_pages pages
+or when no link up to max_depth clicks from the start url is left.
+
+Each fetched page is handed to a process function in the worker
+that fetched it (e.g. to parse it for indexing, see
+indexer.controllers.fetch_url_page), so it is never requested again.
+'''
 
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit, urlunsplit
+from flask import current_app, has_app_context
+from app.indexer import robots
+from app.indexer.fetcher import fetch_page
+from app.indexer.htmlparser import extract_links
+from app.indexer.politeness import HostLimiter
+
 logger = logging.getLogger(__name__)
-from html.parser import HTMLParser
-from urllib.request import urlopen
-from urllib import parse
-
-'''LinkParser inherits from HTMLParser'''
-class LinkParser(HTMLParser):
-
-    def handle_starttag(self, tag, attrs):
-        '''Extending HTMLParser's function'''
-        if tag == 'a':
-            for (key, value) in attrs:
-                if key == 'href':
-                    new_url = parse.urljoin(self.base, value)
-                    self.links = self.links + [new_url]
-
-    def getLinks(self, url):
-        '''New function not in HTMLParser'''
-        self.links = []
-        self.base = url
-        response = urlopen(url)
-        if 'text/html' in response.getheader('Content-Type'):
-            htmlBytes = response.read()
-            # Note that feed() handles Strings well, but not bytes
-            # (A change from Python 2.x to Python 3.x)
-            htmlString = htmlBytes.decode("utf-8")
-            self.feed(htmlString)
-            return htmlString, self.links
-        else:
-            return "",[]
-
-def get_links(base_url, max_pages):  
-    pages_to_visit = [base_url]
-    pages_visited = []
-    number_visited = 0
-    while number_visited < max_pages and pages_to_visit != []:
-        number_visited+=1
-        # Start from base url
-        url = pages_to_visit[0]
-        if not url.startswith(base_url):
-            continue
-        pages_visited.append(url)
-        pages_to_visit = pages_to_visit[1:]
-        try:
-            logger.info("%d Scraping: %s", number_visited, url)
-            parser = LinkParser()
-            data, links = parser.getLinks(url)
-            for link in links:
-                if link not in pages_visited and link not in pages_to_visit and '#' not in link and base_url in link:
-                    pages_to_visit.append(link)
-        except:
-            logger.error("Failed visiting current url")
-    return pages_visited
+
+DEFAULT_PORTS = {'http': ':80', 'https': ':443'}
+
+
+def normalize_url(url):
+    ''' The canonical form of a url (lowercase scheme and host, no
+    default port, no fragment, '/' for an empty path), or None if
+    it is not an http(s) url. '''
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.netloc:
+        return None
+    netloc = parts.netloc.lower()
+    if netloc.endswith(DEFAULT_PORTS[scheme]):
+        netloc = netloc[:-len(DEFAULT_PORTS[scheme])]
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+def _visit(url, limiter, process):
+    ''' Fetch a page (if robots.txt allows it).
+    Returns: the links of the page and the result of process
+    (None for pages that could not be fetched).
+    '''
+    if not robots.can_fetch(url):
+        logger.info("crawl: %s is disallowed by robots.txt", url)
+        return [], None
+    with limiter.slot(url, robots.crawl_delay(url)):
+        page = fetch_page(url)
+    if page.status_code >= 400:
+        logger.info("crawl: %s answered %s", url, page.status_code)
+        return [], None
+    links = []
+    if 'text/html' in page.content_type:
+        links = extract_links(page.response.url or url, page)
+    return links, process(page)
+
+
+def crawl(start_url, max_pages=100, max_depth=3, workers=4, limiter=None, in_scope=None, process=None):
+    ''' Crawl from start_url (see the module docstring).
+    in_scope decides which links are followed (by default, the urls
+    starting with start_url); process is called on each fetched page
+    (by default, the FetchedPage is returned as it is).
+
+    Yields: (url, depth, result of process) for each fetched page,
+    as they are fetched. Raises ValueError if start_url is not an
+    http(s) url.
+    '''
+    url = normalize_url(start_url)
+    if url is None:
+        raise ValueError(f"Cannot crawl from {start_url!r}: not an http(s) url")
+    start_url = url
+    if in_scope is None:
+        in_scope = lambda url: url.startswith(start_url)
+    if process is None:
+        process = lambda page: page
+    if limiter is None:
+        limiter = HostLimiter()
+    app = current_app._get_current_object() if has_app_context() else None
+
+    def visit(url):
+        if app is None:
+            return _visit(url, limiter, process)
+        with app.app_context():
+            return _visit(url, limiter, process)
+
+    frontier = deque([(start_url, 0)])
+    seen = {start_url}
+    submitted = 0
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while frontier or running:
+            while frontier and len(running) < workers and submitted < max_pages:
+                url, depth = frontier.popleft()
+                running[executor.submit(visit, url)] = (url, depth)
+                submitted += 1
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, depth = running.pop(future)
+                try:
+                    links, result = future.result()
+                except Exception as e:
+                    logger.error("crawl: failed visiting %s: %s", url, e)
+                    continue
+                if depth < max_depth:
+                    for link in links:
+                        link = normalize_url(link)
+                        if link and link not in seen and in_scope(link):
+                            seen.add(link)
+                            frontier.append((link, depth + 1))
+                if result is not None:
+                    yield url, depth, result
+    logger.info("crawl: %d urls visited from %s, %d links left", submitted, start_url, len(frontier))
+
+
+def get_links(base_url, max_pages):
+    ''' The urls of up to max_pages pages under base_url. '''
+    return [url for url, _, _ in crawl(base_url, max_pages=max_pages, max_depth=max_pages)]
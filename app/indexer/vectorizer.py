@@ -8,7 +8,9 @@ from sklearn import preprocessing
 import app as app_module
 
 
-def wta_vectorized(feature_mat, k, percent=True):
+def wta_dense(feature_mat, k, percent=True):
+    ''' Winner-take-all on a dense matrix (the former implementation,
+    kept as the reference for wta_sparse). '''
     # thanks https://stackoverflow.com/a/59405060
     m, n = feature_mat.shape
     if percent:
@@ -24,34 +26,48 @@ def wta_vectorized(feature_mat, k, percent=True):
     feature_mat[is_smaller_than_kth] = 0
     return feature_mat
 
-def encode_docs(doc_list, vectorizer, logprobs, power, top_words):
-    logprobs = np.array([logprob ** power for logprob in logprobs])
-    X = vectorizer.fit_transform(doc_list)
-    X = X.multiply(logprobs)
-    X = wta_vectorized(X.toarray(),top_words,False)
+def wta_sparse(X, k):
+    ''' Winner-take-all on each row of a sparse matrix with
+    non-negative values: the values smaller than the k-th largest
+    value of their row are dropped (ties are kept), looking at the
+    non-zero values only, for all rows at once. '''
     X = csr_matrix(X)
-    return X
-
-def read_n_encode_dataset(doc=None, vectorizer=None, logprobs=None, power=None, top_words=None, verbose=False):
-    # read
-    doc_list = [doc]
-
-    # encode
-    X = encode_docs(doc_list, vectorizer, logprobs, power, top_words)
-    if verbose:
-        k = 10
-        inds = np.argpartition(X.todense(), -k, axis=1)[:, -k:]
-        for i in range(X.shape[0]):
-            ks = [list(vectorizer.vocabulary.keys())[list(vectorizer.vocabulary.values()).index(k)] for k in np.squeeze(np.asarray(inds[i]))]
-    return X
-
-def vectorize(lang, text, logprob_power, top_words):
-      '''Takes input file and return vectorized /scaled dataset'''
-      vectorizer = app_module.models[lang]['vectorizer']
-      logprobs = app_module.models[lang]['logprobs']
-      dataset = read_n_encode_dataset(text, vectorizer, logprobs, logprob_power, top_words)
-      dataset = dataset.todense()
-      return np.asarray(dataset)
+    X.eliminate_zeros()
+    counts = np.diff(X.indptr)
+    if k <= 0 or counts.max(initial=0) <= k:
+        return X
+    m = X.shape[0]
+    rows = np.repeat(np.arange(m), counts)
+    # Positions of the values of each row, in decreasing order
+    order = np.lexsort((-X.data, rows))
+    kth = np.full(m, -np.inf)
+    full = counts > k
+    kth[full] = X.data[order[X.indptr[:-1][full] + k - 1]]
+    keep = X.data >= kth[rows]
+    indptr = np.zeros(m + 1, dtype=X.indptr.dtype)
+    np.cumsum(np.bincount(rows[keep], minlength=m), out=indptr[1:])
+    return csr_matrix((X.data[keep], X.indices[keep], indptr), shape=X.shape)
+
+def powered_logprobs(lang, power):
+    ''' The logprobs of a language raised to power, computed once. '''
+    model = app_module.models[lang]
+    powered = model.setdefault('powered_logprobs', {})
+    if power not in powered:
+        powered[power] = np.asarray(model['logprobs'], dtype=np.float64) ** power
+    return powered[power]
+
+def _encode(doc_list, vectorizer, weights, top_words):
+    X = vectorizer.transform(doc_list).astype(np.float64)
+    X.data *= weights[X.indices]
+    return wta_sparse(X, top_words)
+
+def encode_docs(doc_list, vectorizer, logprobs, power, top_words):
+    return _encode(doc_list, vectorizer, np.asarray(logprobs, dtype=np.float64) ** power, top_words)
+
+def encode_lang_docs(lang, doc_list, power, top_words):
+    ''' Encode tokenized documents with the model of a language.
+    Returns: a sparse matrix with one row per document. '''
+    return _encode(doc_list, app_module.models[lang]['vectorizer'], powered_logprobs(lang, power), top_words)
 
 def scale(dataset):
     #scaler = preprocessing.MinMaxScaler().fit(dataset)
@@ -59,5 +75,11 @@ def scale(dataset):
     return scaler.transform(dataset)
 
 def vectorize_scale(lang, text, logprob_power, top_words):
-    dataset = vectorize(lang, text, logprob_power,top_words)
-    return scale(dataset)
+    '''Vectorize and scale a single document.
+    Returns: a dense array with one row.'''
+    return vectorize_scale_docs(lang, [text], logprob_power, top_words).toarray()
+
+def vectorize_scale_docs(lang, texts, logprob_power, top_words):
+    '''Vectorize and scale several documents in one pass.
+    Returns: a sparse matrix with one row per document.'''
+    return scale(encode_lang_docs(lang, texts, logprob_power, top_words))
@@ -59,6 +59,5 @@ def run_config(app):
     app.config['BABEL_TRANSLATION_DIRECTORIES'] = trans_dir
 
     # Optimization
-    app.config['LIVE_MATRIX'] = True if getenv("LIVE_MATRIX", "false").lower() == 'true' else False
     app.config['EXTEND_QUERY'] = True if getenv("EXTEND_QUERY", "false").lower() == 'true' else False
     return app
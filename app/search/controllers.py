@@ -6,6 +6,7 @@ import logging
 from os import getenv
 from os.path import dirname, join, realpath
 from random import shuffle
+from time import time
 from urllib.parse import urlparse
 from markupsafe import Markup
 import numpy as np
@@ -13,13 +14,14 @@ from flask import current_app
 from flask import Blueprint, request, render_template, flash, url_for
 from flask_login import current_user
 from flask_babel import gettext
-import app as app_module
 from app.forms import SearchForm
-from app.search import score_pages
+from app.search import score_pages, result_cache
+from app.search.live_index import index_generation
 from app.utils import parse_query, beautify_title, beautify_snippet
 from app.extensions import db
 from app.api.models import Personalization
-from app.search.cross_instance_search import get_cross_instance_results
+from app.search.cross_instance_search import start_cross_instance_search, collect_cross_instance_results
+from app.search.query_context import QueryContext
 
 # Define the blueprint:
 search = Blueprint('search', __name__, url_prefix='')
@@ -138,15 +140,21 @@ def get_local_search_results(query):
     results = {}
     scores = []
     query, _, lang = parse_query(query.lower())
+    generation = index_generation()
+    cache_key = result_cache.cache_key(query, lang, 'local')
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached['query'], dict(cached['results'])
     if lang is None:
         languages = current_app.config['LANGS']
     else:
         languages = [lang]
+    context = QueryContext(query, languages)
     for lang in languages:
-        clean_query = ' '.join([w for w in query.split() if w not in app_module.models[lang]['stopwords']])
+        clean_query = context.for_lang(lang).clean_query
         logger.info("get_local_search_results: searching in %s", lang)
         logger.info("Getting results on this instance")
-        r, s = score_pages.run_search(clean_query, lang, extended=current_app.config['EXTEND_QUERY'])
+        r, s = score_pages.run_search(clean_query, lang, extended=current_app.config['EXTEND_QUERY'], context=context)
         for res in r.values():
             res["instance"] = current_app.config["SITENAME"]  # to distinguish local results from remote ones later on
         results.update(r)
@@ -157,45 +165,113 @@ def get_local_search_results(query):
         url = list(results.keys())[i]
         sorted_results[url] = results[url]
     logger.debug("Sorted local results: %s", sorted_results)
+    clean_query = context.highlight_query()
+    result_cache.put(cache_key, {'query': clean_query, 'results': list(sorted_results.items())}, generation)
     return clean_query, sorted_results
 
 
+def get_local_batch_search_results(queries):
+    """ Local results for several queries at once, as a list
+    of (clean_query, results) pairs in the order of queries.
+    Queries missing from the result cache are scored together,
+    with one query matrix per language.
+    """
+    answers = [None] * len(queries)
+    misses = []
+    generation = index_generation()
+    for i, q in enumerate(queries):
+        query, _, lang = parse_query(q.lower())
+        cache_key = result_cache.cache_key(query, lang, 'local')
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            answers[i] = (cached['query'], dict(cached['results']))
+            continue
+        languages = current_app.config['LANGS'] if lang is None else [lang]
+        misses.append((i, cache_key, QueryContext(query, languages)))
+
+    results = {i: ({}, []) for i, _, _ in misses}
+    for lang in current_app.config['LANGS']:
+        batch = [(i, context) for i, _, context in misses if lang in context.languages]
+        if not batch:
+            continue
+        logger.info("get_local_batch_search_results: searching %d queries in %s", len(batch), lang)
+        contexts = [context for _, context in batch]
+        batch_results = score_pages.run_batch_search([context.for_lang(lang).clean_query for context in contexts], \
+                lang, extended=current_app.config['EXTEND_QUERY'], contexts=contexts)
+        for (i, _), (r, s) in zip(batch, batch_results):
+            for res in r.values():
+                res["instance"] = current_app.config["SITENAME"]  # to distinguish local results from remote ones later on
+            results[i][0].update(r)
+            results[i][1].extend(s)
+
+    for i, cache_key, context in misses:
+        r, scores = results[i]
+        sorted_results = {}
+        for j in np.argsort(scores)[::-1]:
+            url = list(r.keys())[j]
+            sorted_results[url] = r[url]
+        clean_query = context.highlight_query()
+        result_cache.put(cache_key, {'query': clean_query, 'results': list(sorted_results.items())}, generation)
+        answers[i] = (clean_query, sorted_results)
+    return answers
+
+
 def get_search_results(query):
     from app import instances
     clean_query = ""
     results = {}
     scores = []
+    complete = True
     query, _, lang = parse_query(query.lower())
+    generation = index_generation()
+    cache_key = result_cache.cache_key(query, lang, 'remote')
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached['query'], dict(cached['results'])
     if lang is None:
         languages = current_app.config['LANGS']
     else:
         languages = [lang]
+    context = QueryContext(query, languages)
+
+    # Remote instances are queried first, so that they work on
+    # the query while the local search runs.
+    started = time()
+    pending = []
+    try:
+        logger.info("Getting results cross-instances")
+        pending = start_cross_instance_search(context, instances)
+    except Exception as e:
+        logger.error("Unknown error during remote search: %s", e)
+        complete = False
+
     for lang in languages:
-        clean_query = ' '.join([w for w in query.split() if w not in app_module.models[lang]['stopwords']])
         logger.info("get_search_results: searching in %s", lang)
         try:
             logger.info("Getting results on this instance")
-            r, s = score_pages.run_search(clean_query, lang, extended=current_app.config['EXTEND_QUERY'])
+            clean_query = context.for_lang(lang).clean_query
+            r, s = score_pages.run_search(clean_query, lang, extended=current_app.config['EXTEND_QUERY'], context=context)
             for res in r.values():
                 res["instance"] = current_app.config["SITENAME"]  # to distinguish local results from remote ones later on
             results.update(r)
             scores.extend(s)
         except Exception as e:
             logger.error("Error during local search: %s", e)
+            complete = False
 
-        try:
-            logger.info("Getting results cross-instances")
-            r = get_cross_instance_results(clean_query, instances)
-            for url, dic in r.items():
-                if url not in results:
-                    results[url] = dic
-                    scores.append(dic['score'])
-        except Exception as e:
-            logger.error("Unknown error during remote search: %s", e)
+    r, remote_complete = collect_cross_instance_results(pending, started)
+    complete = complete and remote_complete
+    for url, dic in r.items():
+        if url not in results:
+            results[url] = dic
+            scores.append(dic['score'])
     sorted_scores = np.argsort(scores)[::-1]
     sorted_results = {}
     for i in sorted_scores:
         url = list(results.keys())[i]
         sorted_results[url] = results[url]
     logger.debug("Sorted results: %s", sorted_results)
+    clean_query = context.highlight_query()
+    if complete:
+        result_cache.put(cache_key, {'query': clean_query, 'results': list(sorted_results.items())}, generation)
     return clean_query, sorted_results
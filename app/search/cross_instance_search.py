@@ -1,18 +1,40 @@
 import logging
 logger = logging.getLogger(__name__)
-from time import time
+from time import time, sleep
+from os import getenv
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from urllib.parse import urlparse
 import numpy as np
-import requests
-from requests.exceptions import ConnectionError
 from os.path import dirname, realpath, join, exists
 from scipy.spatial import distance
 from flask import current_app
-import app as app_module
+from app import http_client
+from app.search import instance_cache, peer_health
+from app.search.signature import SIGNATURE_MIMETYPE, decode_signature
 from app.search.score_pages import compute_query_vectors
+from app.search.query_context import QueryContext
 
 base_dir_path = dirname(dirname(dirname(realpath(__file__))))
 
+# Remote searches run concurrently. Each request has its own timeouts,
+# and a search never waits more than REMOTE_SEARCH_DEADLINE seconds
+# for the remote instances as a whole.
+REMOTE_SEARCH_THREADS = int(getenv("REMOTE_SEARCH_THREADS", "8"))
+REMOTE_CONNECT_TIMEOUT = float(getenv("REMOTE_CONNECT_TIMEOUT", "3"))
+REMOTE_SEARCH_TIMEOUT = float(getenv("REMOTE_SEARCH_TIMEOUT", "5"))
+REMOTE_SEARCH_DEADLINE = float(getenv("REMOTE_SEARCH_DEADLINE", "6"))
+
+_executor = ThreadPoolExecutor(max_workers=REMOTE_SEARCH_THREADS, thread_name_prefix='remote-search')
+
+# Discovery of remote instances (languages, signature, identity)
+# is cached locally; entries older than INSTANCE_CACHE_TTL seconds are
+# refetched, every INSTANCE_REFRESH_INTERVAL seconds in the background.
+INSTANCE_DISCOVERY_THREADS = int(getenv("INSTANCE_DISCOVERY_THREADS", "8"))
+INSTANCE_CACHE_TTL = float(getenv("INSTANCE_CACHE_TTL", "86400"))
+INSTANCE_REFRESH_INTERVAL = float(getenv("INSTANCE_REFRESH_INTERVAL", "3600"))
+
+_discovery_executor = ThreadPoolExecutor(max_workers=INSTANCE_DISCOVERY_THREADS, thread_name_prefix='instance-discovery')
+
 def get_known_instances():
     known_instances = []
     known_instances_file = join(base_dir_path, '.known_instances.txt')
@@ -22,16 +44,117 @@ def get_known_instances():
         known_instances = f.read().splitlines()
     return known_instances
 
-def filter_instances_by_language():
-    ''' Return only instances that match the main language
-    of this instance.
+def _parse_signature(resp):
+    if resp.headers.get('Content-Type', '').startswith(SIGNATURE_MIMETYPE):
+        return decode_signature(resp.content)
+    # older instances only send a JSON list
+    return np.array(resp.json())
+
+
+def _fetch_signature(i, lang, headers, etag, cached_signature):
+    ''' Fetch the signature of instance i in lang, revalidating
+    the cached signature (if any) with its ETag.
+    Returns: the signature, its ETag and the reason of a failure
+    (None on success).
+    '''
+    url = join(i, 'api', 'signature', lang) + '/?dtype=float16'
+    signature_headers = dict(headers)
+    signature_headers['Accept'] = SIGNATURE_MIMETYPE + ', application/json;q=0.5'
+    if etag and cached_signature is not None:
+        signature_headers['If-None-Match'] = etag
+    try:
+        resp = http_client.get(url, headers=signature_headers)
+    except Exception as e:
+        logger.error("filter_instances_by_language: request failed trying to access %s; error message: %s", url, e)
+        return None, None, "connection error for /api/signature"
+    if resp.status_code == 304:
+        return cached_signature, etag, None
+    if resp.status_code != 200:
+        logger.error("filter_instances_by_language: got an error code trying to access %s", url)
+        return None, None, f"status code {resp.status_code} for /api/signature"
+    try:
+        signature = _parse_signature(resp)
+    except Exception as e:
+        logger.error("filter_instances_by_language: invalid signature from %s: %s", url, e)
+        return None, None, "invalid signature from /api/signature"
+    return signature, resp.headers.get('ETag'), None
+
+
+def _discover_instance(i, langs, headers, entry, cached_signatures):
+    ''' Fetch the languages, identity and signatures of instance i,
+    one signature for each of langs that the instance indexes.
+    Returns: the new cache entry, the signatures as a {lang: array}
+    dictionary and the reason of a failure (None on success).
+    '''
+    new_entry = {'languages': [], 'identity': None, 'signature_etags': {}, 'fetched': time()}
+    url = join(i, 'api', 'languages')
+    try:
+        resp = http_client.get(url, headers=headers)
+    except Exception as e:
+        logger.error("filter_instances_by_language: request failed trying to access %s; error message %s", url, e)
+        return None, {}, "connection error for /api/languages"
+    if resp.status_code != 200:
+        logger.error("filter_instances_by_language: got non-200 status code when trying to access %s", url)
+        return None, {}, f"status code {resp.status_code} for /api/languages"
+    try:
+        new_entry['languages'] = list(resp.json()['json_list'])
+    except Exception as e:
+        logger.error("filter_instances_by_language: invalid answer from %s: %s", url, e)
+        return None, {}, "invalid answer for /api/languages"
+    shared_langs = [lang for lang in langs if lang in new_entry['languages']]
+    if not shared_langs:
+        return new_entry, {}, None
+
+    signatures = {}
+    etags = (entry or {}).get('signature_etags', {})
+    for lang in shared_langs:
+        signature, etag, reason = _fetch_signature(i, lang, headers, etags.get(lang), cached_signatures.get(lang))
+        if reason is not None:
+            return None, {}, reason
+        signatures[lang] = signature
+        if etag:
+            new_entry['signature_etags'][lang] = etag
+
+    # retrieve instance metadata
+    identity_info_url = join(i, 'api', 'identity')
+    try:
+        identity_info = http_client.get(identity_info_url, headers=headers).json()
+        identity_info["url"] = i
+        if identity_info["sitename"].startswith("http"):
+            identity_info["sitename"] = urlparse(identity_info["sitename"]).hostname
+    except Exception as e:
+        logger.error("filter_instances_by_language: request failed trying to access %s, error message: %s", identity_info_url, e)
+        identity_info = {
+            "url": i,
+            "sitename": urlparse(i).hostname,
+            "site_topic": None,
+            "organization": None
+        }
+    new_entry['identity'] = identity_info
+    return new_entry, signatures, None
+
+
+def filter_instances_by_language(max_age=None, cached_only=False):
+    ''' Return the instances that index at least one of the
+    languages of this instance, with their signatures, per language.
+    Instances are looked up concurrently, and only if their cached
+    entry is older than max_age seconds (INSTANCE_CACHE_TTL by default).
+    With cached_only, no request is made and all cached entries are used.
+    Returns: {lang: instances}, {lang: signature matrix} and the
+    skipped instances.
     '''
-    this_instance_language = list(app_module.LANGUAGE_CODES.keys())[0]
+    if max_age is None:
+        max_age = INSTANCE_CACHE_TTL
+    langs = current_app.config['LANGS']
     instances = get_known_instances()
-    filtered_instances = []
-    filtered_matrix = []
+    filtered_instances = {lang: [] for lang in langs}
+    filtered_matrix = {lang: [] for lang in langs}
     skipped_instances = []
     headers = {'User-Agent': current_app.config['USER-AGENT']}
+    entries = instance_cache.load_entries()
+    now = time()
+
+    pending = {}
     for i in instances:
 
         # make sure that we're not trying to index with ourselves
@@ -39,71 +162,84 @@ def filter_instances_by_language():
             logger.warning("It seems like you're trying to federate with yourself. Consider removing the name of your local site from .known_hosts.txt if it's on it. For now, I'm skipping this instance (%s).", i)
             skipped_instances.append({"instance": i, "reason": "it seems like you're trying to federate with yourself"})
             continue
-
-        resp = None
-        url = join(i, 'api', 'languages')
-        try:
-            resp = requests.get(url, timeout=30, headers=headers)
-        except Exception as e:
-            logger.error("filter_instances_by_language: request failed trying to access %s; error message %s", url, e)
-            skipped_instances.append({"instance": i, "reason": "connection error for /api/languages"})
+        if cached_only or (i in entries and now - entries[i]['fetched'] < max_age):
             continue
-        if resp.status_code != 200:
-            logger.error("filter_instances_by_language: got non-200 status code when trying to access %s", url)    
-            skipped_instances.append({"instance": i, "reason": f"status code {resp.status_code} for /api/languages"})
-            continue        
-        languages = resp.json()['json_list']
-        if this_instance_language not in languages:
+        cached_signatures = {lang: instance_cache.load_signature(i, lang) for lang in langs}
+        pending[i] = _discovery_executor.submit(_discover_instance, i, langs, headers, \
+                entries.get(i), cached_signatures)
+
+    new_entries = {}
+    new_signatures = {}
+    for i in instances:
+        if i in pending:
+            entry, signatures, reason = pending[i].result()
+            if reason is None:
+                new_entries[i] = entries[i] = entry
+                for lang, signature in signatures.items():
+                    new_signatures[(i, lang)] = signature
+            elif i in entries:
+                logger.warning("filter_instances_by_language: using cached information for %s (%s)", i, reason)
+            else:
+                skipped_instances.append({"instance": i, "reason": reason})
+                continue
+        if i not in entries:
             continue
+        for lang in langs:
+            if lang not in entries[i]['languages']:
+                continue
+            signature = new_signatures.get((i, lang))
+            if signature is None:
+                signature = instance_cache.load_signature(i, lang)
+            if signature is None:
+                continue
+            filtered_instances[lang].append(entries[i]['identity'])
+            filtered_matrix[lang].append(signature)
+    if new_entries:
+        instance_cache.save_entries(new_entries, new_signatures)
+    filtered_matrix = {lang: np.array(m) for lang, m in filtered_matrix.items()}
+    return filtered_instances, filtered_matrix, skipped_instances
 
-        #print(url, languages, this_instance_language)
 
-        # first get the signature of the instance
-        url = join(i, 'api', 'signature', this_instance_language)
+def run_instance_discovery(publish):
+    ''' Publish the cached instances straight away, then refresh
+    stale entries every INSTANCE_REFRESH_INTERVAL seconds.
+    Meant to run forever in a background thread, in an app context.
+    '''
+    cached_only = True
+    while True:
         try:
-            resp = requests.get(url, timeout=30, headers=headers)
+            instances, m, skipped = filter_instances_by_language(cached_only=cached_only)
+            for s in skipped:
+                logger.warning("Skipped remote instance %s: %s", s['instance'], s['reason'])
+            publish(instances, m)
+            logger.info("Loaded %d remote instance(s) in background.", \
+                    len({instance['url'] for lang_instances in instances.values() for instance in lang_instances}))
         except Exception as e:
-            logger.error("filter_instances_by_language: request failed trying to access %s; error message: %s", url, e)
-            skipped_instances.append({"instance": i, "reason": "connection error for /api/signature"})
-            continue
-        if resp.status_code != 200:
-            logger.error("filter_instances_by_language: got an error code trying to access %s", url)
-            skipped_instances.append({"instance": i, "reason": f"status code {resp.status_code} for /api/signature"})
-            continue
+            logger.error("Failed to load remote instances: %s", e)
+        if not cached_only:
+            sleep(INSTANCE_REFRESH_INTERVAL)
+        cached_only = False
 
-        signature = np.array(resp.json())
-        
-        # retrieve instance metadata
-        identity_info_url = join(i, 'api', 'identity')
-        try:
-            identity_info = requests.get(identity_info_url, timeout=30, headers=headers).json()
-            identity_info["url"] = i
-            if identity_info["sitename"].startswith("http"):
-                identity_info["sitename"] = urlparse(identity_info["sitename"]).hostname
-        except Exception as e:
-            logger.error("filter_instances_by_language: request failed trying to access %s, error message: %s", identity_info_url, e)
-            identity_info = {
-                "url": i,
-                "sitename": urlparse(i).hostname,
-                "site_topic": None,
-                "organization": None
-            }
-
-        filtered_instances.append(identity_info)
-        filtered_matrix.append(signature)
-    filtered_matrix = np.array(filtered_matrix)
-    return filtered_instances, filtered_matrix, skipped_instances
 
-
-def get_best_instances(query, lang, instances, m, top_k=3):
-    q_tokenized, extended_q_tokenized, q_vectors, extended_q_vectors = compute_query_vectors(query, lang, expansion_length=10)
-    query_vector = np.sum(q_vectors, axis=0)
+def get_best_instances(query, lang, instances, m, top_k=3, query_vector=None):
+    if query_vector is None:
+        q_tokenized, extended_q_tokenized, q_vectors, extended_q_vectors = compute_query_vectors(query, lang, expansion_length=10)
+        query_vector = np.sum(q_vectors, axis=0)
     
     # Only compute cosines over the dimensions of interest
     a = np.where(query_vector!=0)[1]
     cos = 1 - distance.cdist(query_vector[:,a], m[:,a], 'cosine')[0]
     cos[np.isnan(cos)] = 0
 
+    # Leave out instances that are known to be down, and prefer fast ones
+    for i, instance in enumerate(instances):
+        if not peer_health.is_available(instance['url']):
+            cos[i] = 0
+            continue
+        latency = peer_health.latency(instance['url'])
+        if latency is not None:
+            cos[i] /= 1 + latency / REMOTE_SEARCH_TIMEOUT
+
     # Instance ids with non-zero values (match at least one subword)
     idx = np.where(cos!=0)[0]
 
@@ -118,54 +254,123 @@ def get_best_instances(query, lang, instances, m, top_k=3):
     return best_instances
 
 
-def get_cross_instance_results(query, instances):
+def _fetch_instance_results(instance, query, headers):
+    ''' Send a query to a remote instance and return its results,
+    with URLs rewritten to point to the remote instance. '''
+    url = join(instance["url"], 'api', 'search')
+    req_success = False
+    try:
+        t_before = time()
+        resp = http_client.get(url, params={'q': query}, timeout=(REMOTE_CONNECT_TIMEOUT, REMOTE_SEARCH_TIMEOUT),
+                headers=headers)
+        req_success = True
+        t_after = time()
+        t_delta = t_after - t_before
+        logger.info("Request to remote instance (url=%s) took %.3fs", url, t_delta)
+    except Exception as e:
+        logger.error("Error when connecting to %s, error message: %s", url, e)
+
+    if req_success and resp.status_code == 200:
+        peer_health.record_success(instance["url"], t_delta)
+        json_result = resp.json()['json_list']
+        # legacy code for older instances
+        if type(json_result) is list:
+            remote_results = json_result[1]
+        # up-to-date instances
+        else:
+            remote_results = json_result
+    else:
+        logger.error("Got non-200 status code from %s", url)
+        peer_health.record_failure(instance["url"])
+        remote_results = {}
+
+    remote_results_updated = {}
+    for url, result_data in remote_results.items():
+        result_data_updated = {k: v for k, v in result_data.items()}
+        result_data_updated["x_instance_info"] = instance
+        # make sure pearslocal URLs point to the remote instance
+        remote_results_updated[url] = result_data_updated
+        if result_data["url"].startswith("pearslocal"):
+            del remote_results_updated[url]
+            url = join(instance["url"], "api", "get?url=") + result_data["url"]
+            result_data_updated["url"] = url
+            result_data_updated["share"] = url
+            remote_results_updated[url] = result_data_updated
+
+        # The following is only temporary until all instances have been updated to return page scores
+        if 'score' not in result_data_updated:
+            if any(w in result_data['title'] for w in query.lower().split()) or any(w in result_data['snippet'].lower() for w in query.lower().split()):
+                result_data_updated['score'] = 2
+            else:
+                result_data_updated['score'] = 0
+    if req_success and resp.status_code == 200:
+        peer_health.put_results(instance["url"], query, remote_results_updated)
+    return remote_results_updated
+
+
+def start_cross_instance_search(context, instances):
+    ''' Send the query to the best remote instances, without
+    waiting for their answers (so that the local search can run
+    in the meantime). For each language of the QueryContext, the
+    instances indexing that language ({lang: instances}) are chosen
+    by comparing their signatures in that language to the query
+    vector; an instance chosen for several languages is queried once.
+    Returns: a list of (instance, future) pairs, to be passed
+    to collect_cross_instance_results.
+    '''
     from app import M
-    best_instances = get_best_instances(query, 'en', instances, M, top_k=2)
-    results = {}
     headers = {'User-Agent': current_app.config['USER-AGENT']}
-    for instance in best_instances:
-        url = join(instance["url"], 'api', 'search?q='+query)
-        req_success = False
+    pending = []
+    queried = set()
+    for lang in context.languages:
+        if not instances.get(lang):
+            continue
+        lang_query = context.for_lang(lang)
+        best_instances = get_best_instances(lang_query.clean_query, lang, instances[lang], M.get(lang), top_k=2, \
+                query_vector=lang_query.query_vector)
+        for instance in best_instances:
+            if instance["url"] in queried:
+                continue
+            queried.add(instance["url"])
+            cached = peer_health.get_results(instance["url"], lang_query.clean_query)
+            if cached is not None:
+                future = Future()
+                future.set_result(cached)
+            elif peer_health.allow_request(instance["url"]):
+                future = _executor.submit(_fetch_instance_results, instance, lang_query.clean_query, headers)
+            else:
+                continue
+            pending.append((instance, future))
+    return pending
+
+
+def collect_cross_instance_results(pending, started, deadline=None):
+    ''' Gather the answers of remote instances until the deadline
+    (REMOTE_SEARCH_DEADLINE seconds after started, by default).
+    Instances which have not answered by then are left out.
+    Returns: the merged results, and whether all instances answered.
+    '''
+    if deadline is None:
+        deadline = REMOTE_SEARCH_DEADLINE
+    results = {}
+    if len(pending) == 0:
+        return results, True
+    futures = [future for _, future in pending]
+    _, not_done = wait(futures, timeout=max(0, started + deadline - time()))
+    for instance, future in pending:
+        if future in not_done:
+            logger.warning("Remote instance %s did not answer within %.1fs, returning partial results", \
+                    instance["url"], deadline)
+            continue
         try:
-            t_before = time()
-            resp = requests.get(url, timeout=30, headers=headers)
-            req_success = True
-            t_after = time()
-            t_delta = t_after - t_before
-            logger.info("Request to remote instance (url=%s) took %.3fs", url, t_delta)
+            results.update(future.result())
         except Exception as e:
-            logger.error("Error when connecting to %s, error message: %s", url, e)
-
-        if req_success and resp.status_code == 200:
-            json_result = resp.json()['json_list']
-            # legacy code for older instances
-            if type(json_result) is list:
-                remote_results = json_result[1]
-            # up-to-date instances
-            else:
-                remote_results = json_result
-        else:
-            logger.error("Got non-200 status code from %s", url)
-            remote_results = {}
-
-        remote_results_updated = {}
-        for url, result_data in remote_results.items():
-            result_data_updated = {k: v for k, v in result_data.items()}
-            result_data_updated["x_instance_info"] = instance
-            # make sure pearslocal URLs point to the remote instance
-            remote_results_updated[url] = result_data_updated
-            if result_data["url"].startswith("pearslocal"):
-                del remote_results_updated[url]
-                url = join(instance["url"], "api", "get?url=") + result_data["url"]
-                result_data_updated["url"] = url
-                result_data_updated["share"] = url
-                remote_results_updated[url] = result_data_updated
-
-            # The following is only temporary until all instances have been updated to return page scores
-            if 'score' not in result_data_updated:
-                if any(w in result_data['title'] for w in query.lower().split()) or any(w in result_data['snippet'].lower() for w in query.lower().split()):
-                    result_data_updated['score'] = 2
-                else:
-                    result_data_updated['score'] = 0
-        results.update(remote_results_updated)
+            logger.error("Error when processing results from %s: %s", instance["url"], e)
+    return results, len(not_done) == 0
+
+
+def get_cross_instance_results(query, instances):
+    started = time()
+    pending = start_cross_instance_search(QueryContext(query, current_app.config['LANGS']), instances)
+    results, _ = collect_cross_instance_results(pending, started)
     return results
@@ -0,0 +1,84 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>,
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+''' Local cache of what is known about remote instances.
+
+For each instance, index.json records its languages, its identity
+info, the ETag of its signature and when it was last fetched; the
+signature itself is kept next to it as a .npy file. The cache lets
+a restarted instance federate straight away, and lets discovery skip
+(or conditionally refetch) instances whose entry is recent enough.
+'''
+
+import logging
+import fcntl
+import json
+from contextlib import contextmanager
+from hashlib import sha1
+from os import replace
+from os.path import dirname, join, realpath, isfile
+from pathlib import Path
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+base_dir_path = dirname(dirname(dirname(realpath(__file__))))
+cache_dir = join(base_dir_path, '.instance_cache')
+
+
+@contextmanager
+def _locked():
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    with open(join(cache_dir, 'lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_index():
+    path = join(cache_dir, 'index.json')
+    if not isfile(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except ValueError:
+        logger.warning("instance_cache: ignoring unreadable %s", path)
+        return {}
+
+
+def _signature_path(url, lang):
+    return join(cache_dir, sha1(url.encode('utf-8')).hexdigest() + '.' + lang + '.npy')
+
+
+def load_entries():
+    ''' Return {instance url: entry} for all cached instances. '''
+    return _read_index()
+
+
+def load_signature(url, lang):
+    path = _signature_path(url, lang)
+    if not isfile(path):
+        return None
+    return np.load(path)
+
+
+def save_entries(entries, signatures):
+    ''' Record new entries (and their signatures, as a
+    {(url, lang): array} dictionary) in the cache.
+    '''
+    with _locked():
+        for (url, lang), signature in signatures.items():
+            path = _signature_path(url, lang)
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, signature)
+            replace(path + '.tmp', path)
+        index = _read_index()
+        index.update(entries)
+        path = join(cache_dir, 'index.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        replace(path + '.tmp', path)
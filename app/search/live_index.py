@@ -0,0 +1,524 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>,
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+''' Search index shared by all processes of an instance.
+
+The document matrix of a language is stored as an on-disk snapshot
+(<PODS_DIR>/.search_index/<lang>/snap-N/): the CSR arrays of the matrix
+and of its element-wise square, the pod of each row and a url table.
+Processes memory-map the snapshot read-only, so gunicorn workers share
+a single copy of the index through the page cache.
+
+Changes (indexed, deleted and moved documents) are appended to the
+journal of the current snapshot. Each process replays new journal
+entries on its next search: added documents become pending rows and
+deleted ones are tombstoned (their score is forced to zero). Once the
+journal holds LIVE_COMPACT_ROWS entries, the writer folds it into a
+new snapshot and atomically points the CURRENT file to it; processes
+switch to the new snapshot on their next search.
+'''
+
+import logging
+import fcntl
+import json
+import threading
+from shutil import rmtree
+from os import getenv, listdir, remove, replace
+from os.path import dirname, join, realpath, isdir, isfile
+from pathlib import Path
+from contextlib import contextmanager
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from app.search.sparse_cosine import squared_matrix, batch_sparse_cosines
+
+logger = logging.getLogger(__name__)
+
+dir_path = dirname(dirname(realpath(__file__)))
+pod_dir = getenv("PODS_DIR", join(dir_path, 'pods'))
+index_dir = join(pod_dir, '.search_index')
+
+LIVE_COMPACT_ROWS = int(getenv("LIVE_COMPACT_ROWS", "1000"))
+
+# One index per language, shared by all threads of the process
+indices = {}
+_indices_lock = threading.Lock()
+
+
+class UrlTable:
+    ''' Read-only table of urls, stored as one utf-8 blob with
+    offsets, plus the permutation sorting the urls (used to find
+    the row of a url by binary search).
+    '''
+
+    def __init__(self, blob, offsets, order):
+        self.blob = blob
+        self.offsets = offsets
+        self.order = order
+
+    @classmethod
+    def from_list(cls, urls):
+        encoded = [url.encode('utf-8') for url in urls]
+        offsets = np.zeros(len(urls) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+        blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        order = np.array(sorted(range(len(urls)), key=encoded.__getitem__), dtype=np.int64)
+        return cls(blob, offsets, order)
+
+    def _encoded(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self._encoded(i).decode('utf-8')
+
+    def find(self, url):
+        ''' Return the row of a url, or None. '''
+        target = url.encode('utf-8')
+        lo, hi = 0, len(self.order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._encoded(self.order[mid]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.order) and self._encoded(self.order[lo]) == target:
+            return int(self.order[lo])
+        return None
+
+
+class _Urls:
+    ''' The urls of the rows of an index (base table, then pending rows). '''
+
+    def __init__(self, base, pending):
+        self.base = base
+        self.pending = pending
+
+    def __len__(self):
+        return len(self.base) + len(self.pending)
+
+    def __getitem__(self, i):
+        if i < len(self.base):
+            return self.base[i]
+        return self.pending[i - len(self.base)]
+
+
+class LiveIndex:
+    ''' Document matrix of a language, with the url and pod of each row.
+    The base matrix is read-only; additions are kept as pending rows
+    and deletions as tombstones.
+    '''
+
+    def __init__(self, m, urls, row_pods, podnames, m_sq=None):
+        self.lock = threading.RLock()
+        self.snapshot = None
+        self.journal_offset = 0
+        self.m = m
+        self.m_sq = squared_matrix(m) if m_sq is None else m_sq
+        self.urls = urls if isinstance(urls, UrlTable) else UrlTable.from_list(urls)
+        self.row_pods = np.asarray(row_pods)
+        self.podnames = list(podnames)
+        self.pod_ids = {name: i for i, name in enumerate(self.podnames)}
+        self.pending = []
+        self.pending_pods = []
+        self.pending_urls = []
+        self.pending_rows = {}
+        self._pending_m = None
+        self.dead = set()
+        self._dead_rows = np.zeros(0, dtype=np.int64)
+        self._pod_sums = None
+        self._pod_sizes = None
+
+    @property
+    def num_rows(self):
+        return self.m.shape[0] + len(self.pending)
+
+    def row_of(self, url):
+        ''' Return the (live) row of a url, or None. '''
+        row = self.pending_rows.get(url)
+        if row is None:
+            row = self.urls.find(url)
+        if row is None or row in self.dead:
+            return None
+        return row
+
+    def _pod_id(self, pod):
+        if pod not in self.pod_ids:
+            self.pod_ids[pod] = len(self.podnames)
+            self.podnames = self.podnames + [pod]
+        return self.pod_ids[pod]
+
+    def _tombstone(self, row):
+        self.dead.add(row)
+        self._dead_rows = np.fromiter(self.dead, dtype=np.int64, count=len(self.dead))
+        self._update_pod_sums(row, -1)
+
+    def _row(self, row):
+        ''' The vector and pod id of a row. '''
+        num_base = self.m.shape[0]
+        if row < num_base:
+            return self.m[row], int(self.row_pods[row])
+        return self.pending[row - num_base], self.pending_pods[row - num_base]
+
+    def _update_pod_sums(self, row, sign):
+        if self._pod_sums is None:
+            return
+        v, pod_id = self._row(row)
+        if pod_id >= len(self._pod_sums):
+            grow = len(self.podnames) - len(self._pod_sums)
+            self._pod_sums = np.vstack([self._pod_sums, np.zeros((grow, self.m.shape[1]))])
+            self._pod_sizes = np.concatenate([self._pod_sizes, np.zeros(grow, dtype=np.int64)])
+        self._pod_sums[pod_id, v.indices] += sign * v.data
+        self._pod_sizes[pod_id] += sign
+
+    def pod_sums(self):
+        ''' Sum of the live vectors of each pod, and number of
+        live rows per pod. Computed once, then kept up to date
+        as rows are added and deleted. '''
+        with self.lock:
+            if self._pod_sums is None:
+                m = vstack([self.m] + self.pending, format='csr') if self.pending else self.m
+                live = np.ones(m.shape[0])
+                live[self._dead_rows] = 0
+                pods = csr_matrix((live, (self.all_row_pods(), np.arange(m.shape[0]))), \
+                        shape=(len(self.podnames), m.shape[0]))
+                self._pod_sums = np.asarray((pods @ m).todense())
+                self._pod_sizes = np.asarray(pods.sum(axis=1)).ravel().astype(np.int64)
+            return self._pod_sums, self._pod_sizes
+
+    def signature(self):
+        ''' Signature of the index: the sum of the L2-normalized
+        pod sums (pods without live documents are left out). '''
+        with self.lock:
+            sums, sizes = self.pod_sums()
+            sums = sums[sizes > 0]
+            norms = np.linalg.norm(sums, axis=1)
+            nonzero = norms > 0
+            return np.sum(sums[nonzero] / norms[nonzero, None], axis=0)
+
+    def add(self, url, pod, v):
+        ''' Add (or replace) the vector of a url. '''
+        with self.lock:
+            row = self.row_of(url)
+            if row is not None:
+                self._tombstone(row)
+            self.pending_rows[url] = self.num_rows
+            self.pending.append(csr_matrix(v))
+            self.pending_pods.append(self._pod_id(pod))
+            self.pending_urls.append(url)
+            self._pending_m = None
+            self._update_pod_sums(self.num_rows - 1, 1)
+
+    def remove(self, url):
+        with self.lock:
+            row = self.row_of(url)
+            if row is not None:
+                self._tombstone(row)
+                self.pending_rows.pop(url, None)
+
+    def remove_pod(self, pod):
+        with self.lock:
+            if pod not in self.pod_ids:
+                return
+            for row in np.flatnonzero(self.all_row_pods() == self.pod_ids[pod]).tolist():
+                if row not in self.dead:
+                    self._tombstone(row)
+
+    def rename_pod(self, src, target):
+        with self.lock:
+            if src not in self.pod_ids:
+                return
+            pod_id = self.pod_ids.pop(src)
+            podnames = list(self.podnames)
+            podnames[pod_id] = target
+            self.podnames = podnames
+            self.pod_ids[target] = pod_id
+
+    def all_row_pods(self):
+        if not self.pending_pods:
+            return self.row_pods
+        return np.concatenate([self.row_pods, np.array(self.pending_pods, dtype=self.row_pods.dtype)])
+
+    def compacted(self):
+        ''' Return the content of the index with pending rows
+        folded in and tombstoned rows dropped. '''
+        with self.lock:
+            m = vstack([self.m] + self.pending, format='csr') if self.pending else self.m
+            keep = np.setdiff1d(np.arange(m.shape[0]), self._dead_rows)
+            urls = _Urls(self.urls, self.pending_urls)
+            return m[keep], [urls[i] for i in keep.tolist()], self.all_row_pods()[keep], self.podnames
+
+    def apply(self, entry):
+        ''' Apply a journal entry. '''
+        op = entry['op']
+        if op == 'add':
+            v = csr_matrix((entry['data'], entry['indices'], [0, len(entry['indices'])]), \
+                    shape=(1, self.m.shape[1]))
+            self.add(entry['url'], entry['pod'], v)
+        elif op == 'del':
+            self.remove(entry['url'])
+        elif op == 'delpod':
+            self.remove_pod(entry['pod'])
+        elif op == 'mvpod':
+            self.rename_pod(entry['src'], entry['target'])
+
+    def cosines(self, query_vector):
+        ''' Score all rows against a query.
+        Returns: the cosines, and the urls, pods of rows and pod names
+        they refer to.
+        '''
+        q = np.asarray(query_vector).reshape(1, -1)
+        cos, urls, row_pods, podnames = self.batch_cosines(q)
+        return cos.ravel(), urls, row_pods, podnames
+
+    def batch_cosines(self, query_matrix):
+        ''' Score all rows against several queries at once
+        (one query per row of query_matrix).
+        Returns: a (rows, queries) array of cosines, and the urls,
+        pods of rows and pod names they refer to.
+        '''
+        with self.lock:
+            if self.pending and self._pending_m is None:
+                pending_m = vstack(self.pending, format='csr')
+                self._pending_m = (pending_m, squared_matrix(pending_m))
+            m, m_sq, pending_m = self.m, self.m_sq, self._pending_m if self.pending else None
+            dead_rows, podnames = self._dead_rows, self.podnames
+            urls = _Urls(self.urls, list(self.pending_urls))
+            row_pods = self.all_row_pods()
+        cos = batch_sparse_cosines(query_matrix, m, m_sq)
+        if pending_m is not None:
+            cos = np.vstack([cos, batch_sparse_cosines(query_matrix, *pending_m)])
+        cos[dead_rows] = 0
+        return cos, urls, row_pods, podnames
+
+
+def _vec_matrix(lang):
+    from app.search.score_pages import mk_vec_matrix
+    m, bins, podnames, urls = mk_vec_matrix(lang)
+    row_pods = np.repeat(np.arange(len(podnames)), np.diff(bins))
+    return m, urls, row_pods, podnames
+
+
+##################
+# Snapshots
+##################
+
+def _lang_dir(lang):
+    return join(index_dir, lang)
+
+
+@contextmanager
+def _locked(lang):
+    ''' Hold the writer lock of a language's index. '''
+    Path(_lang_dir(lang)).mkdir(parents=True, exist_ok=True)
+    with open(join(_lang_dir(lang), 'lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def current_snapshot(lang):
+    ''' Name of the snapshot in use for a language, or None. '''
+    try:
+        with open(join(_lang_dir(lang), 'CURRENT')) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _snapshot_langs():
+    if not isdir(index_dir):
+        return []
+    return [lang for lang in listdir(index_dir) if isdir(_lang_dir(lang))]
+
+
+def write_snapshot(lang, m, urls, row_pods, podnames):
+    ''' Write a new snapshot and make it current.
+    Call with the writer lock held.
+    '''
+    lang_dir = _lang_dir(lang)
+    numbers = [int(d.split('-')[1]) for d in listdir(lang_dir) if d.startswith('snap-')]
+    name = 'snap-' + str(max(numbers, default=0) + 1)
+    snap_dir = join(lang_dir, name)
+    Path(snap_dir).mkdir()
+    m = csr_matrix(m)
+    url_table = UrlTable.from_list(urls)
+    arrays = {'data': m.data, 'data_sq': np.square(m.data), 'indices': m.indices, 'indptr': m.indptr,
+            'row_pods': np.asarray(row_pods, dtype=np.int32), 'url_blob': url_table.blob,
+            'url_offsets': url_table.offsets, 'url_order': url_table.order}
+    for key, array in arrays.items():
+        np.save(join(snap_dir, key+'.npy'), array)
+    with open(join(snap_dir, 'meta.json'), 'w') as f:
+        json.dump({'shape': list(m.shape), 'podnames': list(podnames)}, f)
+    open(join(snap_dir, 'journal'), 'w').close()
+    with open(join(lang_dir, 'CURRENT.tmp'), 'w') as f:
+        f.write(name)
+    replace(join(lang_dir, 'CURRENT.tmp'), join(lang_dir, 'CURRENT'))
+    # Keep the previous snapshot for processes that are just switching
+    for old in sorted(numbers)[:-1]:
+        rmtree(join(lang_dir, 'snap-'+str(old)), ignore_errors=True)
+    logger.info("Published search index snapshot %s/%s (%s rows)", lang, name, m.shape[0])
+    return name
+
+
+def load_snapshot(lang, name):
+    ''' Memory-map a snapshot (read-only). '''
+    snap_dir = join(_lang_dir(lang), name)
+    arrays = {key: np.load(join(snap_dir, key+'.npy'), mmap_mode='r') for key in \
+            ['data', 'data_sq', 'indices', 'indptr', 'row_pods', 'url_blob', 'url_offsets', 'url_order']}
+    with open(join(snap_dir, 'meta.json')) as f:
+        meta = json.load(f)
+    shape = tuple(meta['shape'])
+    m = csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=shape, copy=False)
+    m_sq = csr_matrix((arrays['data_sq'], arrays['indices'], arrays['indptr']), shape=shape, copy=False)
+    urls = UrlTable(arrays['url_blob'], arrays['url_offsets'], arrays['url_order'])
+    index = LiveIndex(m, urls, arrays['row_pods'], meta['podnames'], m_sq=m_sq)
+    index.snapshot = name
+    return index
+
+
+def _read_journal(lang, name, offset):
+    ''' Return the complete journal entries after offset, and the new offset. '''
+    path = join(_lang_dir(lang), name, 'journal')
+    if not isfile(path):
+        return [], offset
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        buf = f.read()
+    end = buf.rfind(b'\n') + 1
+    entries = [json.loads(line) for line in buf[:end].splitlines() if line]
+    return entries, offset + end
+
+
+def _catch_up(lang, index):
+    with index.lock:
+        entries, index.journal_offset = _read_journal(lang, index.snapshot, index.journal_offset)
+        for entry in entries:
+            index.apply(entry)
+
+
+def _current_index(lang):
+    ''' The loaded index of the current snapshot of a language
+    (building the first snapshot if there is none). '''
+    name = current_snapshot(lang)
+    if name is None:
+        with _locked(lang):
+            name = current_snapshot(lang)
+            if name is None:
+                logger.info("Building search index snapshot for %s", lang)
+                name = write_snapshot(lang, *_vec_matrix(lang))
+    index = indices.get(lang)
+    if index is None or index.snapshot != name:
+        with _indices_lock:
+            index = indices.get(lang)
+            if index is None or index.snapshot != name:
+                index = load_snapshot(lang, name)
+                indices[lang] = index
+    return index
+
+
+def get_index(lang):
+    ''' Return the up-to-date index for a language: the current
+    snapshot, with the changes of its journal made by any process.
+    '''
+    try:
+        index = _current_index(lang)
+    except FileNotFoundError:
+        # Two compactions removed the snapshot named by CURRENT
+        # before it was loaded: CURRENT now names a newer one
+        logger.info("Search index snapshot of %s was replaced while loading it, retrying", lang)
+        index = _current_index(lang)
+    _catch_up(lang, index)
+    return index
+
+
+def _compact_snapshot(lang, name):
+    ''' Fold the journal of a snapshot into a new snapshot.
+    Call with the writer lock held.
+    '''
+    index = load_snapshot(lang, name)
+    _catch_up(lang, index)
+    m, urls, row_pods, podnames = index.compacted()
+    write_snapshot(lang, m, urls, row_pods, podnames)
+
+
+def index_generation():
+    ''' Counter incremented by every change to the indexed content
+    (used to invalidate cached search results). It is incremented
+    once the change is visible, so a result computed after reading
+    the generation is at least as recent as that generation.
+    '''
+    try:
+        with open(join(index_dir, 'generation')) as f:
+            return int(f.read() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def _bump_generation():
+    Path(index_dir).mkdir(parents=True, exist_ok=True)
+    generation_path = join(index_dir, 'generation')
+    with open(generation_path + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        generation = index_generation() + 1
+        # Replace the file atomically: readers do not take the lock
+        with open(generation_path + '.tmp', 'w') as f:
+            f.write(str(generation))
+        replace(generation_path + '.tmp', generation_path)
+    return generation
+
+
+def _journal(entry, langs=None):
+    ''' Append an entry to the journal of the current snapshot
+    of some languages (all of them by default). Languages without
+    a snapshot need nothing: theirs will be built from the database.
+    '''
+    line = (json.dumps(entry) + '\n').encode('utf-8')
+    for lang in langs or _snapshot_langs():
+        with _locked(lang):
+            name = current_snapshot(lang)
+            if name is None:
+                continue
+            with open(join(_lang_dir(lang), name, 'journal'), 'ab') as f:
+                f.write(line)
+            with open(join(_lang_dir(lang), name, 'journal'), 'rb') as f:
+                num_entries = f.read().count(b'\n')
+            if num_entries >= LIVE_COMPACT_ROWS:
+                _compact_snapshot(lang, name)
+    _bump_generation()
+
+
+def index_document(lang, url, pod, v):
+    ''' Record a newly indexed (or re-indexed) url. '''
+    row = csr_matrix(v)
+    _journal({'op': 'add', 'url': url, 'pod': pod,
+        'indices': row.indices.tolist(), 'data': row.data.tolist()}, [lang])
+    for other in _snapshot_langs():
+        if other != lang:
+            _journal({'op': 'del', 'url': url}, [other])
+
+
+def remove_document(url):
+    _journal({'op': 'del', 'url': url})
+
+
+def remove_pod(pod):
+    _journal({'op': 'delpod', 'pod': pod})
+
+
+def rename_pod(src, target):
+    _journal({'op': 'mvpod', 'src': src, 'target': target})
+
+
+def invalidate():
+    ''' Drop the current snapshots, e.g. after pods were modified
+    in bulk. They are rebuilt from the database on the next search. '''
+    for lang in _snapshot_langs():
+        with _locked(lang):
+            if isfile(join(_lang_dir(lang), 'CURRENT')):
+                remove(join(_lang_dir(lang), 'CURRENT'))
+    _bump_generation()
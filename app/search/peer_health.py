@@ -0,0 +1,130 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>,
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+''' Health of remote instances, as seen by this process.
+
+Each peer has a circuit breaker: after PEER_FAILURE_THRESHOLD
+consecutive failures it is skipped for PEER_RETRY_AFTER seconds, then
+a single probe request is let through (half-open state); its outcome
+closes the circuit again or reopens it. An exponentially weighted
+moving average of each peer's latency is kept to prefer fast peers.
+
+Result sets of remote searches are also kept for
+REMOTE_RESULT_CACHE_TTL seconds, keyed by peer and query, so that
+identical queries are not sent again.
+'''
+
+import logging
+import threading
+from copy import deepcopy
+from os import getenv
+from time import time
+
+logger = logging.getLogger(__name__)
+
+PEER_FAILURE_THRESHOLD = int(getenv("PEER_FAILURE_THRESHOLD", "3"))
+PEER_RETRY_AFTER = float(getenv("PEER_RETRY_AFTER", "60"))
+PEER_LATENCY_ALPHA = float(getenv("PEER_LATENCY_ALPHA", "0.3"))
+REMOTE_RESULT_CACHE_TTL = float(getenv("REMOTE_RESULT_CACHE_TTL", "120"))
+REMOTE_RESULT_CACHE_SIZE = 500
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+_lock = threading.Lock()
+_peers = {}
+_results = {}
+
+
+class _Peer:
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.latency = None
+
+
+def _peer(url):
+    if url not in _peers:
+        _peers[url] = _Peer()
+    return _peers[url]
+
+
+def is_available(url):
+    ''' Whether a request to the peer would be let through
+    (without claiming the half-open probe). '''
+    with _lock:
+        peer = _peer(url)
+        return peer.state == CLOSED or (peer.state == OPEN and time() - peer.opened_at >= PEER_RETRY_AFTER)
+
+
+def allow_request(url):
+    ''' Whether to send a request to the peer now. When the peer's
+    circuit is open and its waiting time is over, the caller gets to
+    send the probe request. '''
+    with _lock:
+        peer = _peer(url)
+        if peer.state == CLOSED:
+            return True
+        if peer.state == OPEN and time() - peer.opened_at >= PEER_RETRY_AFTER:
+            peer.state = HALF_OPEN
+            return True
+        return False
+
+
+def record_success(url, latency):
+    with _lock:
+        peer = _peer(url)
+        if peer.state != CLOSED:
+            logger.info("Remote instance %s is answering again", url)
+        peer.state = CLOSED
+        peer.failures = 0
+        if peer.latency is None:
+            peer.latency = latency
+        else:
+            peer.latency = PEER_LATENCY_ALPHA * latency + (1 - PEER_LATENCY_ALPHA) * peer.latency
+
+
+def record_failure(url):
+    with _lock:
+        peer = _peer(url)
+        peer.failures += 1
+        if peer.state == HALF_OPEN or peer.failures >= PEER_FAILURE_THRESHOLD:
+            if peer.state != OPEN:
+                logger.warning("Remote instance %s failed %d time(s), skipping it for %.0fs", \
+                        url, peer.failures, PEER_RETRY_AFTER)
+            peer.state = OPEN
+            peer.opened_at = time()
+
+
+def latency(url):
+    ''' Average latency of the peer in seconds (None if unknown). '''
+    with _lock:
+        return _peer(url).latency
+
+
+def get_results(url, query):
+    ''' Return the cached results of a query on a peer, or None. '''
+    with _lock:
+        cached = _results.get((url, query))
+        if cached is None or time() - cached[0] >= REMOTE_RESULT_CACHE_TTL:
+            return None
+        return deepcopy(cached[1])
+
+
+def put_results(url, query, results):
+    with _lock:
+        now = time()
+        if len(_results) >= REMOTE_RESULT_CACHE_SIZE:
+            for key in [k for k, (t, _) in _results.items() if now - t >= REMOTE_RESULT_CACHE_TTL]:
+                del _results[key]
+            if len(_results) >= REMOTE_RESULT_CACHE_SIZE:
+                del _results[min(_results, key=lambda k: _results[k][0])]
+        _results[(url, query)] = (now, deepcopy(results))
+
+
+def stats():
+    with _lock:
+        return {url: {'state': peer.state, 'failures': peer.failures, 'latency': peer.latency} \
+                for url, peer in _peers.items()}
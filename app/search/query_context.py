@@ -0,0 +1,48 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>,
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+''' What a search derives from its query, computed once and shared
+by local scoring, routing to remote instances and snippet highlighting.
+'''
+
+import numpy as np
+import app as app_module
+from app.indexer.mk_page_vector import compute_query_vectors
+
+
+class LangQuery:
+    ''' The query in one language: without stopwords, tokenized,
+    expanded with similar tokens, and vectorized. '''
+
+    def __init__(self, query, lang):
+        self.lang = lang
+        self.clean_query = ' '.join([w for w in query.split() if w not in app_module.models[lang]['stopwords']])
+        self.tokens, self.expanded_tokens, self.vectors, self.expanded_vectors = \
+                compute_query_vectors(self.clean_query, lang, expansion_length=10)
+
+    @property
+    def query_vector(self):
+        return np.sum(self.vectors, axis=0)
+
+
+class QueryContext:
+    ''' A query and its per-language versions (computed on first use). '''
+
+    def __init__(self, query, languages):
+        self.query = query
+        self.languages = list(languages)
+        self._langs = {}
+
+    def for_lang(self, lang):
+        if lang not in self._langs:
+            self._langs[lang] = LangQuery(self.query, lang)
+        return self._langs[lang]
+
+    def highlight_query(self):
+        ''' The words to highlight in snippets: those of the query
+        that were searched for, in any of its languages. '''
+        words = []
+        for lang_query in self._langs.values():
+            words.extend(w for w in lang_query.clean_query.split() if w not in words)
+        return ' '.join(words)
@@ -0,0 +1,101 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>,
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+''' Cache of search results, shared by all workers of an instance.
+
+Results are stored in a small SQLite database in the pods directory,
+keyed by the normalized query, its language and the search mode
+(local only, or local and remote). An entry is only served if it is
+younger than RESULT_CACHE_TTL seconds and was computed at the current
+index generation (see app.search.live_index), so that indexing or
+deleting documents invalidates it. The least recently used entries
+are evicted beyond RESULT_CACHE_SIZE entries.
+'''
+
+import logging
+import json
+import sqlite3
+import threading
+from os import getenv, getpid
+from os.path import dirname, join, realpath
+from pathlib import Path
+from time import time
+from app.search.live_index import index_generation
+
+logger = logging.getLogger(__name__)
+
+dir_path = dirname(dirname(realpath(__file__)))
+pod_dir = getenv("PODS_DIR", join(dir_path, 'pods'))
+cache_path = join(pod_dir, '.result_cache.db')
+
+RESULT_CACHE_SIZE = int(getenv("RESULT_CACHE_SIZE", "1000"))
+RESULT_CACHE_TTL = int(getenv("RESULT_CACHE_TTL", "600"))
+
+_local = threading.local()
+
+
+def _connection():
+    ''' One connection per thread (and per process, as
+    connections must not be shared across a fork). '''
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == getpid():
+        return conn
+    Path(pod_dir).mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(cache_path, timeout=5, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, generation INTEGER, '
+            'created REAL, last_used REAL, value TEXT)')
+    conn.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, count INTEGER)')
+    conn.execute("INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0)")
+    _local.conn = conn
+    _local.pid = getpid()
+    return conn
+
+
+def cache_key(query, lang, mode):
+    return '\x1f'.join([' '.join(query.lower().split()), lang or '*', mode])
+
+
+def get(key):
+    ''' Return the cached value for key, or None. '''
+    if RESULT_CACHE_SIZE <= 0:
+        return None
+    try:
+        conn = _connection()
+        row = conn.execute('SELECT generation, created, value FROM results WHERE key = ?', (key,)).fetchone()
+        hit = row is not None and row[0] == index_generation() and time() - row[1] < RESULT_CACHE_TTL
+        conn.execute('UPDATE stats SET count = count + 1 WHERE name = ?', ('hits' if hit else 'misses',))
+        if not hit:
+            return None
+        conn.execute('UPDATE results SET last_used = ? WHERE key = ?', (time(), key))
+        return json.loads(row[2])
+    except sqlite3.Error as e:
+        logger.warning("Result cache unavailable: %s", e)
+        return None
+
+
+def put(key, value, generation):
+    ''' Cache value for key. generation is the index generation read
+    before value was computed, so that a value computed while the index
+    changed is not served once the change is visible. '''
+    if RESULT_CACHE_SIZE <= 0:
+        return
+    now = time()
+    try:
+        conn = _connection()
+        conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                (key, generation, now, now, json.dumps(value)))
+        conn.execute('DELETE FROM results WHERE created < ? OR key IN (SELECT key FROM results '
+                'ORDER BY last_used DESC LIMIT -1 OFFSET ?)', (now - RESULT_CACHE_TTL, RESULT_CACHE_SIZE))
+    except sqlite3.Error as e:
+        logger.warning("Result cache unavailable: %s", e)
+
+
+def stats():
+    ''' Hit and miss counters, and current size of the cache. '''
+    conn = _connection()
+    counters = dict(conn.execute('SELECT name, count FROM stats').fetchall())
+    entries = conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+    return {'hits': counters.get('hits', 0), 'misses': counters.get('misses', 0), 'entries': entries,
+            'max_entries': RESULT_CACHE_SIZE, 'ttl': RESULT_CACHE_TTL, 'generation': index_generation()}
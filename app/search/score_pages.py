@@ -12,10 +12,11 @@ from itertools import islice
 from urllib.parse import urlparse
 from glob import glob
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import joblib
 from joblib import Parallel, delayed
 from scipy.spatial import distance
-from scipy.sparse import load_npz, csr_matrix, vstack
+from scipy.sparse import csr_matrix, vstack
 import numpy as np
 from flask import url_for
 from flask import current_app
@@ -24,124 +25,143 @@ import app as app_module
 from app.api.models import Urls
 from app.search.overlap_calculation import (snippet_overlap,
         score_url_overlap, posix, posix_no_seq)
+from app.search.live_index import get_index
 from app.utils import parse_query, timer
 from app.indexer.mk_page_vector import compute_query_vectors
 from app.indexer.posix import load_posix
+from app.indexer.pod_store import load_pod_matrix
 
 dir_path = dirname(dirname(realpath(__file__)))
 pod_dir = getenv("PODS_DIR", join(dir_path, 'pods'))
+POD_LOADING_THREADS = int(getenv("POD_LOADING_THREADS", "4"))
 
-def mk_podsum_matrix(lang):
-    """ Make the podsum matrix, i.e. a matrix
-    with each row corresponding to the sum of 
-    all documents in a given pod."""
-    podnames = []
-    podsum = []
-    npzs = glob(join(pod_dir,'*',lang,'*.u.*npz'))
-    for npz in npzs:
-        podname = npz.split('/')[-1].replace('.npz','')
-        s = np.sum(load_npz(npz).toarray(), axis=0)
-        #print(podname, np.sum(s), s)
-        if np.sum(s) > 0:
-            podsum.append(s)
-            podnames.append(podname)
-    return podnames, podsum
-
-
-
+def _load_pod_rows(npz_path, idvs):
+    """ Load the rows of a pod matrix that belong to urls.
+    Returns: the CSR rows and the loading time."""
+    t1 = time()
+    rows = load_pod_matrix(npz_path)[idvs]
+    return rows, time() - t1
 
 
 @timer
 def mk_vec_matrix(lang):
     """ Make a vector matrix by stacking all
-    pod matrices."""
+    pod matrices. Pods without urls are skipped,
+    so that bins and podnames stay aligned.
+
+    The urls of all pods are fetched in a single query
+    and pods are loaded in parallel, staying sparse."""
     c = 0
     podnames = []
     bins = [c]
     m = []
     urls = []
 
-    npzs = glob(join(pod_dir,'*',lang,'*.u.*npz'))
-    for npz in npzs:
-        podnames.append(npz.split('/')[-1].replace('.npz',''))
-
-    for i in range(len(podnames)):
-        us = db.session.query(Urls).filter_by(pod=podnames[i]).all()
-        if len(us) == 0:
-            continue
-        upaths = [u.url for u in us if u.vector is not None]
-        idvs = [u.vector for u in us if u.vector is not None]
-        urls.extend(upaths)
-        npz = load_npz(npzs[i]).toarray()
-        npz = npz[idvs,:]
-        m.append(csr_matrix(npz))
-        c+=npz.shape[0]
-        bins.append(c)
-    m = vstack(m)
-    m = csr_matrix(m)
+    npzs = {}
+    for npz_path in glob(join(pod_dir,'*',lang,'*.u.*npz')):
+        npzs[npz_path.split('/')[-1].replace('.npz','')] = npz_path
+
+    pod_urls = {}
+    rows = db.session.query(Urls.pod, Urls.url, Urls.vector).\
+            filter(Urls.pod.in_(list(npzs)), Urls.vector.isnot(None)).order_by(Urls.id).all()
+    for pod, url, vector in rows:
+        pod_urls.setdefault(pod, []).append((url, vector))
+
+    # Keep the order of the pod files, as the former one-query-per-pod loop did
+    pods = [pod for pod in npzs if pod in pod_urls]
+    with ThreadPoolExecutor(max_workers=POD_LOADING_THREADS) as executor:
+        futures = [executor.submit(_load_pod_rows, npzs[pod], [v for _, v in pod_urls[pod]]) for pod in pods]
+        for pod, future in zip(pods, futures):
+            pod_rows, t = future.result()
+            logger.info("mk_vec_matrix: loaded %s (%s rows) in %.4fs", pod, pod_rows.shape[0], t)
+            urls.extend([u for u, _ in pod_urls[pod]])
+            m.append(pod_rows)
+            podnames.append(pod)
+            c+=pod_rows.shape[0]
+            bins.append(c)
+    if len(m) == 0:
+        return csr_matrix((0, app_module.VEC_SIZE)), bins, podnames, urls
+    m = vstack(m, format='csr')
     return m, bins, podnames, urls
 
 
-def load_vec_matrix(lang):
-    if 'm' in app_module.models[lang]:
-        m = app_module.models[lang]['m']
-        bins = app_module.models[lang]['mbins']
-        podnames = app_module.models[lang]['podnames']
-        urls = app_module.models[lang]['urls']
+
+def top_k(scores, k):
+    """ Indices of the k highest non-zero scores, best first,
+    without sorting the whole array."""
+    idx = np.flatnonzero(scores)
+    if len(idx) > k:
+        idx = idx[np.argpartition(scores[idx], -k)[-k:]]
+    return idx[np.argsort(scores[idx])[::-1]]
+
+
+def _snippet_score(query, u, snippet_length):
+    if u.snippet is None:
+        u.snippet = ''
+        snippet_score = 0.0
     else:
-        m, bins, podnames, urls = mk_vec_matrix(lang)
-    m = m.todense()
-    return m, bins, podnames, urls
+        snippet = ' '.join(u.snippet.split()[:snippet_length])
+        snippet_score = snippet_overlap(query, u.title+' '+snippet)
+    loc = urlparse(u.url).netloc.split('.')[0]
 
+    #Big boost in case the query word is the url
+    if query == loc:
+        snippet_score+=0.5
+    #Little boost in case the query words are in the url
+    for w in query.split():
+        if w in u.url:
+            snippet_score+=0.1
+    return snippet_score
 
 
 @timer
-def compute_scores(query, query_vectors, lang):
+def compute_batch_scores(queries, query_vector_sets, lang):
+    """ Score documents against several query vectors in one pass
+    (e.g. the original and the extended versions of several queries).
+
+    Arguments:
+    queries: the query string of each query vector set
+    query_vector_sets: a list of lists of word vectors; each list
+    is summed into one query vector
+    lang: the language of the queries
+
+    Returns: one {url: score} dictionary per query vector set,
+    and the database entries of all scored urls, by url.
+    """
     snippet_length = current_app.config['SNIPPET_LENGTH']
-    m, bins, podnames, urls = load_vec_matrix(lang)
-    query_vector = np.sum(query_vectors, axis=0)
-    
-    # Only compute cosines over the dimensions of interest
-    a = np.where(query_vector!=0)[1]
-    cos = 1 - distance.cdist(query_vector[:,a], m[:,a], 'cosine')[0]
-    cos[np.isnan(cos)] = 0
+    query_matrix = np.vstack([np.sum(query_vectors, axis=0) for query_vectors in query_vector_sets])
 
-    # Document ids with non-zero values (match at least one subword)
-    idx = np.where(cos!=0)[0]
+    # Only compute cosines over the dimensions of interest,
+    # for all query vectors with a single matrix product
+    cos, urls, _, _ = get_index(lang).batch_cosines(query_matrix)
 
-    # Sort document ids with non-zero values and take top 50
-    idx = np.argsort(cos)[-len(idx):][::-1][:50]
+    # Top 50 documents with non-zero values (match at least one subword)
+    # for each query vector
+    best = [top_k(cos[:,j], 50) for j in range(cos.shape[1])]
 
-    # Get urls
-    document_scores = {}
-    best_urls = [urls[i] for i in idx]
-    best_cos = [cos[i] for i in idx]
-    us = Urls.query.filter(Urls.url.in_(best_urls)).all()
+    # Get urls, for all query vectors at once
+    best_urls = list({urls[i] for idx in best for i in idx})
+    url_entries = {u.url: u for u in Urls.query.filter(Urls.url.in_(best_urls)).all()}
 
     snippet_scores = {}
-    for u in us:
-        if u.snippet is None:
-            u.snippet = ''
-            snippet_score = 0.0
-        else:
-            snippet = ' '.join(u.snippet.split()[:snippet_length])
-            snippet_score = snippet_overlap(query, u.title+' '+snippet)
-        loc = urlparse(u.url).netloc.split('.')[0]
-
-        #Big boost in case the query word is the url
-        if query == loc:
-            snippet_score+=0.5
-        #Little boost in case the query words are in the url
-        for w in query.split():
-            if w in u.url:
-                snippet_score+=0.1
-        snippet_scores[u.url] = snippet_score
-
-    for i, u in enumerate(best_urls):
-        #print(f"url: {u}, snippet_score: {snippet_scores[u]}, cos: {best_cos[i]}")
-        document_scores[u] = best_cos[i] + snippet_scores[u]
-
-    return document_scores
+    all_document_scores = []
+    for j, idx in enumerate(best):
+        document_scores = {}
+        for i in idx:
+            u = urls[i]
+            if (queries[j], u) not in snippet_scores:
+                snippet_scores[(queries[j], u)] = _snippet_score(queries[j], url_entries[u], snippet_length)
+            document_scores[u] = cos[i,j] + snippet_scores[(queries[j], u)]
+        all_document_scores.append(document_scores)
+    return all_document_scores, url_entries
+
+
+def compute_scores(query, query_vector_sets, lang):
+    """ Score documents against one or several versions of a
+    query (e.g. the original and the extended query) in one pass.
+    See compute_batch_scores.
+    """
+    return compute_batch_scores([query] * len(query_vector_sets), query_vector_sets, lang)
 
 
 def return_best_urls(doc_scores):
@@ -166,12 +186,20 @@ def return_best_urls(doc_scores):
     return best_urls, scores
 
 
-def output(best_urls, scores):
+def output(best_urls, scores, url_entries=None):
+    """ Format the results of a search.
+
+    Arguments:
+    best_urls, scores: the ranked urls and their scores
+    url_entries: optionally, the database entries of the urls
+    (by url), if they were already fetched while scoring
+    """
     snippet_length = current_app.config['SNIPPET_LENGTH']
     results = {}
-    urls = Urls.query.filter(Urls.url.in_(best_urls)).all()
-    urls = [next(u for u in urls if u.url == best_url) for best_url in best_urls]
-    for i, u in enumerate(urls):
+    if url_entries is None:
+        url_entries = {u.url: u for u in Urls.query.filter(Urls.url.in_(best_urls)).all()}
+    for i, best_url in enumerate(best_urls):
+        u = url_entries[best_url]
         url = u.url
         results[url] = u.as_dict()
         results[url]['score'] = scores[i]
@@ -181,36 +209,79 @@ def output(best_urls, scores):
 
 
 
-def run_search(query, lang, extended=True):
+def merge_scores(document_scores, extended_document_scores):
+    """ Merge the scores of a query and of its extended version. """
+    merged_scores = document_scores.copy()
+    for k,_ in extended_document_scores.items():
+        if k in document_scores:
+            merged_scores[k] = document_scores[k]+ 0.5*extended_document_scores[k]
+        else:
+            merged_scores[k] = 0.5*extended_document_scores[k]
+    return merged_scores
+
+
+def run_search(query, lang, extended=True, context=None):
     """Run search on query input by user
 
     Parameter: query, a query string.
+    context: optionally, the QueryContext of the search, holding
+    the query vectors already computed for this language.
     Returns: a list of documents. Each document is a dictionary. 
     """
     document_scores = {}
     extended_document_scores = {}
 
     # Run tokenization and vectorization on query. We also get an extended query and its vector.
-    q_tokenized, extended_q_tokenized, q_vectors, extended_q_vectors = compute_query_vectors(query, lang, expansion_length=10)
-
-    document_scores = compute_scores(query, q_vectors, lang)
+    if context is not None:
+        lang_query = context.for_lang(lang)
+        q_vectors, extended_q_vectors = lang_query.vectors, lang_query.expanded_vectors
+    else:
+        _, _, q_vectors, extended_q_vectors = compute_query_vectors(query, lang, expansion_length=10)
 
     if extended:
-        extended_document_scores = compute_scores(query, extended_q_vectors, lang)
-
-    # Merge
-    merged_scores = document_scores.copy()
-    for k,_ in extended_document_scores.items():
-        if k in document_scores:
-            merged_scores[k] = document_scores[k]+ 0.5*extended_document_scores[k]
-        else:
-            merged_scores[k] = 0.5*extended_document_scores[k]
+        (document_scores, extended_document_scores), url_entries = \
+                compute_scores(query, [q_vectors, extended_q_vectors], lang)
+    else:
+        (document_scores,), url_entries = compute_scores(query, [q_vectors], lang)
 
+    merged_scores = merge_scores(document_scores, extended_document_scores)
     best_urls, scores = return_best_urls(merged_scores)
-    results = output(best_urls, scores)
+    results = output(best_urls, scores, url_entries)
     return results, scores
 
 
+def run_batch_search(queries, lang, extended=True, contexts=None):
+    """Run search on several queries at once, scoring them
+    together as one query matrix.
+
+    Parameter: queries, a list of query strings.
+    contexts: optionally, the QueryContext of each query.
+    Returns: a list of (results, scores) pairs, one per query,
+    as returned by run_search.
+    """
+    queries_of_sets = []
+    query_vector_sets = []
+    for j, query in enumerate(queries):
+        if contexts is not None:
+            lang_query = contexts[j].for_lang(lang)
+            q_vectors, extended_q_vectors = lang_query.vectors, lang_query.expanded_vectors
+        else:
+            _, _, q_vectors, extended_q_vectors = compute_query_vectors(query, lang, expansion_length=10)
+        queries_of_sets.append(query)
+        query_vector_sets.append(q_vectors)
+        if extended:
+            queries_of_sets.append(query)
+            query_vector_sets.append(extended_q_vectors)
+    all_document_scores, url_entries = compute_batch_scores(queries_of_sets, query_vector_sets, lang)
+
+    batch_results = []
+    step = 2 if extended else 1
+    for j in range(len(queries)):
+        document_scores = all_document_scores[j * step]
+        extended_document_scores = all_document_scores[j * step + 1] if extended else {}
+        best_urls, scores = return_best_urls(merge_scores(document_scores, extended_document_scores))
+        batch_results.append((output(best_urls, scores, url_entries), scores))
+    return batch_results
 
 
 def intersect_best_posix_lists(query_tokenized, posindex, lang):
@@ -253,16 +324,14 @@ def score_pods(query_words, query_vectors, extended_q_vectors, lang):
     max_pods = current_app.config["MAX_PODS"] # How many pods to return
     pod_scores = {}
 
-    m, bins, podnames = load_vec_matrix(lang)
+    index = get_index(lang)
 
     tmp_best_pods = []
     tmp_best_scores = []
     # For each word in the query, compute best pods
     for query_vector in query_vectors:
         # Only compute cosines over the dimensions of interest
-        a = np.where(query_vector!=0)[1]
-        cos = 1 - distance.cdist(query_vector[:,a], m[:,a], 'cosine')[0]
-        cos[np.isnan(cos)] = 0
+        cos, _, row_pods, podnames = index.cosines(query_vector)
 
         # Document ids with non-zero values (match at least one subword)
         idx = np.where(cos!=0)[0]
@@ -271,10 +340,8 @@ def score_pods(query_words, query_vectors, extended_q_vectors, lang):
         idx = np.argsort(cos)[-len(idx):][::-1]
 
         # Bin document ids into pods, and record how many documents are matched in each bin
-        d = np.digitize(idx, bins)
-        d = dict(Counter(d).most_common())
+        d = dict(Counter(row_pods[idx].tolist()).most_common())
         best_bins = list(d.keys())
-        best_bins = [b-1 for b in best_bins] #digitize starts at 1, not 0
         logger.debug("%s", best_bins)
         best_scores = list(d.values())
         max_score = max(best_scores)
@@ -0,0 +1,100 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>,
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+''' Signature of this instance, as served to other instances.
+
+The signature is derived from the pod sums that the search index
+keeps up to date (see LiveIndex.signature), and its serialized form
+is cached per generation of the indexed content (see
+live_index.index_generation), so that answering a peer only costs
+reading the generation when nothing was indexed in the meantime.
+
+Two formats are served: the historical dense JSON list, and a compact
+binary one (SIGNATURE_MIMETYPE) for peers that ask for it in their
+Accept header. The binary format holds the non-zero dimensions only,
+as float32 or float16 values, zlib-compressed:
+  magic (8 bytes) | version (uint8) | dtype (uint8: 0 float32, 1 float16)
+  dimensions (uint32) | non-zero entries N (uint32)
+  zlib(indices (uint32 x N) | values (N, in dtype))
+'''
+
+import json
+import threading
+import zlib
+from hashlib import sha1
+import numpy as np
+from app.search.live_index import get_index, index_generation
+
+SIGNATURE_MIMETYPE = 'application/vnd.pears.signature'
+SIGNATURE_MAGIC = b'PEARSSIG'
+SIGNATURE_VERSION = 1
+SIGNATURE_DTYPES = {'float32': (0, '<f4'), 'float16': (1, '<f2')}
+MAX_SIGNATURE_DIM = 1 << 20
+_HEADER = np.dtype([('magic', 'S8'), ('version', 'u1'), ('dtype', 'u1'), ('dim', '<u4'), ('nnz', '<u4')])
+
+# (lang, format) -> (index generation, body, etag)
+_payloads = {}
+_lock = threading.Lock()
+
+
+def encode_signature(signature, dtype='float32'):
+    ''' Serialize a signature in the compact binary format. '''
+    code, np_dtype = SIGNATURE_DTYPES[dtype]
+    signature = np.asarray(signature).ravel()
+    indices = np.flatnonzero(signature).astype('<u4')
+    header = np.array([(SIGNATURE_MAGIC, SIGNATURE_VERSION, code, len(signature), len(indices))], dtype=_HEADER)
+    payload = indices.tobytes() + signature[indices].astype(np_dtype).tobytes()
+    return header.tobytes() + zlib.compress(payload)
+
+
+def decode_signature(body):
+    ''' Parse a signature in the compact binary format.
+    Raises ValueError if body is not a valid signature.
+    '''
+    if len(body) < _HEADER.itemsize:
+        raise ValueError("Signature too short")
+    header = np.frombuffer(body, dtype=_HEADER, count=1)[0]
+    if header['magic'] != SIGNATURE_MAGIC or header['version'] != SIGNATURE_VERSION:
+        raise ValueError("Not a signature in a supported format")
+    np_dtypes = [t for code, t in SIGNATURE_DTYPES.values() if code == header['dtype']]
+    if not np_dtypes:
+        raise ValueError(f"Unknown signature dtype code {header['dtype']}")
+    dim, nnz = int(header['dim']), int(header['nnz'])
+    if dim > MAX_SIGNATURE_DIM or nnz > dim:
+        raise ValueError(f"Invalid signature dimensions ({nnz} non-zero out of {dim})")
+    try:
+        payload = zlib.decompress(body[_HEADER.itemsize:])
+    except zlib.error as e:
+        raise ValueError(f"Invalid signature payload: {e}") from e
+    indices = np.frombuffer(payload, dtype='<u4', count=nnz)
+    values = np.frombuffer(payload, dtype=np_dtypes[0], count=nnz, offset=4 * nnz)
+    if nnz and indices.max() >= dim:
+        raise ValueError("Signature index out of range")
+    signature = np.zeros(dim)
+    signature[indices] = values
+    return signature
+
+
+def signature_payload(lang, fmt='json'):
+    ''' Return the serialized signature for a language and its ETag.
+    fmt is 'json' (dense list) or one of SIGNATURE_DTYPES (binary).
+    '''
+    # Read before the index, so that a change made meanwhile
+    # invalidates the payload computed here
+    generation = index_generation()
+    with _lock:
+        cached = _payloads.get((lang, fmt))
+    if cached is not None and cached[0] == generation:
+        return cached[1], cached[2]
+    index = get_index(lang)
+    with index.lock:
+        signature = index.signature()
+    if fmt == 'json':
+        body = json.dumps(signature.tolist()).encode('utf-8')
+    else:
+        body = encode_signature(signature, fmt)
+    etag = sha1(body).hexdigest()
+    with _lock:
+        _payloads[(lang, fmt)] = (generation, body, etag)
+    return body, etag
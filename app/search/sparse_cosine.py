@@ -0,0 +1,63 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>,
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+def squared_matrix(m):
+    """ Element-wise square of a CSR matrix. The result
+    shares the index arrays of m, so only the data array
+    is duplicated.
+    """
+    return csr_matrix((np.square(m.data), m.indices, m.indptr), shape=m.shape)
+
+
+def sparse_cosines(query_vector, m, m_sq=None):
+    """ Cosine between a query and every row of a CSR matrix,
+    computed over the non-zero dimensions of the query only
+    (the same quantity as scipy's cdist restricted to those
+    columns), without densifying the matrix.
+
+    Arguments:
+    query_vector: a dense (1, n) or (n,) array
+    m: the CSR document matrix (rows x n)
+    m_sq: optionally, the precomputed squared_matrix(m)
+
+    Returns: a 1D array of cosines, 0 for rows with no
+    value on any of the query dimensions.
+    """
+    q = np.asarray(query_vector, dtype=np.float64).reshape(1, -1)
+    return batch_sparse_cosines(q, m, m_sq).ravel()
+
+
+def batch_sparse_cosines(query_matrix, m, m_sq=None):
+    """ Cosines between several queries and every row of a CSR
+    matrix, with one sparse matrix product per quantity. Each query
+    is restricted to its own non-zero dimensions, as in sparse_cosines.
+
+    Arguments:
+    query_matrix: a dense (k, n) array, one query per row
+    m: the CSR document matrix (rows x n)
+    m_sq: optionally, the precomputed squared_matrix(m)
+
+    Returns: a (rows, k) array of cosines.
+    """
+    q = np.asarray(query_matrix, dtype=np.float64)
+    cos = np.zeros((m.shape[0], q.shape[0]))
+    if m.shape[0] == 0 or not q.any():
+        return cos
+    if m_sq is None:
+        m_sq = squared_matrix(m)
+
+    # Dot products: each query is zero outside its dimensions,
+    # so a plain matrix product is already restricted.
+    dots = np.asarray(m.dot(q.T))
+
+    # Row norms restricted to the dimensions of each query
+    mask = (q != 0).astype(np.float64)
+    q_norms = np.array([np.linalg.norm(row[row != 0]) for row in q])
+    norms = np.sqrt(np.asarray(m_sq.dot(mask.T))) * q_norms
+    np.divide(dots, norms, out=cos, where=norms > 0)
+    return cos
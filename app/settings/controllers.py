@@ -67,7 +67,7 @@ def toggle_maintenance_mode():
 @check_permissions(login=True, confirmed=True, admin=True)
 def refresh_remote_instances():
     try:
-        app_module.instances, app_module.M, skipped_instances = filter_instances_by_language()
+        app_module.instances, app_module.M, skipped_instances = filter_instances_by_language(max_age=0)
         skip_text = '<li style="margin-bottom:0.5em;"><a href="{}">{}</a><br><code style="font-size:0.85em;color:var(--muted-foreground);">{}</code></li>'
         message = gettext("The list of remote instances was successfully refreshed.")
         if skipped_instances:
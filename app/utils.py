@@ -8,11 +8,11 @@ import re
 from time import time
 from math import sqrt
 from urllib.parse import urljoin
-import requests
 import numpy as np
 from scipy.spatial import distance
 from markupsafe import Markup, escape
 import mistletoe
+from app import http_client
 
 dir_path = dirname(realpath(__file__))
 logger = logging.getLogger(__name__)
@@ -182,7 +182,7 @@ def get_pod_info(url):
     logger.info("Fetching pod %s", urljoin(url, 'api/self/'))
     pod = None
     try:
-        r = requests.get(urljoin(url, "api/self/"))
+        r = http_client.get(urljoin(url, "api/self/"))
         if r.status_code == 200:
             pod = r.json()
     except Exception:
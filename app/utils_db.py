@@ -8,14 +8,15 @@ from os import remove, rename, getenv
 from os.path import dirname, realpath, join, isfile
 from pathlib import Path
 from string import punctuation
-import joblib
 from sqlalchemy import update
-import numpy as np
-from scipy.sparse import csr_matrix, load_npz, vstack, save_npz
 from app.extensions import db
 import app as app_module
 from app.api.models import Urls, Pods, Suggestions
-from app.indexer.posix import load_posix, dump_posix
+from app.indexer.posix import load_posix, dump_posix, PosIndex
+from app.search import live_index
+from app.indexer.job_queue import pod_lock
+from app.indexer.pod_store import create_pod_matrix, append_to_pod, remove_from_pod, \
+        delete_pod_files, rename_pod_files
 
 dir_path = dirname(dirname(realpath(__file__)))
 pod_dir = getenv("PODS_DIR", join(dir_path, 'app', 'pods'))
@@ -46,19 +47,15 @@ def create_pod_npz_pos(contributor, theme, lang):
     vocab = app_module.models[lang]['vocab']
     if not isfile(pod_path+'.npz'):
         logger.debug("create_pod_npz_pos: Making 0 CSR matrix for new pod")
-        pod = np.zeros((1,app_module.VEC_SIZE))
-        pod = csr_matrix(pod)
-        save_npz(pod_path+'.npz', pod)
-        logger.debug("create_pod_npz_pos: %s", pod.shape[0])
+        create_pod_matrix(pod_path+'.npz', app_module.VEC_SIZE)
 
     if not isfile(pod_path+'.pos'):
         logger.debug("create_pod_npz_pos: Making empty positional index for new pod")
-        posindex = [{} for _ in range(len(vocab))]
-        joblib.dump(posindex, pod_path+'.pos')
+        PosIndex(len(vocab)).save(pod_path+'.pos')
     return pod_path
 
 
-def create_pod_in_db(contributor, theme, lang):
+def create_pod_in_db(contributor, theme, lang, commit=True):
     '''If the pod does not exist, create it in the database.
     '''
     if contributor is not None:
@@ -71,7 +68,8 @@ def create_pod_in_db(contributor, theme, lang):
         p.language = lang
         p.registered = True
         db.session.add(p)
-        db.session.commit()
+        if commit:
+            db.session.commit()
 
 def create_suggestion_in_db(url, pod, notes, contributor):
     '''Add suggestion to database'''
@@ -80,8 +78,9 @@ def create_suggestion_in_db(url, pod, notes, contributor):
     db.session.commit()
 
 def create_or_replace_url_in_db(url, title, snippet, doctype, idv, theme, note, content, \
-        img, share, contributor, url_license=None, allows_reproduction=None, licensing_notes=None):
+        img, share, contributor, url_license=None, allows_reproduction=None, licensing_notes=None, commit=True):
     """Add a new URL to the database or update it.
+    With commit=False, the change is left to the caller's transaction.
     """
     entry = db.session.query(Urls).filter_by(url=url).first()
     if entry:
@@ -111,7 +110,8 @@ def create_or_replace_url_in_db(url, title, snippet, doctype, idv, theme, note,
         else:
             u.notes = note
     db.session.add(u)
-    db.session.commit()
+    if commit:
+        db.session.commit()
     return u.id
 
 
@@ -128,11 +128,7 @@ def add_to_npz(v, pod_path):
     Returns:
     vid: the new row number for the vector
     """
-    pod_m = load_npz(pod_path)
-    pod_m = vstack((pod_m,csr_matrix(v)))
-    save_npz(pod_path, pod_m)
-    vid = pod_m.shape[0]
-    return vid
+    return append_to_pod(pod_path, v)
 
 
 ############
@@ -154,8 +150,7 @@ def delete_pod_representations(pod_name):
             db.session.delete(u)
         db.session.commit()
     npz_path = join(pod_dir, contributor, lang, pod_name+'.npz')
-    if isfile(npz_path):
-        remove(npz_path)
+    delete_pod_files(npz_path)
     npz_idx_path = join(pod_dir, contributor, lang, pod_name+'.npz.idx')
     if isfile(npz_idx_path):
         remove(npz_idx_path)
@@ -164,6 +159,7 @@ def delete_pod_representations(pod_name):
         remove(pos_path)
     db.session.delete(pod)
     db.session.commit()
+    live_index.remove_pod(pod_name)
 
 
 def delete_url_representations(url):
@@ -174,26 +170,30 @@ def delete_url_representations(url):
     username = pod.split('.u.')[1]
     logger.debug("delete_url_representations: pod=%s, user=%s", pod, username)
 
-    #Remove document row from .npz matrix
-    try:
-        idv, _ = rm_from_npz(u.vector, pod)
-        update_db_idvs_after_npz_delete(idv, pod)
-    except:
-        logger.debug("delete_url_representations: could not remove vector from npz file.")
-
-    #Remove doc from positional index
-    try:
-        rm_doc_from_pos(u.id, pod)
-    except:
-        logger.debug("delete_url_representations: could not remove vector from pos file.")
-
-    #Delete from database
-    db.session.delete(u)
-    db.session.commit()
+    #Rows of the pod and their ids in the database must not change
+    #until the deletion is committed
+    with pod_lock(pod):
+        #Remove document row from .npz matrix
+        try:
+            idv, _ = rm_from_npz(u.vector, pod)
+            update_db_idvs_after_npz_delete(idv, pod)
+        except:
+            logger.debug("delete_url_representations: could not remove vector from npz file.")
+
+        #Remove doc from positional index
+        try:
+            rm_doc_from_pos(u.id, pod)
+        except:
+            logger.debug("delete_url_representations: could not remove vector from pos file.")
+
+        #Delete from database
+        db.session.delete(u)
+        db.session.commit()
+        live_index.remove_document(url)
 
-    #If pod empty, delete
-    if len(db.session.query(Urls).filter_by(pod=pod).all()) == 0:
-        delete_pod_representations(pod)
+        #If pod empty, delete
+        if len(db.session.query(Urls).filter_by(pod=pod).all()) == 0:
+            delete_pod_representations(pod)
     
     return "Deleted document with url "+url
 
@@ -208,15 +208,7 @@ def rm_from_npz(vid, pod_name):
     """
     contributor, _, lang = parse_pod_name(pod_name)
     pod_path = join(pod_dir, contributor, lang, pod_name+'.npz')
-    pod_m = load_npz(pod_path)
-    logger.debug("rm_from_npz: shape of npz matrix before rm: %s", pod_m.shape)
-    v = pod_m[vid]
-    logger.debug("rm_from_npz: shape of deleted vec: %s", pod_m.shape)
-    m1 = pod_m[:vid]
-    m2 = pod_m[vid+1:]
-    pod_m = vstack((m1,m2))
-    logger.debug("rm_from_npz: shape of npz matrix after rm: %s", pod_m.shape)
-    save_npz(pod_path, pod_m)
+    v = remove_from_pod(pod_path, vid)
     return vid, v
 
 ##############
@@ -234,26 +226,15 @@ def rm_doc_from_pos(vid, pod):
     vid: the ID of the vector recording the wordpieces
     pod: the name of the pod
 
-    Returns: the content of the positional index for that vector.
+    Returns: the positions of the deleted document,
+    as a {token_id: [positions]} dictionary.
     """
     contributor, theme, lang = parse_pod_name(pod)
-    vocab = app_module.models[lang]['vocab']
     posindex = load_posix(contributor, lang, theme)
-    remaining_posindex = []
-    deleted_posindex = []
     logger.debug("rm_doc_from_pos: deleting doc id %s", vid)
-    for token in vocab:
-        token_id = vocab[token]
-        tmp_remaining = {}
-        tmp_deleted = {}
-        for doc_id, posidx in posindex[token_id].items():
-            if doc_id != vid:
-                tmp_remaining[doc_id] = posidx
-            else:
-                tmp_deleted[doc_id] = posidx
-        remaining_posindex.append(tmp_remaining)
-        deleted_posindex.append(tmp_deleted)
-    dump_posix(remaining_posindex, contributor, lang, theme)
+    deleted_posindex = posindex.delete_doc(vid)
+    if deleted_posindex:
+        dump_posix(posindex, contributor, lang, theme)
     return deleted_posindex
 
 ##########
@@ -279,32 +260,34 @@ def mv_pod(src, target, contributor=None):
     try:
         src = src+'.u.'+contributor
         target = target+'.u.'+contributor
-        p = db.session.query(Pods).filter_by(name=src).first()
-
-        #Rename npz
-        src_path = join(pod_path,src+'.npz')
-        target_path = join(pod_path,target+'.npz')
-        rename(src_path, target_path)
-
-        #Rename pos
-        src_path = join(pod_path,src+'.pos')
-        target_path = join(pod_path,target+'.pos')
-        rename(src_path, target_path)
-        
-        #Rename in DB
-        logger.debug("Pod: %s", p.name)
-        p.name = target
-        p.description = target
-        p.url = join('http://localhost:8080/api/pods/',target.replace(' ','+'))
-        db.session.add(p)
-        db.session.commit()
-
-        #Move all URLS
-        urls = db.session.query(Urls).filter_by(pod=src).all()
-        for url in urls:
-            url.pod = target
-            db.session.add(url)
-        db.session.commit()
+        with pod_lock(src, target):
+            p = db.session.query(Pods).filter_by(name=src).first()
+
+            #Rename npz
+            src_path = join(pod_path,src+'.npz')
+            target_path = join(pod_path,target+'.npz')
+            rename_pod_files(src_path, target_path)
+
+            #Rename pos
+            src_path = join(pod_path,src+'.pos')
+            target_path = join(pod_path,target+'.pos')
+            rename(src_path, target_path)
+            
+            #Rename in DB
+            logger.debug("Pod: %s", p.name)
+            p.name = target
+            p.description = target
+            p.url = join('http://localhost:8080/api/pods/',target.replace(' ','+'))
+            db.session.add(p)
+            db.session.commit()
+
+            #Move all URLS
+            urls = db.session.query(Urls).filter_by(pod=src).all()
+            for url in urls:
+                url.pod = target
+                db.session.add(url)
+            db.session.commit()
+        live_index.rename_pod(src, target)
     except:
         return "Renaming failed. Contact your administrator."
     return "Moved pod "+src.split('.u.')[0]+" to "+target.split('.u.')[0]
@@ -14,7 +14,6 @@ class TestingConfig:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     WTF_CSRF_ENABLED = False
     LOAD_MODELS = False
-    LIVE_MATRIX = False
     EXTEND_QUERY = False
 
     SECRET_KEY = 'test-secret-key'
@@ -3,6 +3,8 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 
 import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import pytest
 
 os.environ['_PEARS_CONFIG'] = 'testing'
@@ -19,3 +21,43 @@ def app():
 @pytest.fixture
 def client(app):
     return app.test_client()
+
+
+class _RouteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        status, headers, body = self.server.route(self)
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    """Start local HTTP servers: local_server(route) returns a server
+    whose GET requests are answered by route(request), returning
+    (status, headers, body bytes). The server has the base url of the
+    server in .url and the paths requested in .requests."""
+    servers = []
+
+    def start(route):
+        srv = ThreadingHTTPServer(('127.0.0.1', 0), _RouteHandler)
+        srv.route = route
+        srv.requests = []
+        srv.url = f'http://127.0.0.1:{srv.server_port}'
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        servers.append(srv)
+        return srv
+
+    yield start
+    for srv in servers:
+        srv.shutdown()
+        srv.server_close()
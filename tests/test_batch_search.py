@@ -0,0 +1,101 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+from unittest.mock import patch
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from app.extensions import db
+from app.api.models import Urls
+from app.search import score_pages
+from app.search.live_index import LiveIndex
+
+# Dimensions of the words of the test queries, and of the words
+# their extended versions add
+WORD_DIMS = {'cats': 0, 'dogs': 1, 'birds': 2, 'zebra': 7}
+EXPANSIONS = {'cats': 3, 'dogs': 4, 'birds': 5, 'zebra': 6}
+DOCS = {
+    'http://cats.org/': ('Cats', 'All about cats', [3, 0, 0, 1, 0, 0, 0, 0]),
+    'http://dogs.org/': ('Dogs', 'All about dogs', [0, 2, 0, 0, 1, 0, 0, 0]),
+    'http://pets.org/': ('Pets', 'Cats and dogs at home', [1, 1, 0, 1, 1, 0, 0, 0]),
+    'http://birds.org/': ('Birds', 'Birds of the world', [0, 0, 2, 0, 0, 2, 0, 0]),
+    'http://zoo.org/': ('Zoo', 'Animals of the zoo', [1, 0, 1, 0, 1, 1, 0, 0]),
+}
+
+
+def _query_vectors(query, lang, expansion_length=None):
+    vectors, expanded_vectors = [], []
+    for word in query.split():
+        v = np.zeros(8)
+        v[WORD_DIMS[word]] = 1
+        vectors.append(v)
+        expanded = v.copy()
+        expanded[EXPANSIONS[word]] = 0.5
+        expanded_vectors.append(expanded)
+    return query.split(), query.split(), vectors, expanded_vectors
+
+
+@pytest.fixture
+def search_index(app, monkeypatch):
+    urls = list(DOCS)
+    index = LiveIndex(csr_matrix([DOCS[u][2] for u in urls], dtype=np.float64), urls, [0] * len(urls), ['pets.u.alice'])
+    monkeypatch.setattr(score_pages, 'get_index', lambda lang: index)
+    monkeypatch.setattr(score_pages, 'compute_query_vectors', _query_vectors)
+    with app.app_context():
+        db.create_all()
+        for i, (url, (title, snippet, _)) in enumerate(DOCS.items()):
+            db.session.add(Urls(url=url, title=title, snippet=snippet, vector=i, pod='pets.u.alice'))
+        db.session.commit()
+        try:
+            yield index
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+class TestBatchSearchEndpoint:
+    """Tests for the batched POST /api/search endpoint."""
+
+    def test_rejects_malformed_batches(self, client):
+        assert client.post('/api/search', data='history').status_code == 400
+        assert client.post('/api/search', json={'q': 'history'}).status_code == 400
+        assert client.post('/api/search', json={'queries': ['history', '']}).status_code == 400
+
+    def test_rejects_oversized_batches(self, client):
+        with patch('app.api.controllers.search_batch_size', 2):
+            resp = client.post('/api/search', json={'queries': ['a', 'b', 'c']})
+        assert resp.status_code == 413
+
+    def test_one_result_list_per_query(self, client):
+        answers = [('history', {'http://a': {'score': 1}}), ('music', {})]
+        with patch('app.api.controllers.get_local_batch_search_results', return_value=answers) as search:
+            resp = client.post('/api/search', json={'queries': ['history', 'music']})
+        search.assert_called_once_with(['history', 'music'])
+        assert resp.get_json()['json_list'] == [{'http://a': {'score': 1}}, {}]
+
+
+class TestBatchSearch:
+    """Tests for scoring several queries at once."""
+
+    @pytest.mark.parametrize('extended', [False, True])
+    def test_same_results_as_one_search_per_query(self, search_index, extended):
+        queries = ['cats', 'dogs', 'cats dogs', 'zebra', 'birds']
+        batch = score_pages.run_batch_search(queries, 'en', extended=extended)
+        assert len(batch) == len(queries)
+        for query, (results, scores) in zip(queries, batch):
+            expected_results, expected_scores = score_pages.run_search(query, 'en', extended=extended)
+            assert list(results) == list(expected_results)
+            assert scores == pytest.approx(expected_scores)
+            assert results == expected_results
+        assert batch[3] == ({}, [])
+        assert list(batch[0][0])[0] == 'http://cats.org/'
+
+    def test_same_scores_as_one_query_at_a_time(self, search_index):
+        queries = ['cats', 'dogs', 'zebra']
+        vector_sets = [_query_vectors(q, 'en')[2] for q in queries]
+        batch_scores, _ = score_pages.compute_batch_scores(queries, vector_sets, 'en')
+        for query, vectors, scores in zip(queries, vector_sets, batch_scores):
+            (expected,), _ = score_pages.compute_scores(query, [vectors], 'en')
+            assert scores == pytest.approx(expected)
+        assert batch_scores[2] == {}
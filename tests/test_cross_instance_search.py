@@ -0,0 +1,71 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import json
+from time import sleep, time
+from urllib.parse import parse_qs, urlsplit
+from types import SimpleNamespace
+from app.search import cross_instance_search
+from app.search.cross_instance_search import start_cross_instance_search, collect_cross_instance_results
+
+
+def _instance(name):
+    return {'url': f'https://{name}.example', 'sitename': f'{name}.example',
+            'site_topic': None, 'organization': None}
+
+
+class TestFanOut:
+    """Tests for the concurrent querying of remote instances."""
+
+    def _start(self, app, monkeypatch, delays, languages=('en',)):
+        instances = {lang: [_instance(name) for name in delays] for lang in languages}
+
+        def fetch(instance, query, headers):
+            sleep(delays[instance['sitename'].split('.')[0]])
+            url = instance['url'] + '/page'
+            return {url: {'url': url, 'score': 1, 'x_instance_info': instance}}
+
+        monkeypatch.setattr(cross_instance_search, 'get_best_instances',
+                lambda query, lang, instances, m, top_k, query_vector: instances)
+        monkeypatch.setattr(cross_instance_search, '_fetch_instance_results', fetch)
+        with app.app_context():
+            lang_query = SimpleNamespace(clean_query='query', query_vector=None)
+            context = SimpleNamespace(languages=list(languages), for_lang=lambda lang: lang_query)
+            return start_cross_instance_search(context, instances)
+
+    def test_instances_are_queried_concurrently(self, app, monkeypatch):
+        started = time()
+        pending = self._start(app, monkeypatch, {'a': 0.3, 'b': 0.3, 'c': 0.3})
+        results, complete = collect_cross_instance_results(pending, started, deadline=5)
+        assert complete
+        assert len(results) == 3
+        assert time() - started < 0.8
+
+    def test_deadline_returns_partial_results(self, app, monkeypatch):
+        started = time()
+        pending = self._start(app, monkeypatch, {'fast': 0, 'slow': 2})
+        results, complete = collect_cross_instance_results(pending, started, deadline=0.5)
+        assert not complete
+        assert list(results) == ['https://fast.example/page']
+        assert time() - started < 1.5
+
+    def test_each_query_language_is_routed(self, app, monkeypatch):
+        pending = self._start(app, monkeypatch, {'a': 0, 'b': 0}, languages=('fr', 'de'))
+        assert sorted(instance['url'] for instance, _ in pending) == ['https://a.example', 'https://b.example']
+
+
+class TestRemoteQuery:
+    """Tests for the request sent to a remote instance."""
+
+    def test_query_is_url_encoded(self, app, local_server):
+        query = 'cats & dogs #1 c++'
+        remote = local_server(lambda request: (200, {'Content-Type': 'application/json'}, json.dumps({'json_list': {
+                'https://ex.org/': {'url': 'https://ex.org/', 'score': 1.0}}}).encode('utf-8')))
+        instance = {'url': remote.url, 'sitename': 'remote', 'site_topic': None, 'organization': None}
+        with app.app_context():
+            results = cross_instance_search._fetch_instance_results(instance, query, {})
+        path = urlsplit(remote.requests[0])
+        assert path.path == '/api/search'
+        assert parse_qs(path.query) == {'q': [query]}
+        assert list(results) == ['https://ex.org/']
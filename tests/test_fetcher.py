@@ -0,0 +1,44 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import pytest
+from app.indexer.fetcher import fetch_page, sniff_content_type
+from app.indexer.htmlparser import extract_links
+
+PAGE = b'<!DOCTYPE html><html><head><title>T</title></head><body><a href="/next">next</a></body></html>'
+
+
+def _route(request):
+    if request.path == '/video':
+        return 200, {'Content-Type': 'video/mp4'}, b'\0' * 500000
+    return 200, {'Content-Type': 'application/octet-stream'}, PAGE
+
+
+@pytest.fixture
+def server(local_server):
+    return local_server(_route)
+
+
+class TestFetcher:
+    """Tests for the single-request page retrieval."""
+
+    def test_sniff_content_type(self):
+        assert sniff_content_type('text/html; charset=utf-8', b'%PDF-1.4') == 'text/html; charset=utf-8'
+        assert sniff_content_type('', b'%PDF-1.4\n') == 'application/pdf'
+        assert sniff_content_type('application/octet-stream', b'\n  <!doctype HTML><html>') == 'text/html'
+        assert sniff_content_type('text/plain', b'just text') == 'text/plain'
+
+    def test_one_request_per_page(self, app, server):
+        with app.app_context():
+            page = fetch_page(server.url + '/page')
+            assert page.content_type == 'text/html'
+            assert extract_links(page.url, page) == [server.url + '/next']
+            assert 'fetch' in page.timings and 'parse' in page.timings
+        assert server.requests == ['/page']
+
+    def test_body_of_unindexable_types_is_not_read(self, app, server):
+        with app.app_context():
+            page = fetch_page(server.url + '/video')
+        assert page.content_type == 'video/mp4'
+        assert page.content == b''
@@ -9,34 +9,32 @@ from app.indexer.htmlparser import BS_parse, extract_html
 class TestBSParse:
     """Tests for BS_parse() — issue #151."""
 
-    def test_returns_none_when_head_request_fails(self, app):
-        """When requests.head() raises an exception, BS_parse should
+    def test_returns_none_when_request_fails(self, app):
+        """When the GET request raises an exception, BS_parse should
         return (None, None) without crashing on NoneType access."""
         with app.app_context():
-            with patch('app.indexer.htmlparser.requests.head', side_effect=ConnectionError("refused")):
+            with patch('app.indexer.fetcher.http_client.get', side_effect=ConnectionError("refused")):
                 bs_obj, req = BS_parse('http://nonexistent.invalid')
                 assert bs_obj is None
                 assert req is None
 
     def test_returns_none_for_non_html_content(self, app):
-        """When content-type is not text/html, should return (None, req)."""
+        """When content-type is not text/html, should return (None, page)."""
         with app.app_context():
-            mock_resp = MagicMock()
-            mock_resp.headers = {'content-type': 'application/pdf'}
-            with patch('app.indexer.htmlparser.requests.head', return_value=mock_resp):
+            mock_page = MagicMock(status_code=200, content_type='application/pdf')
+            with patch('app.indexer.htmlparser.fetch_page', return_value=mock_page):
                 bs_obj, req = BS_parse('http://example.com/file.pdf')
                 assert bs_obj is None
-                assert req is mock_resp
+                assert req is mock_page
 
     def test_returns_none_when_content_type_missing(self, app):
         """When content-type header is missing entirely, should not crash."""
         with app.app_context():
-            mock_resp = MagicMock()
-            mock_resp.headers = {}
-            with patch('app.indexer.htmlparser.requests.head', return_value=mock_resp):
+            mock_page = MagicMock(status_code=200, content_type='')
+            with patch('app.indexer.htmlparser.fetch_page', return_value=mock_page):
                 bs_obj, req = BS_parse('http://example.com/no-content-type')
                 assert bs_obj is None
-                assert req is mock_resp
+                assert req is mock_page
 
 
 class TestExtractHtml:
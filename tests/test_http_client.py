@@ -0,0 +1,37 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import pytest
+from app import http_client
+
+
+def _route(request):
+    return 200, {}, b'x' * (1000 if request.path == '/big' else 10)
+
+
+@pytest.fixture
+def server(local_server):
+    return local_server(_route).url
+
+
+class TestHttpClient:
+    """Tests for the shared outbound HTTP client."""
+
+    def test_connections_are_reused(self, server):
+        before = http_client.stats()
+        for _ in range(5):
+            assert http_client.get(server + '/page').content == b'x' * 10
+        after = http_client.stats()
+        assert after['requests'] - before['requests'] == 5
+        assert after['connections'] - before['connections'] == 1
+
+    def test_size_limit(self, server, tmp_path):
+        with pytest.raises(http_client.ResponseTooLarge):
+            http_client.get(server + '/big', max_bytes=100)
+        path = tmp_path / 'big'
+        with pytest.raises(http_client.ResponseTooLarge):
+            http_client.download(server + '/big', str(path), max_bytes=100)
+        assert not path.exists()
+        http_client.download(server + '/big', str(path))
+        assert path.stat().st_size == 1000
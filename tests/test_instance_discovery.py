@@ -0,0 +1,129 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import json
+import threading
+import numpy as np
+import pytest
+from app.search import cross_instance_search, instance_cache, live_index, signature
+from app.search.cross_instance_search import filter_instances_by_language
+from app.search.signature import SIGNATURE_MIMETYPE, encode_signature, decode_signature
+
+
+def _route(request):
+    # behaves like an older instance, which ignores the query string
+    # and only serves signatures as JSON lists
+    path = request.path.split('?')[0].rstrip('/')
+    if path == '/api/languages':
+        body = {'json_list': ['en', 'fr']}
+    elif path in ('/api/signature/en', '/api/signature/fr'):
+        if request.headers.get('If-None-Match') == '"v1"':
+            return 304, {'ETag': '"v1"'}, b''
+        return 200, {'ETag': '"v1"'}, json.dumps([0.0, 1.0, 0.0] if path.endswith('en') else [1.0, 0.0, 0.0]).encode()
+    else:
+        body = {'sitename': 'remote.example', 'site_topic': None, 'organization': None}
+    return 200, {}, json.dumps(body).encode()
+
+
+@pytest.fixture
+def remote(local_server, monkeypatch, tmp_path):
+    srv = local_server(_route)
+    monkeypatch.setattr(instance_cache, 'cache_dir', str(tmp_path))
+    monkeypatch.setattr(cross_instance_search, 'get_known_instances', lambda: [srv.url])
+    return srv
+
+
+class TestInstanceDiscovery:
+    """Tests for the cached discovery of remote instances."""
+
+    def test_fresh_entries_are_not_refetched(self, app, remote):
+        with app.app_context():
+            instances, m, skipped = filter_instances_by_language()
+            assert [i['url'] for i in instances['en']] == [remote.url] and skipped == []
+            assert np.allclose(m['en'], [[0, 1, 0]])
+            hits = len(remote.requests)
+            instances, m, _ = filter_instances_by_language()
+            assert len(remote.requests) == hits
+            assert np.allclose(m['en'], [[0, 1, 0]])
+
+    def test_cached_only_and_revalidation(self, app, remote):
+        with app.app_context():
+            assert filter_instances_by_language(cached_only=True)[0] == {'en': []}
+            filter_instances_by_language()
+            instances, m, _ = filter_instances_by_language(cached_only=True)
+            assert [i['url'] for i in instances['en']] == [remote.url]
+            # A forced refresh revalidates the signature with its ETag
+            instances, m, _ = filter_instances_by_language(max_age=0)
+            assert np.allclose(m['en'], [[0, 1, 0]])
+            assert instance_cache.load_entries()[remote.url]['signature_etags']
+
+    def test_one_signature_per_language(self, app, remote, monkeypatch):
+        monkeypatch.setitem(app.config, 'LANGS', ['en', 'fr', 'de'])
+        with app.app_context():
+            instances, m, _ = filter_instances_by_language()
+            assert [i['url'] for i in instances['fr']] == [remote.url] and instances['de'] == []
+            assert np.allclose(m['en'], [[0, 1, 0]]) and np.allclose(m['fr'], [[1, 0, 0]])
+            instances, m, _ = filter_instances_by_language(cached_only=True)
+            assert np.allclose(m['fr'], [[1, 0, 0]])
+
+    def test_bad_signature_only_skips_its_instance(self, app, remote, local_server, monkeypatch):
+        def bad_route(request):
+            if request.path.startswith('/api/signature'):
+                return 200, {'Content-Type': SIGNATURE_MIMETYPE}, b'garbage'
+            return _route(request)
+        bad = local_server(bad_route)
+        monkeypatch.setattr(cross_instance_search, 'get_known_instances', lambda: [bad.url, remote.url])
+        with app.app_context():
+            instances, m, skipped = filter_instances_by_language()
+        assert [i['url'] for i in instances['en']] == [remote.url]
+        assert skipped == [{'instance': bad.url, 'reason': 'invalid signature from /api/signature'}]
+
+
+class TestSignatureFormat:
+    """Tests for the compact signature wire format."""
+
+    def test_round_trip(self):
+        signature = np.zeros(1000)
+        signature[[3, 17, 999]] = [0.25, 1.5, 0.125]
+        body = encode_signature(signature)
+        assert len(body) < len(json.dumps(signature.tolist())) / 20
+        assert np.array_equal(decode_signature(body), signature)
+        signature[17] = 1 / 3
+        assert np.allclose(decode_signature(encode_signature(signature, 'float16')), signature, rtol=1e-3)
+
+    def test_invalid_bodies(self):
+        body = bytearray(encode_signature(np.array([0, 0.5, 1])))
+        for corrupt in (lambda b: b[:10], lambda b: b[:9] + b'\x07' + b[10:],
+                lambda b: b[:10] + b'\x00\x00\x00\x00' + b[14:], lambda b: b[:20] + b'xx'):
+            with pytest.raises(ValueError):
+                decode_signature(bytes(corrupt(body)))
+
+
+class _SignatureIndex:
+    def __init__(self, values):
+        self.lock = threading.Lock()
+        self.values = values
+        self.calls = 0
+
+    def signature(self):
+        self.calls += 1
+        return np.array(self.values)
+
+
+class TestSignaturePayload:
+    """Tests for the cached signature served to other instances."""
+
+    def test_cached_per_index_generation(self, tmp_path, monkeypatch):
+        index = _SignatureIndex([0, 0.5, 1])
+        monkeypatch.setattr(live_index, 'index_dir', str(tmp_path))
+        monkeypatch.setattr(signature, 'get_index', lambda lang: index)
+        monkeypatch.setattr(signature, '_payloads', {})
+        body, etag = signature.signature_payload('en')
+        assert signature.signature_payload('en') == (body, etag)
+        assert index.calls == 1
+        index.values = [1, 0, 0]
+        live_index.remove_document('http://ex.org/1')
+        new_body, new_etag = signature.signature_payload('en')
+        assert json.loads(new_body) == [1, 0, 0] and new_etag != etag
+        assert index.calls == 2
@@ -0,0 +1,161 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import threading
+import time
+import pytest
+from app.indexer import job_queue
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, 'pod_dir', str(tmp_path))
+    monkeypatch.setattr(job_queue, 'queue_path', str(tmp_path / '.index_queue.db'))
+    monkeypatch.setattr(job_queue, 'lock_dir', str(tmp_path / '.pod_locks'))
+    monkeypatch.setattr(job_queue, '_local', threading.local())
+    return job_queue
+
+
+class TestJobQueue:
+    """Tests for the persistent queue of indexing jobs."""
+
+    def test_jobs_are_claimed_once_in_order(self, queue):
+        first = queue.enqueue('http://ex.org/1', 'cats', '', 'alice', 'http://localhost/')
+        second = queue.enqueue('http://ex.org/2', 'cats', '', 'alice', 'http://localhost/')
+        assert queue.claim()['id'] == first
+        assert queue.claim()['id'] == second
+        assert queue.claim() is None
+        queue.finish(first, True, [], 'http://localhost/api/get?url=http://ex.org/1')
+        queue.finish(second, False, ['request_url: status code is 404'])
+        assert queue.get_job(first)['status'] == queue.DONE
+        assert queue.get_job(second)['messages'] == ['request_url: status code is 404']
+        assert queue.counts() == {'queued': 0, 'running': 0, 'done': 1, 'failed': 1}
+
+    def test_interrupted_jobs_are_taken_over(self, queue, monkeypatch):
+        monkeypatch.setattr(queue, 'INDEX_JOB_LEASE', 0)
+        monkeypatch.setattr(queue, 'INDEX_JOB_ATTEMPTS', 2)
+        job_id = queue.enqueue('http://ex.org/1', 'cats', '', 'alice', 'http://localhost/')
+        assert queue.claim()['id'] == job_id
+        time.sleep(0.01)
+        assert queue.claim()['id'] == job_id
+        time.sleep(0.01)
+        assert queue.claim() is None
+        assert queue.get_job(job_id)['status'] == queue.FAILED
+
+    def test_pod_writes_are_serialized(self, queue):
+        inside, overlaps = [], []
+        def write():
+            with queue.pod_lock('cats.u.alice'):
+                inside.append(1)
+                overlaps.append(len(inside) > 1)
+                time.sleep(0.02)
+                inside.pop()
+        threads = [threading.Thread(target=write) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert overlaps == [False] * 4
+
+    def test_worker_survives_errors(self, app, queue, monkeypatch):
+        monkeypatch.setattr(queue, 'POLL_INTERVAL', 0.01)
+        done = threading.Event()
+        errors = [queue.sqlite3.OperationalError('database is locked'), RuntimeError('finish failed')]
+        def claim(gave_up=None):
+            if errors:
+                raise errors.pop(0)
+            if done.is_set():
+                threading.Event().wait()  # park the worker thread
+            return {'id': 1}
+        monkeypatch.setattr(queue, 'claim', claim)
+        monkeypatch.setattr(queue, 'run_job', lambda job: done.set())
+        threading.Thread(target=queue._work, args=(app,), daemon=True).start()
+        assert done.wait(2)
+
+    def test_delete_while_a_job_appends(self, app, queue, tmp_path, monkeypatch):
+        import app as app_module
+        from scipy.sparse import csr_matrix
+        from app.extensions import db
+        from app.api.models import Urls
+        from app.indexer import controllers
+        from app.indexer.pod_store import load_pod_matrix
+        from app.search import live_index
+        from app import utils_db
+        monkeypatch.setattr(utils_db, 'pod_dir', str(tmp_path))
+        monkeypatch.setattr(live_index, 'index_dir', str(tmp_path / '.search_index'))
+        monkeypatch.setattr(app_module, 'VEC_SIZE', 8)
+        monkeypatch.setattr(app_module, 'models', {'en': {'vocab': list('abcdefgh')}})
+        vectors = {f'http://ex.org/{i}': csr_matrix(([1.0], ([0], [i])), shape=(1, 8)) for i in range(4)}
+        pages = {url: {'url': url, 'lang': 'en', 'title': url, 'snippet': '', 'vector': v} for url, v in vectors.items()}
+        monkeypatch.setattr(controllers, 'fetch_url_page', lambda url, contributor: (pages[url], []))
+
+        def run_job(job):
+            with app.app_context():
+                queue.run_job(job)
+        job_id = queue.enqueue('http://ex.org/3', 'cats', '', 'alice', 'http://localhost/')
+        worker = threading.Thread(target=run_job, args=(queue.claim(),))
+        blocked = []
+        renumber = utils_db.update_db_idvs_after_npz_delete
+        def renumber_during_job(idv, pod):
+            # The job tries to append between the row removal and the renumbering
+            worker.start()
+            worker.join(0.5)
+            blocked.append(worker.is_alive())
+            renumber(idv, pod)
+        monkeypatch.setattr(utils_db, 'update_db_idvs_after_npz_delete', renumber_during_job)
+
+        with app.app_context():
+            db.create_all()
+            try:
+                for i in range(3):
+                    controllers.store_url_page(pages[f'http://ex.org/{i}'], 'cats', '', 'alice', 'http://localhost/')
+                utils_db.delete_url_representations('http://ex.org/0')
+                worker.join()
+                m = load_pod_matrix(str(tmp_path / 'alice' / 'en' / 'cats.u.alice.npz'))
+                rows = {u.url: u.vector for u in Urls.query.all()}
+            finally:
+                db.session.remove()
+                db.drop_all()
+        assert blocked == [True]
+        assert queue.get_job(job_id)['status'] == queue.DONE
+        assert sorted(rows) == ['http://ex.org/1', 'http://ex.org/2', 'http://ex.org/3']
+        assert m.shape[0] == 4  # with the zero row of new pods
+        for url, idv in rows.items():
+            assert (m[idv] != vectors[url]).nnz == 0
+
+    def test_jobs_note_their_outcome_in_suggestions(self, app, queue, monkeypatch):
+        from app.extensions import db
+        from app.api.models import Suggestions
+        from app.indexer import controllers
+        monkeypatch.setattr(queue, 'INDEX_JOB_LEASE', 0)
+        monkeypatch.setattr(queue, 'INDEX_JOB_ATTEMPTS', 1)
+        def fetch_url_page(url, contributor):
+            if url == 'http://ex.org/missing':
+                return None, ['request_url: status code is 404']
+            return {'url': url}, []
+        monkeypatch.setattr(controllers, 'fetch_url_page', fetch_url_page)
+        monkeypatch.setattr(controllers, 'store_url_page', lambda page, *args: 'http://localhost/api/get?url='+page['url'])
+        with app.app_context():
+            db.create_all()
+            try:
+                db.session.add(Suggestions(url='http://ex.org/', pod='cats', notes='Nice', contributor='bob'))
+                db.session.commit()
+                suggestion = Suggestions.query.first()
+                failed = queue.enqueue('http://ex.org/missing', 'cats', '', 'alice', 'http://localhost/', suggestion.id)
+                queue.run_job(queue.claim())
+                indexed = queue.enqueue('http://ex.org/', 'cats', '', 'alice', 'http://localhost/', suggestion.id)
+                queue.run_job(queue.claim())
+                dropped = queue.enqueue('http://ex.org/', 'cats', '', 'alice', 'http://localhost/', suggestion.id)
+                queue.claim()
+                time.sleep(0.01)
+                assert queue.claim(lambda job: queue._note_suggestion(job, False, job['messages'])) is None
+                db.session.expire_all()
+                notes = Suggestions.query.first().notes
+            finally:
+                db.session.remove()
+                db.drop_all()
+        assert notes.startswith('Nice\n\n-----\nTimestamp: ')
+        assert f"Indexing failed: http://ex.org/missing (job {failed})\nrequest_url: status code is 404" in notes
+        assert f"Indexed as: http://ex.org/ (job {indexed})" in notes
+        assert f"Indexing failed: http://ex.org/ (job {dropped})\nIndexing was interrupted too many times." in notes
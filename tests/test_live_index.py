@@ -0,0 +1,116 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import numpy as np
+from scipy.sparse import random as sparse_random
+from app.search import live_index
+from app.search.live_index import LiveIndex
+from app.search.sparse_cosine import sparse_cosines
+
+
+def _index():
+    m = sparse_random(6, 40, density=0.3, format='csr', random_state=0)
+    urls = [f'http://ex.org/{i}' for i in range(6)]
+    return LiveIndex(m, urls, [0, 0, 0, 1, 1, 1], ['cats.u.alice', 'dogs.u.alice']), m
+
+
+def _scores(index, q):
+    cos, urls, row_pods, podnames = index.cosines(q)
+    return {urls[i]: (round(cos[i], 10), podnames[row_pods[i]]) for i in np.flatnonzero(cos)}
+
+
+class TestLiveIndex:
+    """Tests for incremental updates of the in-memory search index."""
+
+    def setup_method(self):
+        self.q = np.ones((1, 40))
+        self.v = sparse_random(1, 40, density=0.5, format='csr', random_state=1)
+
+    def test_add_and_remove(self):
+        index, m = _index()
+        index.add('http://ex.org/new', 'birds.u.alice', self.v)
+        index.remove('http://ex.org/2')
+        scores = _scores(index, self.q)
+        assert 'http://ex.org/2' not in scores
+        assert scores['http://ex.org/new'][1] == 'birds.u.alice'
+        assert np.isclose(scores['http://ex.org/new'][0], sparse_cosines(self.q, self.v)[0])
+        assert np.isclose(scores['http://ex.org/0'][0], sparse_cosines(self.q, m)[0])
+
+    def test_replace_url(self):
+        index, _ = _index()
+        index.add('http://ex.org/1', 'cats.u.alice', self.v)
+        cos, urls, _, _ = index.cosines(self.q)
+        assert [urls[i] for i in np.flatnonzero(cos)].count('http://ex.org/1') == 1
+
+    def test_compacted_keeps_scores(self):
+        index, _ = _index()
+        index.add('http://ex.org/new', 'birds.u.alice', self.v)
+        index.remove_pod('dogs.u.alice')
+        index.rename_pod('cats.u.alice', 'felines.u.alice')
+        before = _scores(index, self.q)
+        compacted = LiveIndex(*index.compacted())
+        assert compacted.num_rows == 4
+        assert _scores(compacted, self.q) == before
+        assert {pod for _, pod in before.values()} <= {'felines.u.alice', 'birds.u.alice'}
+
+
+    def test_signature_is_kept_up_to_date(self):
+        index, _ = _index()
+        index.signature()
+        index.add('http://ex.org/new', 'birds.u.alice', self.v)
+        index.remove('http://ex.org/4')
+        index.remove_pod('cats.u.alice')
+        fresh = LiveIndex(*index.compacted())
+        assert np.allclose(index.signature(), fresh.signature())
+
+
+class TestSnapshots:
+    """Tests for the memory-mapped snapshot shared by processes."""
+
+    def setup_method(self):
+        self.q = np.ones((1, 40))
+
+    def test_journal_and_snapshot_swap(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(live_index, 'index_dir', str(tmp_path))
+        monkeypatch.setattr(live_index, 'LIVE_COMPACT_ROWS', 3)
+        index, _ = _index()
+        (tmp_path / 'en').mkdir()
+        name = live_index.write_snapshot('en', *index.compacted())
+        worker = live_index.load_snapshot('en', name)
+        assert not worker.m.data.flags.writeable and not worker.m.indices.flags.writeable
+        assert _scores(worker, self.q) == _scores(index, self.q)
+
+        v = sparse_random(1, 40, density=0.5, format='csr', random_state=1)
+        live_index.index_document('en', 'http://ex.org/new', 'birds.u.alice', v)
+        live_index.remove_document('http://ex.org/0')
+        live_index._catch_up('en', worker)
+        index.add('http://ex.org/new', 'birds.u.alice', v)
+        index.remove('http://ex.org/0')
+        assert _scores(worker, self.q) == _scores(index, self.q)
+
+        # The third journal entry triggers a new snapshot
+        live_index.rename_pod('dogs.u.alice', 'hounds.u.alice')
+        index.rename_pod('dogs.u.alice', 'hounds.u.alice')
+        assert live_index.current_snapshot('en') != name
+        fresh = live_index.load_snapshot('en', live_index.current_snapshot('en'))
+        assert fresh.num_rows == 6 and not fresh.pending
+        assert _scores(fresh, self.q) == _scores(index, self.q)
+
+    def test_snapshot_removed_while_loading(self, app, tmp_path, monkeypatch):
+        monkeypatch.setattr(live_index, 'index_dir', str(tmp_path))
+        monkeypatch.setattr(live_index, 'indices', {})
+        index, _ = _index()
+        (tmp_path / 'en').mkdir()
+        with live_index._locked('en'):
+            stale = live_index.write_snapshot('en', *index.compacted())
+            live_index.write_snapshot('en', *index.compacted())
+            live_index.write_snapshot('en', *index.compacted())
+        # A worker read CURRENT just before both compactions
+        current_snapshot = live_index.current_snapshot
+        names = [stale]
+        monkeypatch.setattr(live_index, 'current_snapshot', lambda lang: names.pop() if names else current_snapshot(lang))
+        with app.app_context():
+            loaded = live_index.get_index('en')
+        assert loaded.snapshot == 'snap-3'
+        assert _scores(loaded, self.q) == _scores(index, self.q)
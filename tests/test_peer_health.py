@@ -0,0 +1,53 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import pytest
+from app.search import peer_health
+
+
+@pytest.fixture(autouse=True)
+def clean_state(monkeypatch):
+    monkeypatch.setattr(peer_health, '_peers', {})
+    monkeypatch.setattr(peer_health, '_results', {})
+    monkeypatch.setattr(peer_health, 'PEER_FAILURE_THRESHOLD', 2)
+
+
+class TestPeerHealth:
+    """Tests for the circuit breaker and latency tracking of remote instances."""
+
+    def test_circuit_opens_then_probes(self, monkeypatch):
+        url = 'https://peer.example'
+        peer_health.record_failure(url)
+        assert peer_health.allow_request(url)
+        peer_health.record_failure(url)
+        assert not peer_health.allow_request(url)
+        assert not peer_health.is_available(url)
+
+        monkeypatch.setattr(peer_health, 'PEER_RETRY_AFTER', 0)
+        assert peer_health.allow_request(url)
+        # Only one probe at a time
+        assert not peer_health.allow_request(url)
+        peer_health.record_failure(url)
+        assert peer_health.stats()[url]['state'] == peer_health.OPEN
+        assert peer_health.allow_request(url)
+        peer_health.record_success(url, 0.5)
+        assert peer_health.stats()[url]['state'] == peer_health.CLOSED
+        assert peer_health.allow_request(url) and peer_health.allow_request(url)
+
+    def test_latency_average(self, monkeypatch):
+        monkeypatch.setattr(peer_health, 'PEER_LATENCY_ALPHA', 0.5)
+        url = 'https://peer.example'
+        assert peer_health.latency(url) is None
+        peer_health.record_success(url, 1.0)
+        peer_health.record_success(url, 3.0)
+        assert peer_health.latency(url) == 2.0
+
+    def test_result_cache(self, monkeypatch):
+        results = {'https://a.example/': {'score': 1}}
+        peer_health.put_results('https://peer.example', 'river', results)
+        cached = peer_health.get_results('https://peer.example', 'river')
+        assert cached == results and cached is not results
+        assert peer_health.get_results('https://peer.example', 'lake') is None
+        monkeypatch.setattr(peer_health, 'REMOTE_RESULT_CACHE_TTL', 0)
+        assert peer_health.get_results('https://peer.example', 'river') is None
@@ -0,0 +1,113 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+from os.path import isfile
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix, load_npz, save_npz
+from app.indexer import pod_store
+from app.indexer.pod_store import (create_pod_matrix, append_to_pod, append_rows_to_pod, load_pod_matrix,
+        pod_num_rows, compact_pod, remove_from_pod, save_pod_matrix, pod_log_path)
+
+
+def _vec(i, size=50):
+    v = np.zeros((1, size))
+    v[0, i % size] = 1.0 + i
+    v[0, (3 * i) % size] = 0.5
+    return v
+
+
+class TestPodStore:
+    """Tests for the append-only pod matrix storage."""
+
+    def test_append_returns_consecutive_rows(self, tmp_path):
+        npz = str(tmp_path / 'home.u.alice.npz')
+        create_pod_matrix(npz, 50)
+        ids = [append_to_pod(npz, _vec(i)) for i in range(5)]
+        assert ids == [1, 2, 3, 4, 5]
+        assert pod_num_rows(npz) == 6
+        m = load_pod_matrix(npz)
+        assert m.shape == (6, 50)
+        assert np.allclose(m[3].toarray(), _vec(2))
+
+    def test_append_rows_in_one_write(self, tmp_path):
+        npz = str(tmp_path / 'home.u.alice.npz')
+        create_pod_matrix(npz, 50)
+        append_to_pod(npz, _vec(0))
+        assert append_rows_to_pod(npz, [_vec(i) for i in range(1, 4)]) == 2
+        assert append_to_pod(npz, _vec(4)) == 5
+        m = load_pod_matrix(npz)
+        assert np.allclose(m[1:].toarray(), np.vstack([_vec(i) for i in range(5)]))
+
+    def test_compaction_keeps_rows(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(pod_store, 'COMPACT_ROWS', 3)
+        npz = str(tmp_path / 'home.u.alice.npz')
+        create_pod_matrix(npz, 50)
+        for i in range(7):
+            append_to_pod(npz, _vec(i))
+        # The base file alone is readable by scipy and holds the compacted rows
+        assert load_npz(npz).shape[0] == 7
+        m = load_pod_matrix(npz)
+        assert m.shape[0] == 8
+        assert np.allclose(m[1:].toarray(), np.vstack([_vec(i) for i in range(7)]))
+
+    def test_legacy_npz_is_read_as_is(self, tmp_path):
+        npz = str(tmp_path / 'home.u.alice.npz')
+        legacy = csr_matrix(np.vstack([np.zeros((1, 50)), _vec(1), _vec(2)]))
+        save_npz(npz, legacy)
+        assert pod_num_rows(npz) == 3
+        assert append_to_pod(npz, _vec(3)) == 3
+        m = compact_pod(npz)
+        assert m.shape[0] == 4
+        assert np.allclose(load_npz(npz)[:3].toarray(), legacy.toarray())
+
+    def test_absorbed_log_is_not_replayed(self, tmp_path):
+        """Simulates a crash after the base was rewritten but before
+        the log was reset: rows must not be duplicated."""
+        npz = str(tmp_path / 'home.u.alice.npz')
+        create_pod_matrix(npz, 50)
+        append_to_pod(npz, _vec(1))
+        with open(pod_log_path(npz), 'rb') as f:
+            stale_log = f.read()
+        compact_pod(npz)
+        with open(pod_log_path(npz), 'wb') as f:
+            f.write(stale_log)
+        assert pod_num_rows(npz) == 2
+        assert load_pod_matrix(npz).shape[0] == 2
+        assert append_to_pod(npz, _vec(2)) == 2
+
+    def test_log_id_ending_in_nul_is_kept(self, tmp_path, monkeypatch):
+        """numpy bytes arrays drop trailing NULs: an absorbed log whose
+        id ends in NUL must still be recognised."""
+        monkeypatch.setattr(pod_store, 'uuid4', lambda: SimpleNamespace(bytes=b'\x07' * 14 + b'\x00\x00'))
+        self.test_absorbed_log_is_not_replayed(tmp_path)
+
+    def test_remove_shifts_rows(self, tmp_path):
+        npz = str(tmp_path / 'home.u.alice.npz')
+        create_pod_matrix(npz, 50)
+        for i in range(4):
+            append_to_pod(npz, _vec(i))
+        v = remove_from_pod(npz, 2)
+        assert np.allclose(v.toarray(), _vec(1))
+        m = load_pod_matrix(npz)
+        assert m.shape[0] == 4
+        assert np.allclose(m[2].toarray(), _vec(2))
+        assert isfile(pod_log_path(npz))
+
+    def test_reads_create_no_log(self, tmp_path):
+        npz = str(tmp_path / 'home.u.alice.npz')
+        create_pod_matrix(npz, 50)
+        assert load_pod_matrix(npz).shape[0] == 1
+        assert pod_num_rows(npz) == 1
+        assert not isfile(pod_log_path(npz))
+        missing = str(tmp_path / 'missing.u.alice.npz')
+        for f in (load_pod_matrix, pod_num_rows, lambda npz: append_to_pod(npz, _vec(1))):
+            with pytest.raises(FileNotFoundError):
+                f(missing)
+        assert not isfile(pod_log_path(missing))
+        append_to_pod(npz, _vec(1))
+        assert isfile(pod_log_path(npz))
+        save_pod_matrix(missing, csr_matrix(_vec(2)))
+        assert load_pod_matrix(missing).shape[0] == 1
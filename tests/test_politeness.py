@@ -0,0 +1,32 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import threading
+import time
+from app.indexer.politeness import HostLimiter, interleave_hosts
+
+
+class TestPoliteness:
+    """Tests for the per-host limits of concurrent fetching."""
+
+    def test_interleave_hosts(self):
+        urls = ['http://a.org/1', 'http://a.org/2', 'http://a.org/3', 'http://b.org/1', 'http://c.org/1']
+        assert interleave_hosts(urls) == ['http://a.org/1', 'http://b.org/1', 'http://c.org/1',
+                'http://a.org/2', 'http://a.org/3']
+
+    def test_requests_to_a_host_are_spaced(self):
+        limiter = HostLimiter(max_concurrent=1, delay=0.05)
+        starts = []
+        def fetch(url):
+            with limiter.slot(url):
+                starts.append((url, time.time()))
+        threads = [threading.Thread(target=fetch, args=(url,)) for url in ['http://a.org/1', 'http://a.org/2', 'http://b.org/1']]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        a_starts = sorted(t for url, t in starts if 'a.org' in url)
+        b_start = [t for url, t in starts if 'b.org' in url][0]
+        assert a_starts[1] - a_starts[0] >= 0.045
+        assert b_start - min(a_starts) < 0.045
@@ -0,0 +1,52 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import joblib
+from app.indexer.posix import PosIndex, read_posix_file, convert_posix_file, is_legacy_posix
+
+
+def _legacy_index():
+    legacy = [{} for _ in range(20)]
+    legacy[2] = {1: '0|7', 3: '4'}
+    legacy[5] = {1: '2', 2: '1|3|300'}
+    legacy[19] = {200: '100000'}
+    return legacy
+
+
+class TestPosIndex:
+    """Tests for the compact positional index format."""
+
+    def test_round_trip(self, tmp_path):
+        path = str(tmp_path / 'home.u.alice.pos')
+        posindex = PosIndex.from_legacy(_legacy_index())
+        posindex.save(path)
+        loaded = read_posix_file(path)
+        assert len(loaded) == 20
+        assert list(loaded) == _legacy_index()
+        assert loaded.postings(5) == {1: [2], 2: [1, 3, 300]}
+
+    def test_legacy_file_conversion(self, tmp_path):
+        path = str(tmp_path / 'home.u.alice.pos')
+        joblib.dump(_legacy_index(), path)
+        assert is_legacy_posix(path)
+        assert list(read_posix_file(path)) == _legacy_index()
+        assert convert_posix_file(path)
+        assert not is_legacy_posix(path)
+        assert not convert_posix_file(path)
+        assert list(read_posix_file(path)) == _legacy_index()
+
+    def test_add_and_delete_doc(self, tmp_path):
+        path = str(tmp_path / 'home.u.alice.pos')
+        PosIndex.from_legacy(_legacy_index()).save(path)
+        posindex = read_posix_file(path)
+        posindex.add_position(7, 4, 0)
+        posindex.add_position(2, 4, 9)
+        assert posindex.doc_ids() == {1, 2, 3, 4, 200}
+        deleted = posindex.delete_doc(1)
+        assert deleted == {2: [0, 7], 5: [2]}
+        posindex.save(path)
+        loaded = read_posix_file(path)
+        assert loaded[2] == {3: '4', 4: '9'}
+        assert loaded[7] == {4: '0'}
+        assert loaded.doc_ids() == {2, 3, 4, 200}
@@ -0,0 +1,61 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import threading
+import pytest
+import app as app_module
+from app.search import controllers, query_context, result_cache, live_index, score_pages
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, 'pod_dir', str(tmp_path))
+    monkeypatch.setattr(result_cache, 'cache_path', str(tmp_path / '.result_cache.db'))
+    monkeypatch.setattr(result_cache, '_local', threading.local())
+    monkeypatch.setattr(live_index, 'index_dir', str(tmp_path / '.search_index'))
+    return result_cache
+
+
+class TestResultCache:
+    """Tests for the shared search result cache."""
+
+    def test_hit_and_miss(self, cache):
+        key = cache.cache_key('  Cats  and Dogs', 'en', 'local')
+        assert key == cache.cache_key('cats and dogs', 'en', 'local')
+        assert key != cache.cache_key('cats and dogs', 'en', 'remote')
+        assert cache.get(key) is None
+        cache.put(key, {'query': 'cats dogs', 'results': [['http://ex.org', {'score': 1.5}]]}, live_index.index_generation())
+        assert cache.get(key)['results'] == [['http://ex.org', {'score': 1.5}]]
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+    def test_index_changes_invalidate(self, cache):
+        key = cache.cache_key('cats', 'en', 'local')
+        cache.put(key, {'query': 'cats', 'results': []}, live_index.index_generation())
+        live_index.remove_document('http://ex.org/1')
+        assert cache.get(key) is None
+
+    def test_ttl_and_size(self, cache, monkeypatch):
+        monkeypatch.setattr(cache, 'RESULT_CACHE_SIZE', 2)
+        for q in ['a', 'b', 'c']:
+            cache.put(cache.cache_key(q, None, 'local'), q, live_index.index_generation())
+        assert cache.stats()['entries'] == 2
+        assert cache.get(cache.cache_key('a', None, 'local')) is None
+        monkeypatch.setattr(cache, 'RESULT_CACHE_TTL', 0)
+        assert cache.get(cache.cache_key('c', None, 'local')) is None
+
+    def test_change_during_search_is_not_served(self, app, cache, monkeypatch):
+        searches = []
+        def run_search(query, lang, extended=False, context=None):
+            searches.append(query)
+            # A document is deleted while the search runs
+            live_index.remove_document('http://ex.org/1')
+            return {'http://ex.org/1': {'score': 1.0}}, [1.0]
+        monkeypatch.setattr(app_module, 'models', {'en': {'stopwords': []}})
+        monkeypatch.setattr(query_context, 'compute_query_vectors', lambda *args, **kwargs: ([], [], [], []))
+        monkeypatch.setattr(score_pages, 'run_search', run_search)
+        with app.app_context():
+            controllers.get_local_search_results('cats')
+            controllers.get_local_search_results('cats')
+        assert searches == ['cats', 'cats']
@@ -0,0 +1,82 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import threading
+from collections import OrderedDict
+from unittest.mock import patch, MagicMock
+import pytest
+from app.indexer import robots
+from app.indexer.robots import parse_robots
+
+ROBOTS_TXT = """
+User-agent: *
+Disallow: /private
+Allow: /private/public
+Disallow: /*.pdf$
+Crawl-delay: 5
+
+User-agent: otherbot
+User-agent: PeARSbot
+Disallow: /
+Allow: /wiki/
+
+User-agent: evilbot
+Disallow: /
+"""
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(robots, 'pod_dir', str(tmp_path))
+    monkeypatch.setattr(robots, 'cache_path', str(tmp_path / '.robots_cache.db'))
+    monkeypatch.setattr(robots, '_local', threading.local())
+    monkeypatch.setattr(robots, '_rules', OrderedDict())
+    return robots
+
+
+class TestRobots:
+    """Tests for the robots.txt parser and cache."""
+
+    def test_longest_match_wins(self):
+        rules = parse_robots(ROBOTS_TXT, 'somebot')
+        assert not rules.allowed('/private/page')
+        assert rules.allowed('/private/public/page')
+        assert not rules.allowed('/docs/file.pdf')
+        assert rules.allowed('/docs/file.pdf?download=1')
+        assert rules.allowed('/index.html')
+        assert rules.crawl_delay == 5
+
+    def test_own_group_applies(self):
+        rules = parse_robots(ROBOTS_TXT, 'pearsbot')
+        assert rules.allowed('/wiki/Page')
+        assert not rules.allowed('/private/public/page')
+        assert rules.crawl_delay is None
+        assert rules.allowed('/robots.txt')
+
+    def test_product_token_is_matched_exactly(self):
+        text = "User-agent: bot\nUser-agent: p\nUser-agent: pearsbot-old\nDisallow: /\n"
+        assert parse_robots(text, 'PeARSbot').allowed('/page')
+        assert not parse_robots(text, 'BOT').allowed('/page')
+
+    def test_robots_txt_is_fetched_once_per_site(self, app, cache):
+        resp = MagicMock(status_code=200, text=ROBOTS_TXT)
+        with app.app_context(), patch('app.indexer.robots.http_client.get', return_value=resp) as get:
+            assert cache.can_fetch('https://ex.org/wiki/Page')
+            assert not cache.can_fetch('https://EX.org/private')
+            # The test agent (PeARSbot-test) follows the '*' group
+            assert cache.crawl_delay('https://ex.org/') == 5
+            assert get.call_count == 1
+            # Other processes (or a restarted one) use the stored file
+            cache._rules.clear()
+            assert not cache.can_fetch('https://ex.org/private')
+            assert get.call_count == 1
+            assert cache.can_fetch('http://ex.org/private') is False
+            assert get.call_count == 2
+
+    def test_unavailable_and_unreachable_robots_txt(self, app, cache):
+        with app.app_context():
+            with patch('app.indexer.robots.http_client.get', return_value=MagicMock(status_code=404)):
+                assert cache.can_fetch('https://a.org/anything')
+            with patch('app.indexer.robots.http_client.get', return_value=MagicMock(status_code=503)):
+                assert not cache.can_fetch('https://b.org/anything')
@@ -0,0 +1,22 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import numpy as np
+from app.search.score_pages import top_k
+
+
+class TestTopK:
+    """Tests for the top-k selection used by compute_scores()."""
+
+    def test_matches_full_sort(self):
+        rng = np.random.default_rng(0)
+        scores = rng.random(1000)
+        scores[rng.choice(1000, 400, replace=False)] = 0
+        expected = np.argsort(scores)[::-1][:50]
+        assert list(top_k(scores, 50)) == list(expected)
+
+    def test_only_non_zero_scores(self):
+        scores = np.array([0, 0.3, 0, 0.9, 0])
+        assert list(top_k(scores, 50)) == [3, 1]
+        assert len(top_k(np.zeros(10), 50)) == 0
@@ -0,0 +1,56 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import numpy as np
+from scipy.sparse import random as sparse_random
+from scipy.spatial import distance
+from app.search.sparse_cosine import squared_matrix, sparse_cosines, batch_sparse_cosines
+
+
+def _dense_cosines(query_vector, m):
+    """Reference implementation: cdist over the query's non-zero columns."""
+    a = np.where(query_vector != 0)[1]
+    cos = 1 - distance.cdist(query_vector[:, a], m.toarray()[:, a], 'cosine')[0]
+    cos[np.isnan(cos)] = 0
+    return cos
+
+
+class TestSparseCosines:
+    """Tests for the sparse scoring path used by compute_scores()."""
+
+    def setup_method(self):
+        self.m = sparse_random(200, 500, density=0.02, format='csr', random_state=0)
+        self.query = np.zeros((1, 500))
+        self.query[0, [3, 17, 250, 499]] = [0.5, 0.1, 0.8, 0.3]
+
+    def test_matches_cdist_on_query_columns(self):
+        expected = _dense_cosines(self.query, self.m)
+        cos = sparse_cosines(self.query, self.m)
+        assert np.allclose(cos, expected)
+
+    def test_same_top_ordering_as_cdist(self):
+        expected = _dense_cosines(self.query, self.m)
+        cos = sparse_cosines(self.query, self.m, squared_matrix(self.m))
+        nonzero = np.count_nonzero(expected)
+        assert nonzero > 0
+        assert set(np.argsort(cos)[-nonzero:]) == set(np.argsort(expected)[-nonzero:])
+
+    def test_empty_query_gives_zeros(self):
+        cos = sparse_cosines(np.zeros((1, 500)), self.m)
+        assert cos.shape == (200,)
+        assert not cos.any()
+
+    def test_squared_matrix_shares_structure(self):
+        m_sq = squared_matrix(self.m)
+        assert np.shares_memory(m_sq.indices, self.m.indices)
+        assert np.allclose(m_sq.toarray(), self.m.toarray() ** 2)
+
+    def test_batch_matches_single_queries(self):
+        extended = self.query.copy()
+        extended[0, [4, 18, 300]] = [0.2, 0.7, 0.05]
+        queries = np.vstack([self.query, extended, np.zeros((1, 500))])
+        cos = batch_sparse_cosines(queries, self.m)
+        assert cos.shape == (200, 3)
+        for j in range(3):
+            assert np.allclose(cos[:, j], sparse_cosines(queries[j], self.m))
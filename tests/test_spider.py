@@ -0,0 +1,66 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import threading
+from collections import OrderedDict
+import pytest
+from app.indexer import robots
+from app.indexer.politeness import HostLimiter
+from app.indexer.spider import crawl, normalize_url
+
+SITE = {
+    '/docs/': '<a href="a.html">a</a> <a href="b.html#top">b</a> <a href="/private/x">x</a> <a href="/other">o</a>',
+    '/docs/a.html': '<a href="b.html">b</a> <a href="/docs/">up</a> <a href="mailto:me@ex.org">me</a>',
+    '/docs/b.html': '<a href="c.html">c</a>',
+    '/docs/c.html': '<a href="d.html">d</a>',
+    '/docs/d.html': 'end',
+}
+
+
+def _route(request):
+    if request.path == '/robots.txt':
+        return 200, {'Content-Type': 'text/plain'}, b'User-agent: *\nDisallow: /docs/c'
+    if request.path in SITE:
+        return 200, {'Content-Type': 'text/html'}, ('<html><body>' + SITE[request.path] + '</body></html>').encode()
+    return 404, {}, b''
+
+
+@pytest.fixture
+def server(local_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(robots, 'pod_dir', str(tmp_path))
+    monkeypatch.setattr(robots, 'cache_path', str(tmp_path / '.robots_cache.db'))
+    monkeypatch.setattr(robots, '_local', threading.local())
+    monkeypatch.setattr(robots, '_rules', OrderedDict())
+    return local_server(_route)
+
+
+class TestSpider:
+    """Tests for the site crawler."""
+
+    def test_normalize_url(self):
+        assert normalize_url('HTTPS://Ex.ORG:443') == 'https://ex.org/'
+        assert normalize_url('http://ex.org:8080/a/B?q=1#frag') == 'http://ex.org:8080/a/B?q=1'
+        assert normalize_url('mailto:me@ex.org') is None
+        assert normalize_url('javascript:void(0)') is None
+
+    def test_crawl_is_polite_and_fetches_each_page_once(self, app, server):
+        limiter = HostLimiter(max_concurrent=2, delay=0)
+        with app.app_context():
+            pages = {url: depth for url, depth, _ in crawl(server.url + '/docs/', limiter=limiter)}
+        assert pages == {server.url + '/docs/': 0, server.url + '/docs/a.html': 1, server.url + '/docs/b.html': 1}
+        assert sorted(server.requests) == ['/docs/', '/docs/a.html', '/docs/b.html', '/robots.txt']
+
+    def test_crawl_budgets(self, app, server):
+        limiter = HostLimiter(max_concurrent=2, delay=0)
+        with app.app_context():
+            shallow = [url for url, _, _ in crawl(server.url + '/docs/', max_depth=0, limiter=limiter)]
+            assert shallow == [server.url + '/docs/']
+            results = list(crawl(server.url + '/docs/', max_pages=2, workers=1, limiter=limiter,
+                    process=lambda page: page.content))
+        assert len(results) == 2
+        assert results[0][2].startswith(b'<html>')
+
+    def test_invalid_start_url(self):
+        with pytest.raises(ValueError):
+            next(crawl('mailto:me@ex.org'))
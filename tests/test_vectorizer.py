@@ -0,0 +1,57 @@
+# SPDX-FileCopyrightText: 2026 PeARS Project, <community@pearsproject.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import numpy as np
+import pytest
+from sklearn import preprocessing
+from sklearn.feature_extraction.text import CountVectorizer
+import app as app_module
+from app.indexer.vectorizer import wta_dense, wta_sparse, vectorize_scale, vectorize_scale_docs
+
+
+def reference_vectorize_scale(model, text, power, top_words):
+    ''' The former one document, dense implementation. '''
+    logprobs = np.array([logprob ** power for logprob in model['logprobs']])
+    X = model['vectorizer'].fit_transform([text]).multiply(logprobs)
+    X = wta_dense(X.toarray(), top_words, False)
+    return preprocessing.Normalizer(norm='l2').fit(X).transform(X)
+
+
+@pytest.fixture
+def model(monkeypatch):
+    rng = np.random.default_rng(0)
+    vocab = {f'w{i}': i for i in range(200)}
+    model = {'vocab': vocab, 'logprobs': list(rng.uniform(5, 15, 200)),
+            'vectorizer': CountVectorizer(vocabulary=vocab, lowercase=True, token_pattern='[^ ]+')}
+    monkeypatch.setitem(app_module.models, 'xx', model)
+    return model
+
+
+def random_docs(n, rng):
+    docs = [' '.join(f'w{i}' for i in rng.integers(0, 200, rng.integers(1, 80))) for _ in range(n)]
+    return docs + ['', 'w1 w1 w2 w3', 'unknown words only']
+
+
+class TestVectorizer:
+    """Tests for the batched document encoder."""
+
+    def test_wta_sparse_matches_dense(self):
+        rng = np.random.default_rng(1)
+        m = rng.random((30, 50)) * (rng.random((30, 50)) < 0.3)
+        m[0, :5] = 0.5  # ties
+        m[1] = 0
+        m[2, 3:] = 0
+        for k in (1, 3, 10, 15, 50):
+            assert np.array_equal(wta_sparse(m, k).toarray(), wta_dense(m.copy(), k, False))
+
+    def test_batch_matches_one_document_encoding(self, model):
+        rng = np.random.default_rng(2)
+        docs = random_docs(40, rng)
+        for top_words in (200, 10, 3):
+            batch = vectorize_scale_docs('xx', docs, 5, top_words)
+            assert batch.shape == (len(docs), 200)
+            for i, doc in enumerate(docs):
+                expected = reference_vectorize_scale(model, doc, 5, top_words)
+                assert np.allclose(batch[i].toarray(), expected)
+                assert np.allclose(vectorize_scale('xx', doc, 5, top_words), expected)